@@ -1,13 +1,23 @@
 from flask import Flask
 from flask_cors import CORS
 
+from catalog import catalog
 from config import Config
 from database import Database
+from log_pipeline import setup_request_ids
+from metrics import (
+    pool_families,
+    register_collector,
+    register_shared_collector,
+    setup_metrics,
+    upload_files_families,
+)
+from profiling import setup_profiling
 from routes import register_routes
 from utils import ensure_directories, setup_logging
 
 
-def create_app() -> Flask:
+def create_app(init_schema: bool = True) -> Flask:
     """
     Создаёт и настраивает экземпляр Flask-приложения.
 
@@ -18,9 +28,16 @@ def create_app() -> Flask:
     4. В контексте приложения выполняет:
        - Создание необходимых директорий (для логов, загрузок).
        - Инициализацию пула соединений с БД.
-       - Инициализацию схемы БД (создание таблиц).
+       - Инициализацию схемы БД (создание таблиц), если init_schema.
        - Настройку логирования.
-    5. Регистрирует все маршруты (endpoints).
+       - Запуск слушателя изменений каталога (для ETag списка изображений).
+    5. Подключает ID запросов для логов, сбор метрик запросов (/api/metrics) и профилирование
+       отдельных запросов (profiling.py).
+    6. Регистрирует все маршруты (endpoints).
+
+    Args:
+        init_schema: Обновлять ли схему БД. Под gunicorn схему один раз
+            обновляет мастер (gunicorn.conf.py), а воркеры только подключаются.
 
     Returns:
         Готовый к запуску экземпляр Flask-приложения.
@@ -36,10 +53,22 @@ def create_app() -> Flask:
         ensure_directories()
         print("Инициализация пула соединений с БД...")
         Database.init_pool()
-        print("Инициализация схемы БД...")
-        Database.init_db()
+        if init_schema:
+            print("Инициализация схемы БД...")
+            Database.init_db()
         print("Настройка логирования...")
         setup_logging()
+        if Config.CATALOG_LISTEN:
+            print("Подписка на изменения каталога...")
+            catalog.start()
+
+    setup_request_ids(app)
+    setup_metrics(app)
+    setup_profiling(app)
+    register_collector(lambda: pool_families("db_pool", Database.pool_stats()))
+    register_shared_collector(
+        lambda: upload_files_families(Database.count_stored_files())
+    )
 
     register_routes(app)
     print("Маршруты зарегистрированы.")
@@ -0,0 +1,9 @@
+"""
+Точка входа ASGI для асинхронного варианта сервера (см. async_app.py).
+
+Приложение создаётся при импорте модуля, то есть в каждом процессе uvicorn.
+"""
+
+from async_app import create_async_app
+
+app = create_async_app()
@@ -0,0 +1,543 @@
+"""
+Асинхронный (ASGI) вариант приложения.
+
+Загрузка (/api/upload), список изображений (/api/images) и /api/health
+обслуживаются нативно на asyncio: тело запроса разбирается потоково по мере
+поступления, блоки пишутся на диск в пуле потоков, метаданные сохраняются
+через асинхронный пул asyncpg. Медленный клиент занимает только корутину,
+а не поток или процесс. Число одновременно принимаемых загрузок ограничено
+Config.ASYNC_MAX_UPLOADS; сверх лимита тело запроса не читается, и клиент
+упирается в TCP-окно (обратное давление), пока не освободится слот.
+
+Остальные маршруты register_routes передаются Flask-приложению через
+WSGI-адаптер с пулом потоков, поэтому набор маршрутов совпадает с create_app.
+
+Запуск из каталога backend:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from flask import Flask
+from werkzeug.datastructures import FileStorage, Headers, MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_options_header, quote_etag
+from werkzeug.routing import Map, Rule
+from werkzeug.sansio.http import is_resource_modified
+from werkzeug.sansio.multipart import (
+    Data,
+    Epilogue,
+    Field,
+    File,
+    MultipartDecoder,
+    NeedData,
+)
+from werkzeug.utils import secure_filename
+
+from app import create_app
+from async_database import AsyncDatabase
+from cache import cache_stats
+from catalog import catalog, catalog_etag
+from config import Config
+from db_pool import PoolTimeoutError
+from log_pipeline import bind_request, reset_request
+from metrics import observe_request, observe_upload, pool_families, register_collector
+from models import Image
+from routes import upload_result, validate_upload
+from storage import get_storage
+from utils import (
+    TEMP_FILE_PREFIX,
+    FileTooLargeError,
+    content_addressed_filename,
+    decode_cursor,
+    delete_file,
+    encode_cursor,
+    format_file_size,
+    generate_unique_filename,
+    get_file_extension,
+    log_error,
+    log_success,
+)
+
+
+def too_large_error() -> Dict[str, str]:
+    """Возвращает тело ответа о превышении максимального размера файла."""
+    max_size = format_file_size(Config.MAX_CONTENT_LENGTH)
+    return {"error": f"Файл слишком большой. Максимальный размер файла {max_size}"}
+
+
+class UploadRejected(Exception):
+    """Загрузка отклонена до сохранения; содержит HTTP-статус ответа."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ClientDisconnected(Exception):
+    """Клиент закрыл соединение, не передав тело запроса целиком."""
+
+
+class TempUpload:
+    """
+    Временный файл загрузки в директории загрузок.
+
+    Методы блокирующие и вызываются через asyncio.to_thread; по пути
+    считаются размер и SHA-256 содержимого.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(
+            prefix=TEMP_FILE_PREFIX, dir=Config.UPLOAD_FOLDER
+        )
+        self._file = os.fdopen(fd, "wb")
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        """Дописывает блок данных."""
+        self._hasher.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def finish(self) -> str:
+        """Закрывает файл и возвращает SHA-256 содержимого."""
+        self._file.close()
+        # mkstemp создаёт файл с правами 0600, а его должен читать Nginx
+        os.chmod(self.path, 0o644)
+        return self._hasher.hexdigest()
+
+    def discard(self) -> None:
+        """Закрывает и удаляет временный файл."""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AsyncApp:
+    """
+    ASGI-приложение: нативные asyncio-маршруты и Flask для всех остальных.
+
+    Args:
+        flask_app: Flask-приложение из create_app, обслуживающее остальные маршруты.
+    """
+
+    def __init__(self, flask_app: Flask):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=Config.ASYNC_WSGI_WORKERS)
+        self.url_map = Map(
+            [
+                Rule("/api/health", methods=["GET"], endpoint="health"),
+                Rule("/api/upload", methods=["POST"], endpoint="upload"),
+                Rule("/api/images", methods=["GET"], endpoint="list_images"),
+            ]
+        )
+        self.upload_slots = asyncio.Semaphore(Config.ASYNC_MAX_UPLOADS)
+        self.active_uploads = 0
+        register_collector(self._collect_metrics)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        rule = None
+        if scope["type"] == "http" and scope["method"] != "HEAD":
+            try:
+                rule, _ = self.url_map.bind("").match(
+                    scope["path"], scope["method"], return_rule=True
+                )
+            except HTTPException:
+                rule = None
+
+        if rule is None:
+            await self.wsgi(scope, receive, send)
+            return
+
+        # Запросы, переданные во Flask, учитывают его хуки (метрики, ID запроса)
+        start = time.perf_counter()
+        status = 500
+        request_id, token = bind_request(
+            self._headers(scope).get(Config.REQUEST_ID_HEADER)
+        )
+        request_id_header = (
+            Config.REQUEST_ID_HEADER.lower().encode("latin-1"),
+            request_id.encode("latin-1"),
+        )
+
+        async def send_and_record(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), request_id_header],
+                }
+            await send(message)
+
+        try:
+            await getattr(self, rule.endpoint)(scope, receive, send_and_record)
+        finally:
+            observe_request(
+                scope["method"], rule.rule, status, time.perf_counter() - start
+            )
+            reset_request(token)
+
+    def _collect_metrics(self):
+        """Возвращает метрики асинхронного пула БД и загрузок."""
+        return pool_families("async_db_pool", AsyncDatabase.pool_stats()) + [
+            (
+                "async_active_uploads",
+                "gauge",
+                "Загрузки, принимаемые в данный момент",
+                [("async_active_uploads", (), self.active_uploads)],
+            )
+        ]
+
+    async def _lifespan(self, receive, send) -> None:
+        """Создаёт и закрывает асинхронный пул БД вместе с процессом сервера."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    asyncio.get_running_loop().set_default_executor(
+                        ThreadPoolExecutor(
+                            max_workers=Config.ASYNC_FILE_WORKERS,
+                            thread_name_prefix="async-file",
+                        )
+                    )
+                    await AsyncDatabase.init_pool()
+                except Exception as e:
+                    log_error("Ошибка запуска асинхронного приложения: %s", e)
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await AsyncDatabase.close_pool()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _send_json(
+        self,
+        send,
+        payload: Dict[str, Any],
+        status: int = 200,
+        headers: Optional[List[Tuple[bytes, bytes]]] = None,
+    ) -> None:
+        """Отправляет JSON-ответ в той же сериализации, что и jsonify во Flask."""
+        body = self.flask_app.json.dumps(payload).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    (b"access-control-allow-origin", b"*"),
+                    *(headers or []),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_empty(
+        self, send, status: int, headers: List[Tuple[bytes, bytes]]
+    ) -> None:
+        """Отправляет ответ без тела (например, 304)."""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"access-control-allow-origin", b"*"), *headers],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    def _headers(scope) -> Headers:
+        """Возвращает заголовки запроса из ASGI scope."""
+        return Headers(
+            [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+        )
+
+    async def _send_overloaded(self, send) -> None:
+        """Отвечает 503 с Retry-After, как обработчик PoolTimeoutError во Flask."""
+        await self._send_json(
+            send,
+            {"error": "Сервис перегружен, повторите запрос позже"},
+            503,
+            [(b"retry-after", b"1")],
+        )
+
+    async def health(self, scope, receive, send) -> None:
+        """Проверяет работоспособность сервиса и возвращает статистику пулов БД."""
+        await self._send_json(
+            send,
+            {
+                "ok": True,
+                "db_pool": AsyncDatabase.pool_stats(),
+                "active_uploads": self.active_uploads,
+                "cache": cache_stats(),
+            },
+        )
+
+    async def list_images(self, scope, receive, send) -> None:
+        """
+        Возвращает постраничный список изображений.
+
+        Параметры, формат ответа и условные заголовки (ETag по поколению
+        каталога, 304 без обращения к БД) совпадают с GET /api/images во Flask.
+        """
+        args = MultiDict(
+            parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        )
+        headers = self._headers(scope)
+        try:
+            state = await asyncio.to_thread(catalog.state)
+            validators: List[Tuple[bytes, bytes]] = []
+            if state is not None:
+                etag = catalog_etag(state[0])
+                validators = [
+                    (b"etag", quote_etag(etag).encode("latin-1")),
+                    (b"cache-control", b"no-cache"),
+                ]
+                if not is_resource_modified(
+                    http_if_none_match=headers.get("if-none-match"), etag=etag
+                ):
+                    await self._send_empty(send, 304, validators)
+                    return
+
+            per_page = int(args.get("per_page", str(Config.ITEM_PER_PAGE)))
+            per_page = min(
+                max(per_page, Config.MIN_ITEMS_PER_PAGE), Config.MAX_DISPLAY_ITEMS
+            )
+
+            total_mode = args.get("total", "exact")
+            if total_mode not in Config.TOTAL_MODES:
+                await self._send_json(
+                    send, {"error": "Неверное значение параметра total"}, 400
+                )
+                return
+
+            if "cursor" in args:
+                cursor = args.get("cursor", "")
+                after = decode_cursor(cursor) if cursor else None
+                page = None
+                images, has_more, total = await AsyncDatabase.get_images_after(
+                    after, per_page, total_mode
+                )
+            else:
+                page = max(1, int(args.get("page", "1")))
+                images, has_more, total = await AsyncDatabase.get_images(
+                    page, per_page, total_mode
+                )
+        except (ValueError, TypeError):
+            await self._send_json(send, {"error": "Неверные параметры пагинации"}, 400)
+            return
+        except PoolTimeoutError as e:
+            log_error("Пул соединений исчерпан: %s", e)
+            await self._send_overloaded(send)
+            return
+
+        next_cursor = None
+        if has_more and images:
+            last = images[-1]
+            next_cursor = encode_cursor(last.upload_time, last.id)
+        payload = {
+            "success": True,
+            "images": [img.to_dict() for img in images],
+            "total": total,
+            "per_page": per_page,
+            "next_cursor": next_cursor,
+        }
+        if page is not None:
+            payload["page"] = page
+        await self._send_json(send, payload, headers=validators)
+
+    async def upload(self, scope, receive, send) -> None:
+        """
+        Обрабатывает загрузку файла изображения (поле `file` multipart-формы).
+
+        Тело запроса читается по мере записи на диск; ответы совпадают
+        с POST /api/upload во Flask.
+        """
+        headers = self._headers(scope)
+        mimetype, options = parse_options_header(headers.get("content-type", ""))
+        boundary = options.get("boundary")
+        if mimetype != "multipart/form-data" or not boundary:
+            await self._send_json(send, {"error": "Файл не выбран"}, 400)
+            return
+
+        content_length = headers.get("content-length", type=int)
+        if content_length is not None and content_length > Config.MAX_CONTENT_LENGTH:
+            await self._send_json(send, too_large_error(), 400)
+            return
+
+        try:
+            await asyncio.wait_for(
+                self.upload_slots.acquire(), timeout=Config.ASYNC_UPLOAD_WAIT
+            )
+        except asyncio.TimeoutError:
+            await self._send_overloaded(send)
+            return
+
+        self.active_uploads += 1
+        try:
+            status, payload = await self._handle_upload(receive, boundary.encode())
+        except ClientDisconnected:
+            return
+        except PoolTimeoutError as e:
+            log_error("Пул соединений исчерпан: %s", e)
+            await self._send_overloaded(send)
+            return
+        except Exception as e:
+            log_error("Ошибка загрузки файла: %s", e, exc_info=True)
+            status = 500
+            payload = {"error": "Внутренняя ошибка сервера при загрузке файла"}
+        finally:
+            self.active_uploads -= 1
+            self.upload_slots.release()
+        await self._send_json(send, payload, status)
+
+    async def _handle_upload(
+        self, receive, boundary: bytes
+    ) -> Tuple[int, Dict[str, Any]]:
+        """
+        Принимает файл и сохраняет его метаданные.
+
+        Returns:
+            Кортеж (HTTP-статус, тело ответа).
+        """
+        try:
+            filename, temp = await self._receive_file(receive, boundary)
+        except UploadRejected as e:
+            return e.status, {"error": str(e)}
+        except FileTooLargeError:
+            return 400, too_large_error()
+
+        sha256 = await asyncio.to_thread(temp.finish)
+        original_name = secure_filename(filename)
+        image = Image(
+            original_name=original_name,
+            size=temp.size,
+            file_type=get_file_extension(filename).replace(".", ""),
+        )
+
+        if Config.CONTENT_ADDRESSED_STORAGE:
+            image.filename = content_addressed_filename(sha256, original_name)
+            success, _ = await AsyncDatabase.save_image_blob(image, sha256, temp.path)
+        else:
+            image.filename = generate_unique_filename(original_name)
+            try:
+                await asyncio.to_thread(get_storage().place, temp.path, image.filename)
+            except Exception as e:
+                await asyncio.to_thread(temp.discard)
+                log_error("Ошибка сохранения файла: %s", e)
+                return 500, {"error": f"Ошибка сохранения файла: {e}"}
+            try:
+                success, _ = await AsyncDatabase.save_image(image)
+            except PoolTimeoutError:
+                await asyncio.to_thread(delete_file, image.filename)
+                raise
+            if not success:
+                await asyncio.to_thread(delete_file, image.filename)
+
+        if not success:
+            return 500, {"error": "Ошибка сохранения метаданных в БД"}
+
+        catalog.mark_stale()
+        observe_upload(image.size)
+        log_success("Изображение сохранено: %s", image.filename)
+        return 201, {
+            "success": True,
+            "message": "Файл успешно сохранён",
+            "image": upload_result(image),
+        }
+
+    async def _receive_file(self, receive, boundary: bytes) -> Tuple[str, TempUpload]:
+        """
+        Потоково разбирает multipart-тело и пишет часть `file` во временный файл.
+
+        Следующий блок тела запрашивается у сервера только после записи
+        предыдущего, поэтому в памяти находится не больше одного блока.
+
+        Returns:
+            Кортеж (имя_файла_клиента, временный_файл).
+
+        Raises:
+            UploadRejected: Если файла нет, он не прошёл проверку или тело повреждено.
+            FileTooLargeError: Если тело запроса больше Config.MAX_CONTENT_LENGTH.
+            ClientDisconnected: Если клиент оборвал соединение.
+        """
+        decoder = MultipartDecoder(
+            boundary, max_form_memory_size=Config.MAX_CONTENT_LENGTH
+        )
+        received = 0
+        part = None
+        file_part = None
+        temp: Optional[TempUpload] = None
+        try:
+            while True:
+                try:
+                    event = decoder.next_event()
+                except ValueError as e:
+                    raise UploadRejected(400, "Неверный формат запроса") from e
+
+                if isinstance(event, NeedData):
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        raise ClientDisconnected()
+                    chunk = message.get("body", b"")
+                    received += len(chunk)
+                    if received > Config.MAX_CONTENT_LENGTH:
+                        raise FileTooLargeError("Тело запроса слишком большое")
+                    decoder.receive_data(chunk)
+                    if not message.get("more_body", False):
+                        decoder.receive_data(None)
+                elif isinstance(event, (Field, File)):
+                    part = event
+                    if isinstance(event, File) and event.name == "file" and not temp:
+                        error = validate_upload(
+                            FileStorage(
+                                filename=event.filename,
+                                name=event.name,
+                                headers=event.headers,
+                            )
+                        )
+                        if error:
+                            raise UploadRejected(400, error)
+                        file_part = event
+                        temp = await asyncio.to_thread(TempUpload)
+                elif isinstance(event, Data):
+                    if temp and part is file_part and event.data:
+                        await asyncio.to_thread(temp.write, event.data)
+                elif isinstance(event, Epilogue):
+                    break
+        except BaseException:
+            if temp:
+                await asyncio.to_thread(temp.discard)
+            raise
+
+        if not temp:
+            raise UploadRejected(400, "Файл не выбран")
+        return file_part.filename, temp
+
+
+def create_async_app() -> AsyncApp:
+    """
+    Создаёт ASGI-приложение поверх Flask-приложения из create_app.
+
+    Returns:
+        ASGI-приложение, готовое к запуску в uvicorn.
+    """
+    return AsyncApp(create_app())
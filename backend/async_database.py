@@ -0,0 +1,353 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from cache import invalidate_images
+from config import Config
+from database import BLOB_LOCK_ID, Database
+from db_pool import PoolTimeoutError
+from models import Image
+from storage import get_storage
+from utils import log_error, log_info, log_success
+
+
+class AsyncDatabase:
+    """
+    Асинхронный доступ к БД на asyncpg для ASGI-варианта приложения (async_app.py).
+
+    Повторяет запросы Database для маршрутов, которые обслуживаются нативно
+    на asyncio: загрузки и списка изображений. Схему БД создаёт Database.init_db.
+    """
+
+    _pool: Optional[asyncpg.Pool] = None
+
+    @staticmethod
+    async def init_pool(
+        min_conn: int = Config.DB_POOL_MIN_SIZE, max_conn: int = Config.DB_POOL_MAX_SIZE
+    ) -> None:
+        """
+        Создаёт асинхронный пул соединений.
+
+        Args:
+            min_conn: Минимальное количество соединений в пуле.
+            max_conn: Максимальное количество соединений в пуле.
+        """
+        AsyncDatabase._pool = await asyncpg.create_pool(
+            Config.DATABASE_URL, min_size=min_conn, max_size=max_conn
+        )
+        log_info("Асинхронный пул соединений с БД инициализирован")
+
+    @staticmethod
+    async def close_pool() -> None:
+        """Закрывает асинхронный пул соединений."""
+        if AsyncDatabase._pool:
+            await AsyncDatabase._pool.close()
+            AsyncDatabase._pool = None
+
+    @staticmethod
+    def pool_stats() -> Dict[str, Any]:
+        """Возвращает статистику асинхронного пула (пустой словарь до инициализации)."""
+        pool = AsyncDatabase._pool
+        if not pool:
+            return {}
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        return {
+            "size": size,
+            "max_size": pool.get_max_size(),
+            "in_use": size - idle,
+            "idle": idle,
+        }
+
+    @staticmethod
+    @asynccontextmanager
+    async def connection() -> AsyncIterator[asyncpg.Connection]:
+        """
+        Асинхронный контекстный менеджер: выдаёт соединение и возвращает его в пул.
+
+        Raises:
+            PoolTimeoutError: Если свободное соединение не появилось за
+                Config.DB_POOL_TIMEOUT.
+            Exception: Если пул не инициализирован.
+        """
+        pool = AsyncDatabase._pool
+        if not pool:
+            raise Exception("Пул соединений не инициализирован.")
+        try:
+            conn = await pool.acquire(timeout=Config.DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError as e:
+            raise PoolTimeoutError(
+                f"Нет свободных соединений с БД (ожидание {Config.DB_POOL_TIMEOUT} с)"
+            ) from e
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    @staticmethod
+    async def _enqueue_jobs(conn: asyncpg.Connection, image_ids: List[int]) -> None:
+        """Ставит в очередь задачи Config.UPLOAD_JOBS в текущей транзакции."""
+        if not Config.UPLOAD_JOBS or not image_ids:
+            return
+        await conn.execute(
+            """
+            INSERT INTO jobs (image_id, kind, max_attempts)
+            SELECT image_id, kind, $1
+            FROM unnest($2::integer[]) AS image_id
+            CROSS JOIN unnest($3::text[]) AS kind;
+            """,
+            Config.JOB_MAX_ATTEMPTS,
+            image_ids,
+            list(Config.UPLOAD_JOBS),
+        )
+
+    @staticmethod
+    async def save_image(image: Image) -> Tuple[bool, Optional[int]]:
+        """
+        Сохраняет метаданные изображения в базу данных.
+
+        Args:
+            image: Объект Image с данными для сохранения.
+
+        Returns:
+            Кортеж (True, image_id), если сохранение успешно.
+            Кортеж (False, None), если произошла ошибка.
+
+        Raises:
+            PoolTimeoutError: Если не удалось получить соединение вовремя.
+        """
+        job_status = Database._initial_job_status()
+        async with AsyncDatabase.connection() as conn:
+            try:
+                async with conn.transaction():
+                    image_id = await conn.fetchval(
+                        """
+                        INSERT INTO images
+                            (filename, original_name, size, file_type, job_status)
+                        VALUES ($1, $2, $3, $4, $5)
+                        RETURNING id;
+                        """,
+                        image.filename,
+                        image.original_name,
+                        image.size,
+                        image.file_type,
+                        job_status,
+                    )
+                    await AsyncDatabase._enqueue_jobs(conn, [image_id])
+            except Exception as e:
+                log_error("Ошибка сохранения в БД: %s", e)
+                return False, None
+
+        invalidate_images([image_id])
+        image.id = image_id
+        image.job_status = job_status
+        log_success("Изображение сохранено в БД: %s, ID: %s", image.filename, image_id)
+        return True, image_id
+
+    @staticmethod
+    async def save_image_blob(
+        image: Image, sha256: str, temp_path: str
+    ) -> Tuple[bool, Optional[int]]:
+        """
+        Сохраняет изображение в режиме контентно-адресуемого хранения.
+
+        Асинхронный аналог Database.save_image_blob: файловые операции
+        выполняются в пуле потоков под advisory-блокировкой содержимого
+        (та же, что в Database._lock_blobs), поэтому удаление файла
+        освободившегося blob-а с тем же SHA-256 (Database._delete_blob_files)
+        не может удалить только что размещённый файл.
+
+        Args:
+            image: Объект Image; поле filename заменяется на имя файла blob-а.
+            sha256: SHA-256 содержимого.
+            temp_path: Путь к временному файлу с содержимым.
+
+        Returns:
+            Кортеж (True, image_id), если сохранение успешно.
+            Кортеж (False, None), если произошла ошибка (временный файл удаляется).
+
+        Raises:
+            PoolTimeoutError: Если не удалось получить соединение вовремя
+                (временный файл удаляется).
+        """
+        job_status = Database._initial_job_status()
+        placed = False
+        try:
+            async with AsyncDatabase.connection() as conn:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    await conn.execute(
+                        "SELECT pg_advisory_xact_lock($1, hashtext($2))",
+                        BLOB_LOCK_ID,
+                        sha256,
+                    )
+                    blob = await conn.fetchrow(
+                        """
+                        INSERT INTO blobs (sha256, filename, size, refcount)
+                        VALUES ($1, $2, $3, 1)
+                        ON CONFLICT (sha256) DO UPDATE SET refcount = blobs.refcount + 1
+                        RETURNING filename, refcount;
+                        """,
+                        sha256,
+                        image.filename,
+                        image.size,
+                    )
+                    image.filename = blob["filename"]
+                    if blob["refcount"] == 1:
+                        await asyncio.to_thread(
+                            get_storage().place, temp_path, image.filename
+                        )
+                        placed = True
+                    else:
+                        await asyncio.to_thread(os.remove, temp_path)
+
+                    image_id = await conn.fetchval(
+                        """
+                        INSERT INTO images
+                            (filename, original_name, size, file_type, blob_sha256, job_status)
+                        VALUES ($1, $2, $3, $4, $5, $6)
+                        RETURNING id;
+                        """,
+                        image.filename,
+                        image.original_name,
+                        image.size,
+                        image.file_type,
+                        sha256,
+                        job_status,
+                    )
+                    await AsyncDatabase._enqueue_jobs(conn, [image_id])
+                    await transaction.commit()
+                except Exception as e:
+                    # Файл убираем до отката, пока блокировка содержимого ещё взята
+                    try:
+                        if placed:
+                            await asyncio.to_thread(
+                                get_storage().delete, image.filename
+                            )
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                    except Exception as cleanup_error:
+                        log_error(
+                            "Ошибка удаления файла %s: %s",
+                            image.filename,
+                            cleanup_error,
+                        )
+                    await transaction.rollback()
+                    log_error("Ошибка сохранения в БД: %s", e)
+                    return False, None
+        except PoolTimeoutError:
+            os.remove(temp_path)
+            raise
+
+        invalidate_images([image_id])
+        image.id = image_id
+        image.blob_sha256 = sha256
+        image.job_status = job_status
+        log_success("Изображение сохранено в БД: %s, ID: %s", image.filename, image_id)
+        return True, image_id
+
+    @staticmethod
+    async def _count_images(conn: asyncpg.Connection, total_mode: str) -> Optional[int]:
+        """Возвращает количество изображений выбранным способом (см. Database)."""
+        if total_mode == "none":
+            return None
+        if total_mode == "estimate":
+            total = await conn.fetchval(
+                """
+                SELECT GREATEST(reltuples, 0)::bigint
+                FROM pg_class WHERE oid = 'images'::regclass
+                """
+            )
+        else:
+            total = await conn.fetchval("SELECT total FROM images_stats")
+        return total or 0
+
+    @staticmethod
+    async def get_images(
+        page: int = 1, per_page: int = Config.ITEM_PER_PAGE, total_mode: str = "exact"
+    ) -> Tuple[List[Image], bool, Optional[int]]:
+        """
+        Получает постраничный список изображений из БД.
+
+        Args:
+            page: Номер страницы (начиная с 1).
+            per_page: Количество элементов на странице.
+            total_mode: Способ подсчёта общего количества ('exact', 'estimate', 'none').
+
+        Returns:
+            Кортеж из списка объектов Image, признака наличия следующей страницы
+            и общего количества записей (None, если подсчёт отключён). Признак
+            определяется по лишней записи, а не по общему количеству: оценка
+            планировщика может быть сильно меньше реального числа строк.
+        """
+        async with AsyncDatabase.connection() as conn:
+            try:
+                rows = await conn.fetch(
+                    """
+                    SELECT * FROM images
+                    ORDER BY upload_time DESC, id DESC
+                    LIMIT $1 OFFSET $2
+                    """,
+                    per_page + 1,
+                    (page - 1) * per_page,
+                )
+                total = await AsyncDatabase._count_images(conn, total_mode)
+            except Exception as e:
+                log_error("Ошибка получения списка изображений: %s", e)
+                return [], False, 0
+        images = [Image(**dict(row)) for row in rows[:per_page]]
+        return images, len(rows) > per_page, total
+
+    @staticmethod
+    async def get_images_after(
+        after: Optional[Tuple[datetime, int]] = None,
+        per_page: int = Config.ITEM_PER_PAGE,
+        total_mode: str = "none",
+    ) -> Tuple[List[Image], bool, Optional[int]]:
+        """
+        Получает страницу изображений методом keyset-пагинации.
+
+        Args:
+            after: Ключ (upload_time, id) последнего изображения предыдущей
+                страницы. None — первая страница.
+            per_page: Количество элементов на странице.
+            total_mode: Способ подсчёта общего количества ('exact', 'estimate', 'none').
+
+        Returns:
+            Кортеж из списка объектов Image, признака наличия следующей страницы
+            и общего количества записей (None, если подсчёт отключён).
+        """
+        async with AsyncDatabase.connection() as conn:
+            try:
+                if after is None:
+                    rows = await conn.fetch(
+                        """
+                        SELECT * FROM images
+                        ORDER BY upload_time DESC, id DESC
+                        LIMIT $1
+                        """,
+                        per_page + 1,
+                    )
+                else:
+                    rows = await conn.fetch(
+                        """
+                        SELECT * FROM images
+                        WHERE (upload_time, id) < ($1::timestamp, $2::integer)
+                        ORDER BY upload_time DESC, id DESC
+                        LIMIT $3
+                        """,
+                        after[0],
+                        after[1],
+                        per_page + 1,
+                    )
+                total = await AsyncDatabase._count_images(conn, total_mode)
+            except Exception as e:
+                log_error("Ошибка получения списка изображений: %s", e)
+                return [], False, 0
+        images = [Image(**dict(row)) for row in rows[:per_page]]
+        return images, len(rows) > per_page, total
@@ -1,89 +1,291 @@
 import argparse
 import datetime
+import hashlib
+import json
 import os
+import re
+import shutil
 import subprocess
-from typing import Dict, Tuple
-from urllib.parse import urlparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2
 
 from config import Config
-from utils import setup_logging, log_info, log_error
+from utils import (
+    TEMP_FILE_PREFIX,
+    format_file_size,
+    log_error,
+    log_info,
+    setup_logging,
+)
+
+BACKUP_PREFIX = "backup_"
+IMAGES_PREFIX = "images_"
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H%M%S"
+# Суффикс каталога, в который pg_dump ещё пишет; переименовывается по завершении
+PARTIAL_SUFFIX = ".partial"
+
+# Строки --verbose pg_dump/pg_restore о начале копирования данных таблицы
+_TABLE_PROGRESS_RE = re.compile(
+    r'^(?:pg_dump: dumping contents of|pg_restore: processing data for) table "([^"]+)"'
+)
+# Строки --verbose, которые стоит показать как ошибку, а не как прогресс
+_PROBLEM_RE = re.compile(r"(?:error|warning|fatal|detail|hint):", re.IGNORECASE)
 
 
 def _parse_db_url(db_url: str) -> Dict[str, str]:
-    """Парсит URL базы данных и возвращает компоненты."""
+    """
+    Парсит URL базы данных и возвращает компоненты.
+
+    Хост и порт берутся также из параметров запроса (`?host=/run/postgresql`),
+    как это делает libpq для подключения через unix-сокет.
+    """
     parsed_url = urlparse(db_url)
+    query = parse_qs(parsed_url.query)
     return {
         "user": parsed_url.username or "",
         "password": parsed_url.password or "",
-        "host": parsed_url.hostname or "",
-        "port": str(parsed_url.port or 5432),
+        "host": parsed_url.hostname or query.get("host", [""])[0],
+        "port": str(parsed_url.port or query.get("port", ["5432"])[0]),
         "db_name": parsed_url.path.lstrip("/"),
     }
 
 
-def create_backup() -> Tuple[bool, str]:
+def _connection_args(db_info: Dict[str, str]) -> List[str]:
+    """Возвращает аргументы подключения для pg_dump, pg_restore и psql."""
+    return [
+        "-h",
+        db_info["host"],
+        "-p",
+        db_info["port"],
+        "-U",
+        db_info["user"],
+        "-d",
+        db_info["db_name"],
+    ]
+
+
+def _path_size(path: str) -> int:
+    """Возвращает размер файла или суммарный размер файлов каталога бэкапа."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+def _run_with_progress(
+    cmd: List[str],
+    password: str,
+    label: str,
+    total: Optional[int] = None,
+    output_path: Optional[str] = None,
+) -> Tuple[int, str]:
+    """
+    Запускает утилиту PostgreSQL с --verbose и логирует прогресс по таблицам.
+
+    Вывод читается построчно по мере работы утилиты; каждая начатая таблица
+    логируется с номером (из total, если он известен), временем с начала
+    и, если передан output_path, текущим размером бэкапа.
+
+    Args:
+        cmd: Команда для запуска.
+        password: Пароль БД (передаётся через PGPASSWORD).
+        label: Название операции для логов.
+        total: Ожидаемое количество таблиц с данными или None.
+        output_path: Путь к создаваемому бэкапу или None.
+
+    Returns:
+        Кортеж (код_возврата, строки_с_ошибками_и_предупреждениями).
+    """
+    start = time.monotonic()
+    done = 0
+    problems = []
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        env={**os.environ, "PGPASSWORD": password},
+    )
+    for line in process.stderr:
+        line = line.rstrip()
+        match = _TABLE_PROGRESS_RE.search(line)
+        if match:
+            done += 1
+            size = ""
+            if output_path and os.path.exists(output_path):
+                size = f", {format_file_size(_path_size(output_path))}"
+            log_info(
+                "%s: таблица %s (%s%s), %.1f с%s",
+                label,
+                match.group(1),
+                done,
+                f"/{total}" if total else "",
+                time.monotonic() - start,
+                size,
+            )
+        elif _PROBLEM_RE.search(line):
+            problems.append(line)
+    return process.wait(), "\n".join(problems)
+
+
+def create_backup(
+    backup_format: str = Config.BACKUP_FORMAT,
+    jobs: int = Config.BACKUP_JOBS,
+    compression: str = Config.BACKUP_COMPRESSION,
+) -> Tuple[bool, str]:
     """
     Создает бэкап базы данных PostgreSQL с использованием утилиты pg_dump.
 
-    Формирует имя файла с временной меткой, сохраняет его в директорию
-    для бэкапов и логирует результат.
+    В формате 'directory' pg_dump пишет каталог со сжатым файлом на каждую
+    таблицу в jobs параллельных потоков; каталог создаётся под временным
+    именем и переименовывается только после успешного завершения. Формат
+    'plain' — один несжатый SQL-файл, как раньше. После успешного бэкапа
+    старые бэкапы удаляются по политике хранения (prune_backups).
+
+    Args:
+        backup_format: 'directory' или 'plain'.
+        jobs: Количество параллельных потоков pg_dump (только для 'directory').
+        compression: Уровень сжатия для -Z: '0'-'9' или 'метод:уровень'
+            (например 'zstd:3', если pg_dump собран с zstd).
 
     Returns:
-        Кортеж (True, имя_файла) в случае успеха.
+        Кортеж (True, имя_бэкапа) в случае успеха.
         Кортеж (False, сообщение_об_ошибке) в случае неудачи.
     """
     try:
         db_info = _parse_db_url(Config.DATABASE_URL)
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
-        backup_filename = f"backup_{timestamp}.sql"
-        backup_path = os.path.join(Config.BACKUP_DIR, backup_filename)
+        timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+
+        if backup_format == "directory":
+            backup_filename = f"{BACKUP_PREFIX}{timestamp}"
+            backup_path = os.path.join(Config.BACKUP_DIR, backup_filename)
+            output_path = backup_path + PARTIAL_SUFFIX
+            format_args = ["-Fd", "-j", str(max(jobs, 1)), "-Z", compression]
+        elif backup_format == "plain":
+            backup_filename = f"{BACKUP_PREFIX}{timestamp}.sql"
+            backup_path = os.path.join(Config.BACKUP_DIR, backup_filename)
+            output_path = backup_path
+            format_args = []
+        else:
+            return False, f"Неизвестный формат бэкапа: {backup_format}"
 
         pg_dump_cmd = [
             "pg_dump",
-            "-h",
-            db_info["host"],
-            "-p",
-            db_info["port"],
-            "-U",
-            db_info["user"],
-            "-d",
-            db_info["db_name"],
+            *_connection_args(db_info),
+            *format_args,
+            "--verbose",
             "-f",
-            backup_path,
+            output_path,
         ]
 
-        result = subprocess.run(
-            pg_dump_cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-            env={**os.environ, "PGPASSWORD": db_info["password"]},
+        start = time.monotonic()
+        returncode, problems = _run_with_progress(
+            pg_dump_cmd, db_info["password"], "Бэкап", output_path=output_path
         )
 
-        if result.returncode == 0:
-            file_size = os.path.getsize(backup_path)
-            size_mb = file_size / (1024 * 1024)
+        if returncode == 0:
+            if output_path != backup_path:
+                os.rename(output_path, backup_path)
             log_info(
-                f"Бэкап успешно создан: {backup_filename}, размер: {size_mb:.2f} MB"
+                "Бэкап успешно создан: %s, размер: %s, за %.1f с",
+                backup_filename,
+                format_file_size(_path_size(backup_path)),
+                time.monotonic() - start,
             )
+            prune_backups()
             return True, backup_filename
         else:
-            log_error(f"Ошибка создания бэкапа: {result.stderr}")
-            return False, result.stderr
+            _remove_backup(output_path)
+            log_error("Ошибка создания бэкапа: %s", problems)
+            return False, problems
 
     except Exception as e:
-        log_error(f"Критическая ошибка при создании бэкапа: {e}", exc_info=True)
+        log_error("Критическая ошибка при создании бэкапа: %s", e, exc_info=True)
         return False, str(e)
 
 
-def restore_backup(backup_file: str) -> Tuple[bool, str]:
+def _count_table_data(backup_path: str) -> Optional[int]:
+    """Возвращает количество таблиц с данными в оглавлении бэкапа (pg_restore -l)."""
+    result = subprocess.run(
+        ["pg_restore", "-l", backup_path],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        return None
+    return sum(1 for line in result.stdout.splitlines() if " TABLE DATA " in line)
+
+
+def _catalog_generation() -> int:
+    """Возвращает поколение каталога (images_stats) или 0, если его ещё нет."""
+    try:
+        conn = psycopg2.connect(Config.DATABASE_URL)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT generation FROM images_stats")
+                row = cursor.fetchone()
+        finally:
+            conn.close()
+    except psycopg2.Error:
+        return 0
+    return row[0] if row else 0
+
+
+def _advance_catalog(previous: int) -> None:
+    """
+    Продвигает поколение каталога за значение до восстановления.
+
+    pg_restore возвращает images_stats к состоянию на момент бэкапа, а
+    триггеры создаёт после загрузки данных, поэтому уведомлений нет.
+    Процессы, запомнившие более новое поколение, отвечали бы 304 по старому
+    ETag и отбрасывали бы все следующие уведомления (catalog.observe), пока
+    поколение не догонит прежнее. Уведомление с '*' сбрасывает их кэши.
+
+    Args:
+        previous: Поколение каталога до восстановления.
+    """
+    conn = psycopg2.connect(Config.DATABASE_URL)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE images_stats
+                SET generation = GREATEST(generation, %s) + 1, changed_at = now()
+                RETURNING generation || ':' || extract(epoch FROM changed_at) || ':*';
+                """,
+                (previous,),
+            )
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(
+                    "SELECT pg_notify(%s, %s);", (Config.CATALOG_CHANNEL, row[0])
+                )
+    finally:
+        conn.close()
+
+
+def restore_backup(
+    backup_file: str, jobs: int = Config.BACKUP_JOBS
+) -> Tuple[bool, str]:
     """
     Восстанавливает базу данных из указанного файла бэкапа.
 
-    Использует утилиту psql для восстановления.
+    Бэкап в формате 'directory' (каталог) восстанавливается через pg_restore
+    в jobs параллельных потоков: данные таблиц загружаются и индексы строятся
+    одновременно. Существующие объекты предварительно удаляются (--clean).
+    SQL-файл формата 'plain' выполняется через psql, как раньше. После
+    восстановления поколение каталога продвигается вперёд (_advance_catalog),
+    чтобы работающие процессы сбросили кэши и ETag списка.
 
     Args:
-        backup_file: Имя файла бэкапа в директории Config.BACKUP_DIR.
+        backup_file: Имя файла или каталога бэкапа в директории Config.BACKUP_DIR.
+        jobs: Количество параллельных потоков pg_restore.
 
     Returns:
         Кортеж (True, сообщение) в случае успеха.
@@ -94,40 +296,553 @@ def restore_backup(backup_file: str) -> Tuple[bool, str]:
         backup_path = os.path.join(Config.BACKUP_DIR, backup_file)
 
         if not os.path.exists(backup_path):
-            log_error(f"Файл бэкапа не найден: {backup_path}")
+            log_error("Файл бэкапа не найден: %s", backup_path)
             return False, "Файл не найден"
 
-        psql_cmd = [
-            "psql",
-            "-h",
-            db_info["host"],
-            "-p",
-            db_info["port"],
-            "-U",
-            db_info["user"],
-            "-d",
-            db_info["db_name"],
-            "-f",
-            backup_path,
-        ]
-
-        result = subprocess.run(
-            psql_cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-            env={**os.environ, "PGPASSWORD": db_info["password"]},
-        )
+        generation = _catalog_generation()
+        start = time.monotonic()
+        if os.path.isdir(backup_path):
+            restore_cmd = [
+                "pg_restore",
+                *_connection_args(db_info),
+                "-Fd",
+                "-j",
+                str(max(jobs, 1)),
+                "--clean",
+                "--if-exists",
+                "--verbose",
+                backup_path,
+            ]
+            returncode, problems = _run_with_progress(
+                restore_cmd,
+                db_info["password"],
+                "Восстановление",
+                total=_count_table_data(backup_path),
+            )
+        else:
+            psql_cmd = ["psql", *_connection_args(db_info), "-f", backup_path]
+            result = subprocess.run(
+                psql_cmd,
+                capture_output=True,
+                text=True,
+                check=False,
+                env={**os.environ, "PGPASSWORD": db_info["password"]},
+            )
+            returncode, problems = result.returncode, result.stderr
 
-        if result.returncode == 0:
-            log_info(f"БД успешно восстановлена из: {backup_file}")
+        if returncode == 0:
+            _advance_catalog(generation)
+            log_info(
+                "БД успешно восстановлена из: %s за %.1f с",
+                backup_file,
+                time.monotonic() - start,
+            )
             return True, "Восстановление завершено"
         else:
-            log_error(f"Ошибка восстановления: {result.stderr}")
-            return False, result.stderr
+            log_error("Ошибка восстановления: %s", problems)
+            return False, problems
 
     except Exception as e:
-        log_error(f"Ошибка при восстановлении: {e}", exc_info=True)
+        log_error("Ошибка при восстановлении: %s", e, exc_info=True)
+        return False, str(e)
+
+
+def _remove_backup(path: str) -> None:
+    """Удаляет файл или каталог бэкапа, если он существует."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _backup_time(name: str, prefix: str = BACKUP_PREFIX) -> Optional[datetime.datetime]:
+    """Возвращает время создания бэкапа по его имени или None для чужих файлов."""
+    if not name.startswith(prefix):
+        return None
+    stamp = name[len(prefix) :].split(".", 1)[0]
+    try:
+        return datetime.datetime.strptime(stamp, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def list_backups(
+    partial: bool = False, prefix: str = BACKUP_PREFIX
+) -> List[Tuple[str, datetime.datetime]]:
+    """
+    Возвращает бэкапы из Config.BACKUP_DIR, от старых к новым.
+
+    Args:
+        partial: Вернуть незавершённые бэкапы (*.partial) вместо завершённых.
+        prefix: Префикс имён: BACKUP_PREFIX для БД, IMAGES_PREFIX для снимков файлов.
+
+    Returns:
+        Список кортежей (имя, время_создания_по_имени).
+    """
+    backups = []
+    for name in os.listdir(Config.BACKUP_DIR):
+        created = _backup_time(name, prefix)
+        if created is not None and name.endswith(PARTIAL_SUFFIX) == partial:
+            backups.append((name, created))
+    return sorted(backups, key=lambda backup: backup[1])
+
+
+def prune_backups(
+    keep: int = Config.BACKUP_KEEP,
+    max_age_days: int = Config.BACKUP_MAX_AGE_DAYS,
+    prefix: str = BACKUP_PREFIX,
+) -> List[str]:
+    """
+    Удаляет старые бэкапы из Config.BACKUP_DIR по политике хранения.
+
+    Остаются не больше keep последних бэкапов, и удаляются бэкапы старше
+    max_age_days дней. Самый новый бэкап не удаляется никогда. Незавершённые
+    бэкапы, начатые раньше самого нового завершённого, считаются брошенными
+    (процесс pg_dump был прерван) и тоже удаляются.
+
+    Args:
+        keep: Сколько последних бэкапов хранить (0 — без ограничения).
+        max_age_days: Максимальный возраст бэкапа в днях (0 — без ограничения).
+        prefix: Префикс имён (см. list_backups).
+
+    Returns:
+        Имена удалённых бэкапов.
+    """
+    backups = list_backups(prefix=prefix)
+    if not backups:
+        return []
+    newest = backups.pop()
+    if keep > 0:
+        expired = backups[: max(len(backups) - (keep - 1), 0)]
+    else:
+        expired = []
+    if max_age_days > 0:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=max_age_days)
+        expired += [backup for backup in backups[len(expired) :] if backup[1] < cutoff]
+    expired += [
+        backup
+        for backup in list_backups(partial=True, prefix=prefix)
+        if backup[1] < newest[1]
+    ]
+
+    removed = []
+    for name, _ in expired:
+        try:
+            _remove_backup(os.path.join(Config.BACKUP_DIR, name))
+        except OSError as e:
+            log_error("Ошибка удаления старого бэкапа %s: %s", name, e)
+            continue
+        removed.append(name)
+    if removed:
+        log_info("Удалены старые бэкапы: %s", ", ".join(removed))
+    return removed
+
+
+# Файлы снимка изображений: описание и манифест (JSON Lines, строка на файл)
+SNAPSHOT_INFO = "snapshot.json"
+SNAPSHOT_MANIFEST = "manifest.jsonl"
+SNAPSHOT_FILES = "files"
+_COPY_BUFFER = 1024 * 1024
+_COPY_BATCH = 1000  # Файлов, отправляемых в пул копирования за раз
+_PROGRESS_INTERVAL = 10  # Секунд между записями о ходе снимка в лог
+
+
+def _scan_images() -> Iterator[Tuple[str, int, int]]:
+    """
+    Обходит Config.UPLOAD_FOLDER и возвращает файлы изображений.
+
+    Временные файлы незавершённых загрузок пропускаются.
+
+    Yields:
+        Кортежи (путь_относительно_UPLOAD_FOLDER, размер, mtime_ns).
+    """
+    stack = [""]
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(Config.UPLOAD_FOLDER, relative_dir)) as it:
+                for entry in it:
+                    if entry.name.startswith(TEMP_FILE_PREFIX):
+                        continue
+                    relpath = os.path.join(relative_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(relpath)
+                    elif entry.is_file(follow_symlinks=False):
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except FileNotFoundError:
+                            continue
+                        yield relpath, st.st_size, st.st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+
+def _copy_with_hash(source: str, target: str) -> str:
+    """
+    Копирует файл (с сохранением mtime), одновременно считая его SHA-256.
+
+    Копия пишется во временный файл рядом с целевым и атомарно
+    переименовывается, поэтому по целевому пути не бывает частичного файла.
+
+    Returns:
+        SHA-256 скопированного содержимого.
+    """
+    target_dir = os.path.dirname(target)
+    os.makedirs(target_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_FILE_PREFIX, dir=target_dir)
+    hasher = hashlib.sha256()
+    try:
+        with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            while chunk := src.read(_COPY_BUFFER):
+                hasher.update(chunk)
+                dst.write(chunk)
+        shutil.copystat(source, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return hasher.hexdigest()
+
+
+def _load_manifest(snapshot_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Читает манифест снимка: {имя_файла: {path, size, mtime_ns, sha256}}."""
+    manifest = {}
+    with open(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST), encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            manifest[os.path.basename(entry["path"])] = entry
+    return manifest
+
+
+def _load_snapshot_info(snapshot_dir: str) -> Dict[str, Any]:
+    """Читает описание снимка (snapshot.json)."""
+    with open(os.path.join(snapshot_dir, SNAPSHOT_INFO), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _SnapshotBuilder:
+    """
+    Заполняет каталог снимка изображений.
+
+    Неизменившиеся с предыдущего снимка файлы (то же имя, размер и mtime)
+    становятся жёсткими ссылками на его копии и не перечитываются; новые
+    и изменившиеся копируются с подсчётом SHA-256 в пуле потоков. Файлы
+    сравниваются по имени, а не по пути, поэтому перенос в шардированную
+    раскладку (migrate_storage.py) не требует повторного копирования.
+    """
+
+    def __init__(self, snapshot_dir: str, workers: int):
+        self.snapshot_dir = snapshot_dir
+        self.files_dir = os.path.join(snapshot_dir, SNAPSHOT_FILES)
+        self.workers = max(workers, 1)
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self.previous: Dict[str, Dict[str, Any]] = {}
+        self.previous_dir: Optional[str] = None
+        self.stats = {"linked": 0, "copied": 0, "copied_bytes": 0, "failed": 0}
+
+        snapshots = list_backups(prefix=IMAGES_PREFIX)
+        if snapshots:
+            self.previous_dir = os.path.join(Config.BACKUP_DIR, snapshots[-1][0])
+            self.previous = _load_manifest(self.previous_dir)
+
+    def _link(self, relpath: str, previous: Dict[str, Any]) -> bool:
+        """Создаёт жёсткую ссылку на копию файла из предыдущего снимка."""
+        source = os.path.join(self.previous_dir, SNAPSHOT_FILES, previous["path"])
+        target = os.path.join(self.files_dir, relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            os.remove(target)
+            os.link(source, target)
+        except OSError:
+            # Другая файловая система или предел числа ссылок на inode
+            return False
+        return True
+
+    def _copy(self, item: Tuple[str, int, int]) -> Tuple[bool, Optional[dict]]:
+        """
+        Копирует файл в снимок.
+
+        Returns:
+            Кортеж (успех, запись_манифеста); запись None, если файл удалили
+            во время снимка.
+        """
+        relpath, size, mtime_ns = item
+        try:
+            sha256 = _copy_with_hash(
+                os.path.join(Config.UPLOAD_FOLDER, relpath),
+                os.path.join(self.files_dir, relpath),
+            )
+        except FileNotFoundError:
+            return True, None
+        except OSError as e:
+            log_error("Ошибка копирования %s в снимок: %s", relpath, e)
+            return False, None
+        entry = {"path": relpath, "size": size, "mtime_ns": mtime_ns, "sha256": sha256}
+        return True, entry
+
+    def _copy_batch(self, executor: ThreadPoolExecutor, batch: List[tuple]) -> None:
+        """Копирует пачку файлов в пуле и добавляет их в манифест."""
+        for success, entry in executor.map(self._copy, batch):
+            if not success:
+                self.stats["failed"] += 1
+            elif entry is not None:
+                self.manifest[os.path.basename(entry["path"])] = entry
+                self.stats["copied"] += 1
+                self.stats["copied_bytes"] += entry["size"]
+
+    def sync(self) -> None:
+        """
+        Добавляет в снимок файлы, которых в нём ещё нет или которые изменились.
+
+        Повторный вызов дописывает только появившиеся после предыдущего вызова
+        файлы, поэтому снимок можно «догнать» после дампа БД.
+        """
+        start = time.monotonic()
+        last_report = start
+        scanned = 0
+        batch: List[Tuple[str, int, int]] = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for relpath, size, mtime_ns in _scan_images():
+                scanned += 1
+                name = os.path.basename(relpath)
+                current = self.manifest.get(name)
+                if (
+                    current
+                    and current["size"] == size
+                    and current["mtime_ns"] == mtime_ns
+                ):
+                    continue
+
+                previous = self.previous.get(name)
+                if (
+                    previous
+                    and previous["size"] == size
+                    and previous["mtime_ns"] == mtime_ns
+                    and self._link(relpath, previous)
+                ):
+                    self.manifest[name] = {**previous, "path": relpath}
+                    self.stats["linked"] += 1
+                else:
+                    batch.append((relpath, size, mtime_ns))
+                    if len(batch) >= _COPY_BATCH:
+                        self._copy_batch(executor, batch)
+                        batch = []
+
+                if time.monotonic() - last_report >= _PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    log_info(
+                        "Снимок изображений: просмотрено %s, ссылок %s, "
+                        "скопировано %s (%s), %.0f с",
+                        scanned,
+                        self.stats["linked"],
+                        self.stats["copied"],
+                        format_file_size(self.stats["copied_bytes"]),
+                        last_report - start,
+                    )
+            if batch:
+                self._copy_batch(executor, batch)
+
+    def write(self, info: Dict[str, Any]) -> None:
+        """Записывает манифест и описание снимка."""
+        with open(
+            os.path.join(self.snapshot_dir, SNAPSHOT_MANIFEST), "w", encoding="utf-8"
+        ) as f:
+            for name in sorted(self.manifest):
+                f.write(json.dumps(self.manifest[name], ensure_ascii=False) + "\n")
+        info = {
+            **info,
+            "files": len(self.manifest),
+            "bytes": sum(entry["size"] for entry in self.manifest.values()),
+            **self.stats,
+        }
+        with open(
+            os.path.join(self.snapshot_dir, SNAPSHOT_INFO), "w", encoding="utf-8"
+        ) as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+
+
+def create_images_backup(
+    with_db: bool = False, workers: int = Config.IMAGE_BACKUP_WORKERS
+) -> Tuple[bool, str]:
+    """
+    Создаёт инкрементальный снимок директории загрузок в Config.BACKUP_DIR.
+
+    Снимок — каталог images_<время> с копией файлов (в той же раскладке,
+    что и в Config.UPLOAD_FOLDER) и манифестом: путь, размер, mtime и SHA-256
+    каждого файла. Файлы, не изменившиеся с предыдущего снимка, — жёсткие
+    ссылки на него и места не занимают.
+
+    С with_db снимок согласуется с дампом БД: сначала снимаются файлы, затем
+    создаётся дамп (create_backup), затем в снимок дописываются файлы,
+    загруженные за время дампа. Файл кладётся на диск до фиксации записи
+    в БД, поэтому каждый файл, на который ссылается дамп, есть в снимке
+    (кроме удалённых в те же секунды). Имя дампа сохраняется в описании
+    снимка, по нему снимок находит restore_images.
+
+    Args:
+        with_db: Создать также дамп БД и связать его со снимком.
+        workers: Потоков копирования и хеширования.
+
+    Returns:
+        Кортеж (True, имя_снимка) в случае успеха.
+        Кортеж (False, сообщение_об_ошибке) в случае неудачи.
+    """
+    if Config.STORAGE_BACKEND != "local":
+        return False, "Снимки файлов поддерживаются только для локального хранилища"
+    try:
+        started = datetime.datetime.now()
+        snapshot_name = f"{IMAGES_PREFIX}{started.strftime(TIMESTAMP_FORMAT)}"
+        snapshot_path = os.path.join(Config.BACKUP_DIR, snapshot_name)
+        partial_path = snapshot_path + PARTIAL_SUFFIX
+        os.makedirs(os.path.join(partial_path, SNAPSHOT_FILES))
+
+        builder = _SnapshotBuilder(partial_path, workers)
+        builder.sync()
+
+        db_backup = None
+        if with_db:
+            success, result = create_backup()
+            if not success:
+                shutil.rmtree(partial_path, ignore_errors=True)
+                return False, result
+            db_backup = result
+            builder.sync()
+
+        if builder.stats["failed"]:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            message = f"Не удалось скопировать файлов: {builder.stats['failed']}"
+            log_error("Ошибка создания снимка изображений: %s", message)
+            return False, message
+
+        builder.write(
+            {
+                "created": started.isoformat(timespec="seconds"),
+                "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+                "db_backup": db_backup,
+                "previous": (
+                    os.path.basename(builder.previous_dir)
+                    if builder.previous_dir
+                    else None
+                ),
+            }
+        )
+        os.rename(partial_path, snapshot_path)
+        log_info(
+            "Снимок изображений создан: %s, файлов %s, ссылок %s, скопировано %s (%s)"
+            ", за %.1f с",
+            snapshot_name,
+            len(builder.manifest),
+            builder.stats["linked"],
+            builder.stats["copied"],
+            format_file_size(builder.stats["copied_bytes"]),
+            (datetime.datetime.now() - started).total_seconds(),
+        )
+        prune_backups(prefix=IMAGES_PREFIX)
+        return True, snapshot_name
+
+    except Exception as e:
+        log_error("Ошибка создания снимка изображений: %s", e, exc_info=True)
+        return False, str(e)
+
+
+def find_images_snapshot(name: str) -> Optional[str]:
+    """
+    Находит снимок изображений по его имени или по имени дампа БД.
+
+    Для дампа БД возвращается снимок, созданный вместе с ним (with_db),
+    а если такого нет — первый снимок, завершённый после дампа: в нём есть
+    все файлы, на которые ссылается дамп, кроме удалённых в промежутке.
+
+    Args:
+        name: Имя снимка (images_<время>) или дампа БД (backup_<время>[.sql]).
+
+    Returns:
+        Имя снимка или None.
+    """
+    snapshots = list_backups(prefix=IMAGES_PREFIX)
+    if name.startswith(IMAGES_PREFIX):
+        return name if name in dict(snapshots) else None
+
+    dumped_at = _backup_time(name)
+    if dumped_at is None:
+        return None
+    for snapshot_name, created in snapshots:
+        info = _load_snapshot_info(os.path.join(Config.BACKUP_DIR, snapshot_name))
+        if info.get("db_backup") == name:
+            return snapshot_name
+    for snapshot_name, created in snapshots:
+        if created >= dumped_at:
+            return snapshot_name
+    return None
+
+
+def restore_images(
+    name: str, workers: int = Config.IMAGE_BACKUP_WORKERS
+) -> Tuple[bool, str]:
+    """
+    Восстанавливает файлы изображений из снимка в Config.UPLOAD_FOLDER.
+
+    Копируются только отсутствующие файлы и файлы другого размера; каждая
+    копия проверяется по SHA-256 из манифеста. Файлы, которых нет в снимке,
+    не удаляются (найти их поможет сверка файлов с БД).
+
+    Args:
+        name: Имя снимка или дампа БД, с которым нужно согласовать файлы
+            (см. find_images_snapshot).
+        workers: Потоков копирования.
+
+    Returns:
+        Кортеж (True, сообщение) в случае успеха.
+        Кортеж (False, сообщение_об_ошибке) в случае неудачи.
+    """
+    try:
+        snapshot_name = find_images_snapshot(name)
+        if snapshot_name is None:
+            log_error("Снимок изображений для %s не найден", name)
+            return False, "Снимок не найден"
+        snapshot_dir = os.path.join(Config.BACKUP_DIR, snapshot_name)
+        manifest = _load_manifest(snapshot_dir)
+
+        def restore_one(entry: Dict[str, Any]) -> str:
+            target = os.path.join(Config.UPLOAD_FOLDER, entry["path"])
+            try:
+                if os.path.getsize(target) == entry["size"]:
+                    return "skipped"
+            except FileNotFoundError:
+                pass
+            source = os.path.join(snapshot_dir, SNAPSHOT_FILES, entry["path"])
+            try:
+                sha256 = _copy_with_hash(source, target)
+            except OSError as e:
+                log_error("Ошибка восстановления %s: %s", entry["path"], e)
+                return "failed"
+            if sha256 != entry["sha256"]:
+                os.remove(target)
+                log_error("Копия %s в снимке повреждена", entry["path"])
+                return "failed"
+            return "restored"
+
+        start = time.monotonic()
+        counts = {"restored": 0, "skipped": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for result in executor.map(restore_one, manifest.values()):
+                counts[result] += 1
+
+        message = (
+            f"Снимок {snapshot_name}: восстановлено {counts['restored']}, "
+            f"уже на месте {counts['skipped']}, ошибок {counts['failed']}"
+        )
+        if counts["failed"]:
+            log_error("Ошибка восстановления файлов: %s", message)
+            return False, message
+        log_info("%s, за %.1f с", message, time.monotonic() - start)
+        return True, message
+
+    except Exception as e:
+        log_error("Ошибка восстановления файлов: %s", e, exc_info=True)
         return False, str(e)
 
 
@@ -140,24 +855,112 @@ if __name__ == "__main__":
 
     subparsers = parser.add_subparsers(dest="command", help="Доступные команды")
 
+    create_parser = subparsers.add_parser(
+        "create", help="Создать бэкап (команда по умолчанию)."
+    )
+    create_parser.add_argument(
+        "--format",
+        choices=("directory", "plain"),
+        default=Config.BACKUP_FORMAT,
+        help="Формат бэкапа.",
+    )
+    create_parser.add_argument(
+        "-j", "--jobs", type=int, default=Config.BACKUP_JOBS, help="Потоков pg_dump."
+    )
+    create_parser.add_argument(
+        "-Z",
+        "--compression",
+        default=Config.BACKUP_COMPRESSION,
+        help="Уровень сжатия ('0'-'9' или 'метод:уровень').",
+    )
+
     restore_parser = subparsers.add_parser(
         "restore", help="Восстановить базу данных из файла бэкапа."
     )
     restore_parser.add_argument(
         "backup_file", type=str, help="Имя файла бэкапа для восстановления."
     )
+    restore_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=Config.BACKUP_JOBS,
+        help="Потоков pg_restore.",
+    )
+
+    restore_parser.add_argument(
+        "--with-images",
+        action="store_true",
+        help="Восстановить также файлы из снимка, связанного с этим дампом.",
+    )
+
+    images_parser = subparsers.add_parser(
+        "images", help="Инкрементальный снимок файлов изображений."
+    )
+    images_parser.add_argument(
+        "action", nargs="?", choices=("create", "restore"), default="create"
+    )
+    images_parser.add_argument(
+        "name",
+        nargs="?",
+        help="Для restore: имя снимка или дампа БД, с которым согласовать файлы.",
+    )
+    images_parser.add_argument(
+        "--with-db",
+        action="store_true",
+        help="Создать вместе со снимком дамп БД и связать их.",
+    )
+    images_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=Config.IMAGE_BACKUP_WORKERS,
+        help="Потоков копирования и хеширования.",
+    )
+
+    prune_parser = subparsers.add_parser(
+        "prune", help="Удалить старые бэкапы по политике хранения."
+    )
+    prune_parser.add_argument("--keep", type=int, default=Config.BACKUP_KEEP)
+    prune_parser.add_argument(
+        "--max-age-days", type=int, default=Config.BACKUP_MAX_AGE_DAYS
+    )
 
     args = parser.parse_args()
 
     if args.command == "restore":
-        success, res_msg = restore_backup(args.backup_file)
+        success, res_msg = restore_backup(args.backup_file, args.jobs)
+        if success and args.with_images:
+            success, res_msg = restore_images(args.backup_file)
         if success:
             print(f"Восстановление успешно завершено: {res_msg}")
         else:
             print(f"Ошибка восстановления: {res_msg}")
+    elif args.command == "images" and args.action == "restore":
+        if not args.name:
+            parser.error("images restore: укажите имя снимка или дампа БД")
+        success, res_msg = restore_images(args.name, args.workers)
+        if success:
+            print(f"Файлы восстановлены: {res_msg}")
+        else:
+            print(f"Ошибка восстановления файлов: {res_msg}")
+    elif args.command == "images":
+        print("Создание снимка изображений...")
+        success, res_msg = create_images_backup(args.with_db, args.workers)
+        if success:
+            print(f"Снимок изображений создан: {res_msg}")
+        else:
+            print(f"Ошибка создания снимка: {res_msg}")
+    elif args.command == "prune":
+        removed = prune_backups(args.keep, args.max_age_days)
+        removed += prune_backups(args.keep, args.max_age_days, prefix=IMAGES_PREFIX)
+        print(f"Удалено бэкапов: {len(removed)}")
     else:
         print("Создание нового бэкапа...")
-        success, res_msg = create_backup()
+        if args.command == "create":
+            success, res_msg = create_backup(args.format, args.jobs, args.compression)
+        else:
+            success, res_msg = create_backup()
         if success:
             print(f"Бэкап успешно создан: {res_msg}")
         else:
@@ -0,0 +1,166 @@
+"""
+Бенчмарк бэкапа БД: plain SQL + psql против pg_dump -Fd / pg_restore -j.
+
+Наполняет таблицы images и jobs синтетическими строками (если их меньше
+нужного), затем для каждого режима создаёт бэкап через backup.create_backup
+и восстанавливает его через backup.restore_backup в отдельную пустую БД.
+Выводятся время дампа, время восстановления и размер бэкапа.
+
+По умолчанию используется DATABASE_URL (восстановление идёт в соседнюю БД
+<имя>_bench_restore, которая пересоздаётся); --disposable-db поднимает
+временный экземпляр Postgres (см. bench.suite). Нужны pg_dump, pg_restore
+и psql в PATH.
+
+Запуск из каталога backend:
+    python -m bench.backup --rows 1000000 --jobs 1 4 --compression 0 1 6
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import List, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import psycopg2
+
+from bench.pagination import seed_images
+from bench.suite import disposable_postgres
+from config import Config
+
+
+def _seed_jobs() -> None:
+    """Добавляет каждой записи images выполненную задачу, если их ещё нет."""
+    from database import Database
+
+    with Database.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO jobs (image_id, kind, status, attempts)
+                SELECT id, 'thumbnails', 'done', 1 FROM images
+                WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.image_id = images.id)
+                """
+            )
+        conn.commit()
+
+
+def _with_database(url: str, db_name: str) -> str:
+    """Возвращает тот же URL с другим именем БД."""
+    return urlunparse(urlparse(url)._replace(path=f"/{db_name}"))
+
+
+def _recreate_database(url: str, db_name: str) -> None:
+    """Удаляет и заново создаёт пустую БД db_name на том же сервере."""
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{db_name}"')
+            cursor.execute(
+                f"CREATE DATABASE \"{db_name}\" TEMPLATE template0 ENCODING 'UTF8'"
+            )
+    finally:
+        conn.close()
+
+
+def _size_mb(path: str) -> float:
+    """Возвращает размер файла или каталога бэкапа в мегабайтах."""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def _modes(jobs: List[int], levels: List[str]) -> List[Tuple[str, int, str]]:
+    """Возвращает режимы (формат, потоков, сжатие): plain и все сочетания -Fd."""
+    modes = [("plain", 1, "0")]
+    for level in levels:
+        for count in jobs:
+            modes.append(("directory", count, level))
+    return modes
+
+
+def run(database_url: str, args: argparse.Namespace) -> None:
+    """Наполняет БД и измеряет дамп и восстановление во всех режимах."""
+    import backup
+    from database import Database
+
+    Config.DATABASE_URL = database_url
+    Database.init_pool()
+    Database.init_db()
+    seed_images(args.rows)
+    _seed_jobs()
+    Database.close_pool()
+
+    source_db = urlparse(database_url).path.lstrip("/")
+    restore_db = f"{source_db}_bench_restore"
+    restore_url = _with_database(database_url, restore_db)
+
+    print(
+        f"{'format':>10} {'jobs':>5} {'-Z':>5} "
+        f"{'dump, s':>9} {'restore, s':>11} {'size, MB':>9}"
+    )
+    with tempfile.TemporaryDirectory(prefix="bench-backup-") as workdir:
+        Config.BACKUP_DIR = workdir
+        for backup_format, jobs, level in _modes(args.jobs, args.compression):
+            Config.DATABASE_URL = database_url
+            start = time.perf_counter()
+            success, name = backup.create_backup(backup_format, jobs, level)
+            dump_seconds = time.perf_counter() - start
+            if not success:
+                raise RuntimeError(f"Ошибка бэкапа: {name}")
+            path = os.path.join(workdir, name)
+            size_mb = _size_mb(path)
+
+            _recreate_database(database_url, restore_db)
+            Config.DATABASE_URL = restore_url
+            start = time.perf_counter()
+            success, message = backup.restore_backup(name, jobs)
+            restore_seconds = time.perf_counter() - start
+            if not success:
+                raise RuntimeError(f"Ошибка восстановления: {message}")
+
+            print(
+                f"{backup_format:>10} {jobs:>5} {level:>5} "
+                f"{dump_seconds:>9.2f} {restore_seconds:>11.2f} {size_mb:>9.1f}"
+            )
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    Config.DATABASE_URL = database_url
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{restore_db}"')
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкапа и восстановления БД.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--compression", nargs="+", default=["0", "1", "6"])
+    parser.add_argument(
+        "--disposable-db",
+        action="store_true",
+        help="Запустить временный экземпляр Postgres вместо DATABASE_URL.",
+    )
+    args = parser.parse_args()
+
+    if args.disposable_db:
+        with disposable_postgres() as url:
+            run(url, args)
+    else:
+        run(Config.DATABASE_URL, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Нагрузочный бенчмарк HTTP: dev-сервер Flask, gunicorn и uvicorn (async_app).
+
+Поочерёдно запускает сервер каждого типа на свободном порту, ждёт ответа
+/api/health и в течение заданного времени шлёт запросы из N параллельных
+клиентов (каждый держит keep-alive соединение). Выводит пропускную
+способность, перцентили задержки и число ошибок. Нужна работающая БД
+(DATABASE_URL), как и для самого приложения.
+
+Запуск из каталога backend:
+    python -m bench.http_load --clients 32 --duration 15 --path "/api/images?per_page=50"
+"""
+
+import argparse
+import http.client
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+SERVERS = {
+    "dev": lambda port: [
+        sys.executable,
+        "-c",
+        "from app import create_app; "
+        f"create_app().run(host='127.0.0.1', port={port}, threaded=True)",
+    ],
+    "gunicorn": lambda port: [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "-c",
+        "gunicorn.conf.py",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--access-logfile",
+        "/dev/null",
+        "wsgi:app",
+    ],
+    "uvicorn": lambda port: [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "asgi:app",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--no-access-log",
+    ],
+}
+
+
+def free_port() -> int:
+    """Возвращает свободный TCP-порт на localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 60) -> None:
+    """Ждёт, пока сервер не начнёт отвечать на /api/health."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Сервер на порту {port} не запустился за {timeout} с")
+
+
+def _client(
+    port: int, path: str, stop_at: float, latencies: List[float], errors: List[int]
+) -> None:
+    """Шлёт запросы по одному keep-alive соединению до момента stop_at."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException):
+            errors.append(0)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    conn.close()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Возвращает перцентиль q (0..100) отсортированного списка."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * q / 100))
+    return values[index]
+
+
+def run_load(port: int, path: str, clients: int, duration: float) -> Dict[str, float]:
+    """
+    Нагружает сервер и собирает статистику.
+
+    Args:
+        port: Порт сервера.
+        path: Запрашиваемый путь.
+        clients: Количество параллельных клиентов.
+        duration: Длительность нагрузки в секундах.
+
+    Returns:
+        Словарь с rps, перцентилями задержки (мс) и числом ошибок.
+    """
+    latencies: List[float] = []
+    errors: List[int] = []
+    stop_at = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_client, args=(port, path, stop_at, latencies, errors))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / duration,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": len(errors),
+    }
+
+
+def bench_server(
+    name: str, path: str, clients: int, duration: float
+) -> Tuple[str, Dict[str, float]]:
+    """Запускает сервер указанного типа, нагружает его и останавливает."""
+    port = free_port()
+    proc = subprocess.Popen(
+        SERVERS[name](port), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(port)
+        run_load(port, path, clients, min(duration, 2))  # Прогрев
+        return name, run_load(port, path, clients, duration)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк HTTP.")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--path", default="/api/images?per_page=50")
+    parser.add_argument(
+        "--servers", nargs="+", choices=sorted(SERVERS), default=["dev", "gunicorn"]
+    )
+    args = parser.parse_args()
+
+    print(f"{args.clients} клиентов, {args.duration} с, GET {args.path}")
+    for server in args.servers:
+        name, result = bench_server(server, args.path, args.clients, args.duration)
+        print(
+            f"{name:>9}: {result['rps']:8.1f} req/s  "
+            f"p50 {result['p50']:7.1f} ms  p95 {result['p95']:7.1f} ms  "
+            f"p99 {result['p99']:7.1f} ms  ошибок {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк пагинации: OFFSET против keyset (курсора).
+
+Наполняет таблицу images синтетическими строками (если их меньше нужного)
+и измеряет время получения страниц на разной глубине обоими способами.
+
+Запуск из каталога backend:
+    python -m bench.pagination --rows 1000000 --per-page 10
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+from cache import list_cache
+from config import Config
+from database import Database
+
+
+def seed_images(rows: int) -> None:
+    """Досоздаёт синтетические записи, пока в таблице не станет `rows` строк."""
+    conn = Database.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS total FROM images")
+            missing = rows - cursor.fetchone()["total"]
+            if missing > 0:
+                print(f"Добавление {missing} синтетических записей...")
+                cursor.execute(
+                    """
+                    INSERT INTO images (filename, original_name, size, upload_time, file_type)
+                    SELECT 'bench-' || md5(random()::text || g) || '.png',
+                           'bench.png',
+                           1024,
+                           now() - (g || ' seconds')::interval,
+                           'png'
+                    FROM generate_series(1, %s) AS g
+                    """,
+                    (missing,),
+                )
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE images")
+        conn.commit()
+    finally:
+        Database.put_connection(conn)
+
+
+def _measure(fn: Callable[[], object], repeat: int) -> float:
+    """Возвращает медианное время вызова функции в миллисекундах."""
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _keyset_key_for_page(page: int, per_page: int):
+    """Находит ключ (upload_time, id) последней строки перед нужной страницей."""
+    if page == 1:
+        return None
+    conn = Database.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT upload_time, id FROM images
+                ORDER BY upload_time DESC, id DESC
+                LIMIT 1 OFFSET %s
+                """,
+                ((page - 1) * per_page - 1,),
+            )
+            row = cursor.fetchone()
+            return (row["upload_time"], row["id"]) if row else None
+    finally:
+        Database.put_connection(conn)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк OFFSET vs keyset.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--per-page", type=int, default=Config.ITEM_PER_PAGE)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--pages", type=int, nargs="+", default=[1, 10, 1_000, 10_000, 100_000]
+    )
+    args = parser.parse_args()
+
+    Database.init_pool()
+    Database.init_db()
+    seed_images(args.rows)
+    # Сравниваем запросы к БД, а не попадания в кэш страниц
+    list_cache.max_entries = 0
+
+    print(f"{'page':>10} {'offset, ms':>12} {'keyset, ms':>12}")
+    for page in args.pages:
+        if (page - 1) * args.per_page >= args.rows:
+            continue
+        key = _keyset_key_for_page(page, args.per_page)
+        offset_ms = _measure(
+            lambda: Database.get_images(page, args.per_page), args.repeat
+        )
+        keyset_ms = _measure(
+            lambda: Database.get_images_after(key, args.per_page), args.repeat
+        )
+        print(f"{page:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
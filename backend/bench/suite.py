@@ -0,0 +1,581 @@
+"""
+Воспроизводимый набор нагрузочных сценариев с сохранением базовых результатов.
+
+Запускает приложение из create_app в отдельном процессе (многопоточный
+сервер werkzeug на свободном порту, загрузки — во временную директорию),
+наполняет таблицу images синтетическими записями и прогоняет сценарии:
+
+    upload    — загрузки PNG разного размера (от 16 KB до 4 MB);
+    paginate  — страницы списка на случайной, в том числе большой, глубине;
+    random    — поток запросов /api/random?count=10;
+    delete    — массовое удаление синтетических записей по 50 штук;
+    mixed     — смесь всех операций.
+
+Для каждого сценария и операции выводятся пропускная способность,
+перцентили задержки p50/p95/p99 и число ошибок, для сценария — пиковый RSS
+процесса сервера. Результаты можно сохранить в JSON (--save) и сравнить
+с сохранёнными ранее (--compare): ухудшение больше --threshold процентов
+считается регрессией, и команда завершается с кодом 1.
+
+По умолчанию поднимается временный экземпляр Postgres (нужны initdb и pg_ctl,
+запуск не от root) с fsync=off, чтобы результаты не зависели от диска
+и содержимого рабочей БД. Существующая БД используется только при явном
+--database-url; созданные набором записи (с original_name bench.png и ID
+больше максимального на момент запуска) после прогона удаляются вместе
+с их задачами.
+
+Запуск из каталога backend:
+    python -m bench.suite --scenarios mixed paginate --duration 20 --save base.json
+    python -m bench.suite --compare base.json --set LIST_CACHE_MAX_ENTRIES=0
+"""
+
+import argparse
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from bench.http_load import free_port, percentile, wait_ready
+
+# Модули приложения импортируются внутри функций: процесс сервера (spawn)
+# импортирует этот модуль до применения переопределений Config, а кэши и пулы
+# читают Config при импорте.
+
+# (метод, путь, тело, заголовки)
+Request = Tuple[str, str, Optional[bytes], Dict[str, str]]
+
+UPLOAD_SIZES = (16 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+DELETE_BATCH = 50
+PER_PAGE = 50
+
+SCENARIOS: Dict[str, Dict[str, float]] = {
+    "upload": {"upload": 1},
+    "paginate": {"paginate": 1},
+    "random": {"random": 1},
+    "delete": {"delete": 1},
+    "mixed": {"paginate": 6, "random": 3, "upload": 1, "delete": 0.2},
+}
+
+
+def _serve(port: int, overrides: Dict[str, Any]) -> None:
+    """Процесс сервера: применяет настройки и обслуживает create_app."""
+    from config import Config
+
+    for key, value in overrides.items():
+        setattr(Config, key, value)
+
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    make_server("127.0.0.1", port, create_app(), threaded=True).serve_forever()
+
+
+def _make_png(size: int) -> bytes:
+    """Создаёт PNG из шума примерно заданного размера (шум не сжимается)."""
+    from PIL import Image as PILImage
+
+    side = max(1, int((size / 3) ** 0.5))
+    image = PILImage.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def _multipart(filename: str, data: bytes) -> Tuple[bytes, str]:
+    """Возвращает тело multipart/form-data с полем file и его Content-Type."""
+    boundary = f"bench{random.getrandbits(64):016x}"
+    body = b"".join(
+        [
+            f"--{boundary}\r\n".encode(),
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+            b"Content-Type: image/png\r\n\r\n",
+            data,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ]
+    )
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Workload:
+    """
+    Генератор запросов для сценариев: make_<операция> возвращает запрос
+    или None, если операция сейчас невозможна.
+
+    Args:
+        rows: Количество записей в таблице (определяет глубину страниц).
+        delete_ids: ID синтетических записей, доступных для удаления.
+    """
+
+    def __init__(self, rows: int, delete_ids: Deque[int]):
+        self.max_page = max(1, rows // PER_PAGE)
+        self.delete_ids = delete_ids
+        self._lock = threading.Lock()
+        self.uploads = [
+            _multipart("bench.png", _make_png(size)) for size in UPLOAD_SIZES
+        ]
+
+    def make_upload(self, rnd: random.Random) -> Optional[Request]:
+        body, content_type = rnd.choice(self.uploads)
+        return "POST", "/api/upload", body, {"Content-Type": content_type}
+
+    def make_paginate(self, rnd: random.Random) -> Optional[Request]:
+        # Квадрат равномерного распределения: чаще первые страницы, но
+        # регулярно и глубокие, как при прокрутке архива
+        page = 1 + int(rnd.random() ** 2 * self.max_page)
+        return "GET", f"/api/images?page={page}&per_page={PER_PAGE}", None, {}
+
+    def make_random(self, rnd: random.Random) -> Optional[Request]:
+        return "GET", "/api/random?count=10", None, {}
+
+    def make_delete(self, rnd: random.Random) -> Optional[Request]:
+        with self._lock:
+            if not self.delete_ids:
+                return None
+            ids = [
+                self.delete_ids.popleft()
+                for _ in range(min(DELETE_BATCH, len(self.delete_ids)))
+            ]
+        body = json.dumps({"ids": ids}).encode()
+        return "POST", "/api/images/delete", body, {"Content-Type": "application/json"}
+
+
+def _client(
+    port: int,
+    workload: Workload,
+    mix: Dict[str, float],
+    stop_at: float,
+    seed: int,
+    latencies: Dict[str, List[float]],
+    errors: Dict[str, int],
+) -> None:
+    """Выполняет запросы случайных операций из mix до момента stop_at."""
+    rnd = random.Random(seed)
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    while time.monotonic() < stop_at:
+        operation = rnd.choices(operations, weights)[0]
+        request = getattr(workload, f"make_{operation}")(rnd)
+        if request is None:
+            continue
+        method, path, body, headers = request
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors[operation] = errors.get(operation, 0) + 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            continue
+        if response.status >= 400:
+            errors[operation] = errors.get(operation, 0) + 1
+            continue
+        latencies.setdefault(operation, []).append((time.perf_counter() - start) * 1000)
+    conn.close()
+
+
+def _summary(latencies: List[float], errors: int, duration: float) -> Dict[str, float]:
+    """Сводка по одной операции: rps, перцентили (мс) и число ошибок."""
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 2),
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "errors": errors,
+    }
+
+
+def _reset_peak_rss(pid: int) -> None:
+    """Сбрасывает пиковый RSS процесса (Linux, /proc/<pid>/clear_refs)."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb(pid: int) -> Optional[float]:
+    """Возвращает пиковый RSS процесса в мегабайтах (VmHWM)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def run_scenario(
+    port: int,
+    server_pid: int,
+    workload: Workload,
+    mix: Dict[str, float],
+    clients: int,
+    duration: float,
+) -> Dict[str, Any]:
+    """
+    Нагружает сервер смесью операций и собирает статистику.
+
+    Args:
+        port: Порт сервера.
+        server_pid: PID процесса сервера (для измерения RSS).
+        workload: Генератор запросов.
+        mix: Веса операций сценария.
+        clients: Количество параллельных клиентов.
+        duration: Длительность в секундах.
+
+    Returns:
+        Словарь: сводка по каждой операции, общая сводка ("all") и пиковый RSS.
+    """
+    _reset_peak_rss(server_pid)
+    per_client = [({}, {}) for _ in range(clients)]
+    stop_at = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_client,
+            args=(port, workload, mix, stop_at, seed, latencies, errors),
+        )
+        for seed, (latencies, errors) in enumerate(per_client)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result: Dict[str, Any] = {}
+    all_latencies: List[float] = []
+    all_errors = 0
+    for operation in mix:
+        latencies = [ms for lat, _ in per_client for ms in lat.get(operation, [])]
+        errors = sum(err.get(operation, 0) for _, err in per_client)
+        all_latencies.extend(latencies)
+        all_errors += errors
+        result[operation] = _summary(latencies, errors, duration)
+    result["all"] = _summary(all_latencies, all_errors, duration)
+    result["rss_peak_mb"] = _peak_rss_mb(server_pid)
+    return result
+
+
+@contextmanager
+def disposable_postgres() -> Iterator[str]:
+    """
+    Запускает временный экземпляр Postgres и возвращает его DATABASE_URL.
+
+    Каталог данных и unix-сокет находятся во временной директории, которая
+    удаляется после остановки сервера.
+    """
+    bindir = ""
+    if shutil.which("pg_config"):
+        bindir = subprocess.run(
+            ["pg_config", "--bindir"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    initdb = shutil.which("initdb") or os.path.join(bindir, "initdb")
+    pg_ctl = shutil.which("pg_ctl") or os.path.join(bindir, "pg_ctl")
+
+    workdir = tempfile.mkdtemp(prefix="bench-pg-")
+    datadir = os.path.join(workdir, "data")
+    port = free_port()
+    try:
+        subprocess.run(
+            [initdb, "-D", datadir, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            [
+                pg_ctl,
+                "-D",
+                datadir,
+                "-l",
+                os.path.join(workdir, "postgres.log"),
+                "-w",
+                "-o",
+                f"-p {port} -k {workdir} -c listen_addresses='' -c fsync=off "
+                "-c max_connections=200",
+                "start",
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            yield f"postgresql://postgres@/postgres?host={workdir}&port={port}"
+        finally:
+            subprocess.run(
+                [pg_ctl, "-D", datadir, "-m", "immediate", "stop"],
+                stdout=subprocess.DEVNULL,
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _prepare_db(rows: int) -> Tuple[int, Deque[int]]:
+    """
+    Создаёт схему и досоздаёт синтетические записи.
+
+    Returns:
+        Кортеж (максимальный ID до запуска, ID добавленных синтетических
+        записей — сценарий delete удаляет только их).
+    """
+    from bench.pagination import seed_images
+    from database import Database
+
+    Database.init_pool(1, 2)
+    try:
+        Database.init_db()
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM images")
+                last_id = cursor.fetchone()["last_id"]
+        seed_images(rows)
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id FROM images WHERE filename LIKE %s AND id > %s "
+                    "ORDER BY id",
+                    ("bench-%", last_id),
+                )
+                return last_id, deque(row["id"] for row in cursor.fetchall())
+    finally:
+        Database.close_pool()
+
+
+def _cleanup_db(last_id: int, overrides: Dict[str, Any]) -> None:
+    """
+    Удаляет записи, созданные набором: синтетические и загруженные клиентами.
+
+    Удаление идёт через Database.delete_images_db, чтобы счётчики каталога
+    и ссылки на blob-ы остались согласованными; пути файлов указывают
+    на временную директорию прогона.
+    """
+    from config import Config
+    from database import Database
+
+    Config.UPLOAD_FOLDER = overrides["UPLOAD_FOLDER"]
+    Config.THUMBS_FOLDER = overrides["THUMBS_FOLDER"]
+    Database.init_pool(1, 2)
+    try:
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id FROM images WHERE id > %s AND original_name = %s",
+                    (last_id, "bench.png"),
+                )
+                ids = [row["id"] for row in cursor.fetchall()]
+        for start in range(0, len(ids), Config.MAX_BULK_DELETE):
+            chunk = ids[start : start + Config.MAX_BULK_DELETE]
+            success, _, _, _ = Database.delete_images_db(ids=chunk, limit=len(chunk))
+            if not success:
+                print("Не удалось удалить созданные набором записи", file=sys.stderr)
+                return
+        print(f"Удалено созданных набором записей: {len(ids)}")
+    finally:
+        Database.close_pool()
+
+
+def _parse_override(text: str) -> Tuple[str, Any]:
+    """Разбирает KEY=VALUE; значение читается как JSON, иначе как строка."""
+    key, _, value = text.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def _git_revision() -> Optional[str]:
+    """Возвращает текущий коммит репозитория, если он доступен."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    """
+    Сравнивает результаты с базовыми и печатает изменения.
+
+    Args:
+        baseline: Сохранённые ранее результаты.
+        current: Текущие результаты.
+        threshold: Допустимое ухудшение в процентах.
+
+    Returns:
+        Список описаний регрессий (пустой, если их нет).
+    """
+    regressions = []
+    print(f"\nСравнение с {baseline['meta'].get('git') or 'базой'} ({threshold}%):")
+    for scenario, operations in current["results"].items():
+        base_operations = baseline["results"].get(scenario)
+        if not base_operations:
+            continue
+        for operation, stats in operations.items():
+            base = base_operations.get(operation)
+            if not isinstance(stats, dict) or not base:
+                continue
+            rps_change = (stats["rps"] / base["rps"] - 1) * 100 if base["rps"] else 0
+            p95_change = (stats["p95"] / base["p95"] - 1) * 100 if base["p95"] else 0
+            mark = ""
+            if rps_change < -threshold or p95_change > threshold:
+                mark = "  РЕГРЕССИЯ"
+                regressions.append(f"{scenario}/{operation}")
+            print(
+                f"{scenario:>9}/{operation:<9} rps {rps_change:+7.1f}%  "
+                f"p95 {p95_change:+7.1f}%{mark}"
+            )
+    return regressions
+
+
+@contextmanager
+def _database(database_url: Optional[str]) -> Iterator[str]:
+    """Возвращает DATABASE_URL: заданный явно или временного экземпляра."""
+    if database_url:
+        yield database_url
+    else:
+        with disposable_postgres() as url:
+            yield url
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Нагрузочные сценарии с базовыми результатами."
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument(
+        "--database-url",
+        help="Использовать существующую БД вместо временного Postgres; "
+        "созданные набором записи удаляются после прогона.",
+    )
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Переопределить атрибут Config в процессе сервера.",
+    )
+    parser.add_argument("--save", help="Сохранить результаты в JSON-файл.")
+    parser.add_argument("--compare", help="Сравнить с результатами из JSON-файла.")
+    parser.add_argument("--threshold", type=float, default=10)
+    args = parser.parse_args()
+
+    with _database(args.database_url) as database_url:
+        results = _run(args, database_url, cleanup=bool(args.database_url))
+
+    report = {
+        "meta": {
+            "git": _git_revision(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "clients": args.clients,
+            "duration": args.duration,
+            "rows": args.rows,
+            "overrides": args.overrides,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+def _run(args: argparse.Namespace, database_url: str, cleanup: bool) -> Dict[str, Any]:
+    """
+    Запускает сервер, прогоняет сценарии и возвращает результаты.
+
+    При cleanup созданные набором записи удаляются после остановки сервера.
+    """
+    from config import Config
+
+    Config.DATABASE_URL = database_url
+    print(f"Подготовка БД ({args.rows} записей)...")
+    last_id, delete_ids = _prepare_db(args.rows)
+    workload = Workload(args.rows, delete_ids)
+
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    overrides = {
+        "DATABASE_URL": database_url,
+        "UPLOAD_FOLDER": os.path.join(workdir, "images"),
+        "THUMBS_FOLDER": os.path.join(workdir, "thumbs"),
+        "BACKUP_DIR": os.path.join(workdir, "backup"),
+        "LOGS_DIR": os.path.join(workdir, "logs"),
+        "LOG_LEVEL": "WARNING",
+        "DB_POOL_MAX_SIZE": max(Config.DB_POOL_MAX_SIZE, args.clients),
+        **dict(_parse_override(item) for item in args.overrides),
+    }
+    port = free_port()
+    server = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(port, overrides), daemon=True
+    )
+    server.start()
+    results: Dict[str, Any] = {}
+    try:
+        wait_ready(port)
+        print(f"{args.clients} клиентов, {args.duration} с на сценарий")
+        for name in args.scenarios:
+            mix = SCENARIOS[name]
+            run_scenario(port, server.pid, workload, mix, args.clients, args.warmup)
+            result = run_scenario(
+                port, server.pid, workload, mix, args.clients, args.duration
+            )
+            results[name] = result
+            print(f"\n{name} (пиковый RSS сервера {result['rss_peak_mb']} MB)")
+            for operation in [*mix, "all"]:
+                stats = result[operation]
+                print(
+                    f"  {operation:>9}: {stats['rps']:8.1f} req/s  "
+                    f"p50 {stats['p50']:7.1f} ms  p95 {stats['p95']:7.1f} ms  "
+                    f"p99 {stats['p99']:7.1f} ms  ошибок {stats['errors']}"
+                )
+            if name in ("delete", "mixed") and not workload.delete_ids:
+                print("  (все синтетические записи удалены, увеличьте --rows)")
+    finally:
+        server.terminate()
+        server.join(timeout=30)
+        try:
+            if cleanup:
+                _cleanup_db(last_id, overrides)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Бенчмарк памяти при параллельных загрузках.
+
+Сравнивает прежний путь загрузки (`file.read()` + запись байтов) с потоковым
+`save_file_stream` при N одновременных загрузках файлов заданного размера.
+Источники данных лежат на диске, как файлы, которые werkzeug сбрасывает во
+временные файлы при разборе multipart, поэтому измеряется только память,
+занятая самим путём сохранения. БД не требуется.
+
+Запуск из каталога backend:
+    python -m bench.upload_memory --uploads 50 --size-mb 5
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from config import Config
+from utils import generate_unique_filename, save_file_stream
+
+
+def _legacy_save(source_path: str) -> None:
+    """Прежний путь: файл целиком читается в память и записывается на диск."""
+    with open(source_path, "rb") as src:
+        data = src.read()
+    path = os.path.join(Config.UPLOAD_FOLDER, generate_unique_filename("a.png"))
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _stream_save(source_path: str) -> None:
+    """Новый путь: потоковая запись блоками с подсчётом размера и хеша."""
+    with open(source_path, "rb") as src:
+        save_file_stream("a.png", src)
+
+
+def _run(save: Callable[[str], None], sources: List[str]) -> int:
+    """Запускает все загрузки одновременно и возвращает пик памяти в байтах."""
+    barrier = threading.Barrier(len(sources))
+
+    def task(path: str) -> None:
+        barrier.wait()
+        save(path)
+
+    tracemalloc.start()
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        list(executor.map(task, sources))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк памяти загрузок.")
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--size-mb", type=float, default=5)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    workdir = tempfile.mkdtemp(prefix="bench-upload-")
+    try:
+        Config.UPLOAD_FOLDER = os.path.join(workdir, "images")
+        Config.MAX_CONTENT_LENGTH = max(Config.MAX_CONTENT_LENGTH, size)
+        os.makedirs(Config.UPLOAD_FOLDER)
+
+        sources = []
+        for i in range(args.uploads):
+            path = os.path.join(workdir, f"src-{i}")
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+            sources.append(path)
+
+        print(f"{args.uploads} одновременных загрузок по {args.size_mb} MB")
+        for name, save in (("read()", _legacy_save), ("stream", _stream_save)):
+            peak = _run(save, sources)
+            print(f"{name:>8}: пик памяти Python {peak / (1024 * 1024):8.1f} MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+from config import Config
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением времени жизни записей.
+
+    Хранит не больше max_entries записей, вытесняя давно не читавшиеся;
+    запись старше ttl секунд считается промахом. Считает попадания, промахи
+    и вытеснения. Каждая инвалидация увеличивает номер эпохи кэша: значение,
+    загрузка которого началась до инвалидации, в кэш уже не попадёт, поэтому
+    параллельное чтение не может вернуть в кэш устаревшие данные.
+
+    Кэшированные значения общие для всех потоков и не должны изменяться.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._epoch = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Возвращает значение из кэша или загружает и запоминает его.
+
+        Исключение загрузчика пробрасывается, и ничего не кэшируется.
+
+        Args:
+            key: Ключ записи.
+            loader: Функция без аргументов, загружающая значение.
+
+        Returns:
+            Закэшированное или только что загруженное значение.
+        """
+        if self.max_entries <= 0:
+            return loader()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            epoch = self._epoch
+
+        value = loader()
+
+        with self._lock:
+            if self._epoch == epoch:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return value
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        """Удаляет записи с указанными ключами."""
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Удаляет все записи."""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает размер кэша и счётчики попаданий, промахов и вытеснений."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+# Страницы списка изображений; сбрасываются при смене поколения каталога
+list_cache = LRUCache("lists", Config.LIST_CACHE_MAX_ENTRIES, Config.LIST_CACHE_TTL)
+# Метаданные отдельных изображений по ID; сбрасываются поштучно
+image_cache = LRUCache("images", Config.IMAGE_CACHE_MAX_ENTRIES, Config.IMAGE_CACHE_TTL)
+
+
+def invalidate_images(image_ids: Iterable[int]) -> None:
+    """
+    Сбрасывает кэш после изменения изображений с указанными ID.
+
+    Записи этих изображений удаляются поштучно, страницы списка — целиком,
+    так как изменение любой записи может затронуть любую страницу.
+
+    Args:
+        image_ids: ID изменённых, добавленных или удалённых изображений.
+    """
+    image_cache.invalidate(image_ids)
+    list_cache.clear()
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Возвращает статистику всех кэшей чтения."""
+    return {cache.name: cache.stats() for cache in (list_cache, image_cache)}
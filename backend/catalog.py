@@ -0,0 +1,169 @@
+import select
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from cache import image_cache, list_cache
+from config import Config
+from database import Database
+from utils import log_error, log_info
+
+CatalogState = Tuple[int, datetime]
+
+
+class Catalog:
+    """
+    Номер поколения каталога изображений для условных HTTP-запросов.
+
+    Поколение хранится в images_stats и увеличивается триггерами при любом
+    изменении таблицы images (загрузка, удаление, смена статуса обработки);
+    каждое изменение рассылается через NOTIFY. Фоновый поток слушает канал
+    на отдельном соединении и держит последнее поколение в памяти, поэтому
+    ответ 304 на If-None-Match не требует обращения к Postgres.
+
+    Если слушатель не подключён или процесс сам только что изменил каталог
+    (см. mark_stale), поколение читается из БД одним запросом к images_stats.
+
+    Смена поколения сбрасывает кэш страниц списка (cache.list_cache), а ID
+    изменённых записей из уведомления — их записи в cache.image_cache, так
+    что кэш чтения согласован между всеми процессами.
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._changed_at: Optional[datetime] = None
+        # Последнее поколение, для которого актуален кэш списка
+        self._seen: Optional[int] = None
+        self._listening = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Запускает фоновый поток, слушающий уведомления об изменениях."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._listen, name="catalog-listener", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает фоновый поток."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=Config.CATALOG_RECONNECT_DELAY + 1)
+            self._thread = None
+
+    def state(self) -> Optional[CatalogState]:
+        """
+        Возвращает текущее поколение каталога и время последнего изменения.
+
+        Returns:
+            Кортеж (generation, changed_at) или None, если его не удалось
+            получить (тогда условный ответ не формируется).
+        """
+        with self._lock:
+            if self._listening and self._generation is not None:
+                return self._generation, self._changed_at
+        try:
+            with Database.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT generation, changed_at FROM images_stats")
+                    row = cursor.fetchone()
+        except psycopg2.Error as e:
+            log_error("Ошибка чтения поколения каталога: %s", e)
+            return None
+        if not row:
+            return None
+        self.observe(row["generation"], row["changed_at"])
+        return row["generation"], row["changed_at"]
+
+    def observe(self, generation: int, changed_at: datetime) -> None:
+        """Запоминает поколение, если оно новее известного (уведомления могут опаздывать)."""
+        with self._lock:
+            if self._seen is not None and generation < self._seen:
+                return
+            changed = self._seen is not None and generation != self._seen
+            self._generation = generation
+            self._changed_at = changed_at
+            self._seen = generation
+        if changed:
+            list_cache.clear()
+
+    def mark_stale(self) -> None:
+        """
+        Забывает известное поколение после изменения каталога этим процессом.
+
+        Уведомление о собственном изменении приходит асинхронно; до его
+        прихода следующий запрос прочитает поколение из БД, и клиент сразу
+        увидит свою загрузку или удаление.
+        """
+        with self._lock:
+            self._generation = None
+
+    def _listen(self) -> None:
+        """Слушает канал уведомлений, переподключаясь при обрыве соединения."""
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(Config.DATABASE_URL)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel};")
+                    # Читаем поколение уже после LISTEN, чтобы не пропустить изменения
+                    cursor.execute("SELECT generation, changed_at FROM images_stats")
+                    generation, changed_at = cursor.fetchone()
+                with self._lock:
+                    self._generation = None
+                # Уведомления, пришедшие без слушателя, потеряны
+                image_cache.clear()
+                self.observe(generation, changed_at)
+                with self._lock:
+                    self._listening = True
+                log_info("Слушатель изменений каталога подключён (%s)", self.channel)
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._handle(conn.notifies.pop(0).payload)
+            except Exception as e:
+                log_error("Слушатель изменений каталога отключён: %s", e)
+            finally:
+                with self._lock:
+                    self._listening = False
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(Config.CATALOG_RECONNECT_DELAY)
+
+    def _handle(self, payload: str) -> None:
+        """
+        Разбирает уведомление вида '<generation>:<epoch>:<ids>'.
+
+        ids — ID изменённых или удалённых записей через запятую, пустая строка
+        для вставки или '*', если сбросить нужно все записи.
+        """
+        try:
+            generation, epoch, ids = payload.split(":", 2)
+            changed_at = datetime.fromtimestamp(float(epoch), tz=timezone.utc)
+            if ids == "*":
+                image_cache.clear()
+            elif ids:
+                image_cache.invalidate(int(image_id) for image_id in ids.split(","))
+            self.observe(int(generation), changed_at)
+        except ValueError:
+            log_error("Неверное уведомление об изменении каталога: %r", payload)
+
+
+def catalog_etag(generation: int) -> str:
+    """Возвращает ETag ответов, зависящих только от содержимого каталога."""
+    return f"catalog-{generation}"
+
+
+catalog = Catalog(Config.CATALOG_CHANNEL)
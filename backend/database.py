@@ -1,22 +1,49 @@
+import math
+import os
+import random
 import time
-from typing import List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
+from cache import image_cache, invalidate_images, list_cache
 from config import Config
+from db_pool import ConnectionPool, PoolTimeoutError
+from metrics import db_query_duration_seconds, instrument_methods
 from models import Image
-from utils import log_error, log_info, log_success
+from storage import get_storage
+from utils import delete_files, log_error, log_info, log_success
 
 
+SCHEMA_LOCK_ID = 7310451  # Ключ advisory-блокировки для init_db
+BLOB_LOCK_ID = 7310452  # Первый ключ advisory-блокировок содержимого (_lock_blobs)
+
+
+@instrument_methods(
+    db_query_duration_seconds,
+    exclude=(
+        "init_pool",
+        "close_pool",
+        "get_connection",
+        "put_connection",
+        "connection",
+        "pool_stats",
+        "init_db",
+        "iter_stored_files",
+    ),
+)
 class Database:
     """Класс для всех взаимодействий с базой данных."""
 
-    _pool: Optional[pool.SimpleConnectionPool] = None
+    _pool: Optional[ConnectionPool] = None
 
     @staticmethod
-    def init_pool(min_conn: int = 1, max_conn: int = 10):
+    def init_pool(
+        min_conn: int = Config.DB_POOL_MIN_SIZE, max_conn: int = Config.DB_POOL_MAX_SIZE
+    ):
         """
         Инициализирует пул соединений с базой данных.
 
@@ -32,10 +59,13 @@ class Database:
         last_err = None
         for _ in range(60):  # Попытки подключения в течение ~2 минут
             try:
-                Database._pool = pool.SimpleConnectionPool(
-                    min_conn,
-                    max_conn,
-                    dsn=Config.DATABASE_URL,
+                Database._pool = ConnectionPool(
+                    Config.DATABASE_URL,
+                    min_size=min_conn,
+                    max_size=max_conn,
+                    timeout=Config.DB_POOL_TIMEOUT,
+                    healthcheck_idle=Config.DB_POOL_HEALTHCHECK_IDLE,
+                    wait_buckets=Config.DB_POOL_WAIT_BUCKETS,
                     cursor_factory=RealDictCursor,
                 )
                 log_info("Пул соединений с БД успешно инициализирован.")
@@ -45,29 +75,30 @@ class Database:
                 time.sleep(2)
         raise Exception(f"Не удалось инициализировать пул соединений: {last_err}")
 
+    @staticmethod
+    def close_pool() -> None:
+        """Закрывает все соединения пула (например, перед fork дочерних процессов)."""
+        if Database._pool:
+            Database._pool.close_all()
+            Database._pool = None
+
     @staticmethod
     def get_connection():
         """
         Получает одно соединение из пула.
 
-        Выполняет несколько попыток, чтобы дождаться готовности БД.
+        Если все соединения заняты, ждёт не дольше Config.DB_POOL_TIMEOUT.
 
         Raises:
-            Exception: Если не удалось получить соединение.
+            PoolTimeoutError: Если свободное соединение не появилось вовремя.
+            Exception: Если пул не инициализирован.
 
         Returns:
             Соединение с базой данных.
         """
-        last_err = None
-        for _ in range(60):
-            try:
-                if Database._pool:
-                    return Database._pool.getconn()
-                raise Exception("Пул соединений не инициализирован.")
-            except Exception as e:
-                last_err = e
-                time.sleep(2)
-        raise Exception(f"Не удалось подключиться к БД: {last_err}")
+        if not Database._pool:
+            raise Exception("Пул соединений не инициализирован.")
+        return Database._pool.acquire()
 
     @staticmethod
     def put_connection(conn):
@@ -78,7 +109,27 @@ class Database:
             conn: Соединение, которое нужно вернуть.
         """
         if Database._pool:
-            Database._pool.putconn(conn)
+            Database._pool.release(conn)
+
+    @staticmethod
+    @contextmanager
+    def connection() -> Iterator[Any]:
+        """
+        Контекстный менеджер: выдаёт соединение из пула и всегда возвращает его.
+
+        Raises:
+            PoolTimeoutError: Если свободное соединение не появилось вовремя.
+        """
+        conn = Database.get_connection()
+        try:
+            yield conn
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def pool_stats() -> Dict[str, Any]:
+        """Возвращает статистику пула соединений (пустой словарь до инициализации)."""
+        return Database._pool.stats() if Database._pool else {}
 
     @staticmethod
     def init_db() -> None:
@@ -91,6 +142,9 @@ class Database:
         conn = Database.get_connection()
         try:
             with conn.cursor() as cursor:
+                # Несколько процессов (веб и воркеры) могут стартовать
+                # одновременно; DDL выполняем строго по очереди
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_ID,))
                 cursor.execute(
                     """
                     CREATE TABLE IF NOT EXISTS images(
@@ -103,10 +157,190 @@ class Database:
                     );
                     """
                 )
+                # Составной индекс для keyset-пагинации и сортировки списка
+                cursor.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_images_upload_time_id
+                    ON images (upload_time DESC, id DESC);
+                    """
+                )
+                # Счётчик записей и номер поколения каталога, поддерживаемые
+                # триггерами уровня оператора: COUNT(*) не выполняется на каждый
+                # запрос списка, а поколение растёт при любом изменении images
+                # и рассылается через NOTIFY вместе с ID изменённых записей
+                # (см. catalog.py и cache.py)
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS images_stats(
+                        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                        total BIGINT NOT NULL DEFAULT 0
+                    );
+
+                    ALTER TABLE images_stats
+                    ADD COLUMN IF NOT EXISTS generation BIGINT NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+                    INSERT INTO images_stats (id, total)
+                    SELECT TRUE, COUNT(*) FROM images
+                    ON CONFLICT (id) DO NOTHING;
+
+                    DROP FUNCTION IF EXISTS images_catalog_bump(BIGINT);
+
+                    CREATE OR REPLACE FUNCTION images_catalog_bump(
+                        delta BIGINT, changed_ids INTEGER[]
+                    )
+                    RETURNS void AS $$
+                    DECLARE
+                        stats images_stats%%ROWTYPE;
+                    BEGIN
+                        UPDATE images_stats
+                        SET total = GREATEST(total + delta, 0),
+                            generation = generation + 1,
+                            changed_at = now()
+                        RETURNING * INTO stats;
+                        -- '<поколение>:<время>:<ID через запятую или * — все>'
+                        PERFORM pg_notify(
+                            %(channel)s,
+                            stats.generation || ':'
+                            || extract(epoch FROM stats.changed_at) || ':'
+                            || CASE
+                                WHEN changed_ids IS NULL
+                                    OR cardinality(changed_ids) > %(max_ids)s THEN '*'
+                                ELSE array_to_string(changed_ids, ',')
+                            END
+                        );
+                    END;
+                    $$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE FUNCTION images_stats_on_insert()
+                    RETURNS trigger AS $$
+                    DECLARE
+                        added BIGINT := (SELECT COUNT(*) FROM new_rows);
+                    BEGIN
+                        IF added > 0 THEN
+                            PERFORM images_catalog_bump(added, '{}');
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE FUNCTION images_stats_on_update()
+                    RETURNS trigger AS $$
+                    BEGIN
+                        IF EXISTS (SELECT 1 FROM new_rows) THEN
+                            PERFORM images_catalog_bump(
+                                0, ARRAY(SELECT id FROM new_rows)
+                            );
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE FUNCTION images_stats_on_delete()
+                    RETURNS trigger AS $$
+                    DECLARE
+                        removed BIGINT := (SELECT COUNT(*) FROM old_rows);
+                    BEGIN
+                        IF removed > 0 THEN
+                            PERFORM images_catalog_bump(
+                                -removed, ARRAY(SELECT id FROM old_rows)
+                            );
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE FUNCTION images_stats_on_truncate()
+                    RETURNS trigger AS $$
+                    BEGIN
+                        UPDATE images_stats SET total = 0;
+                        PERFORM images_catalog_bump(0, NULL);
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE TRIGGER images_stats_insert
+                    AFTER INSERT ON images
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION images_stats_on_insert();
+
+                    CREATE OR REPLACE TRIGGER images_stats_update
+                    AFTER UPDATE ON images
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION images_stats_on_update();
+
+                    CREATE OR REPLACE TRIGGER images_stats_delete
+                    AFTER DELETE ON images
+                    REFERENCING OLD TABLE AS old_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION images_stats_on_delete();
+
+                    CREATE OR REPLACE TRIGGER images_stats_truncate
+                    AFTER TRUNCATE ON images
+                    FOR EACH STATEMENT EXECUTE FUNCTION images_stats_on_truncate();
+                    """,
+                    {
+                        "channel": Config.CATALOG_CHANNEL,
+                        "max_ids": Config.CACHE_NOTIFY_MAX_IDS,
+                    },
+                )
+                # Контентно-адресуемое хранилище: один файл на уникальное
+                # содержимое и счётчик ссылок из images
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS blobs(
+                        sha256 TEXT PRIMARY KEY,
+                        filename TEXT NOT NULL UNIQUE,
+                        size BIGINT NOT NULL,
+                        refcount INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+
+                    ALTER TABLE images
+                    ADD COLUMN IF NOT EXISTS blob_sha256 TEXT REFERENCES blobs(sha256);
+                    """
+                )
+                # Очередь фоновых задач обработки после загрузки
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs(
+                        id BIGSERIAL PRIMARY KEY,
+                        image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+                        kind TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        max_attempts INTEGER NOT NULL DEFAULT 5,
+                        run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        locked_at TIMESTAMP,
+                        last_error TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+
+                    CREATE INDEX IF NOT EXISTS idx_jobs_pending
+                    ON jobs (run_at) WHERE status = 'pending';
+                    CREATE INDEX IF NOT EXISTS idx_jobs_running
+                    ON jobs (locked_at) WHERE status = 'running';
+                    CREATE INDEX IF NOT EXISTS idx_jobs_image_id ON jobs (image_id);
+
+                    ALTER TABLE images
+                    ADD COLUMN IF NOT EXISTS job_status TEXT NOT NULL DEFAULT 'done';
+
+                    ALTER TABLE images ADD COLUMN IF NOT EXISTS bytes_saved BIGINT;
+                    ALTER TABLE images ADD COLUMN IF NOT EXISTS variants TEXT[];
+                    """
+                )
+                if Config.CONTENT_ADDRESSED_STORAGE:
+                    # Несколько записей могут ссылаться на один и тот же файл
+                    cursor.execute(
+                        """
+                        ALTER TABLE images DROP CONSTRAINT IF EXISTS images_filename_key;
+                        CREATE INDEX IF NOT EXISTS idx_images_filename ON images (filename);
+                        """
+                    )
             conn.commit()
             log_info("База данных инициирована (Таблица images готова).")
         except Exception as e:
-            log_error(f"Ошибка инициализации БД: {e}")
+            log_error("Ошибка инициализации БД: %s", e)
             raise
         finally:
             Database.put_connection(conn)
@@ -128,58 +362,531 @@ class Database:
             with conn.cursor() as cursor:
                 cursor.execute(
                     """
-                    INSERT INTO images (filename, original_name, size, file_type)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO images (filename, original_name, size, file_type, job_status)
+                    VALUES (%s, %s, %s, %s, %s)
                     RETURNING id;
                     """,
-                    (image.filename, image.original_name, image.size, image.file_type),
+                    (
+                        image.filename,
+                        image.original_name,
+                        image.size,
+                        image.file_type,
+                        Database._initial_job_status(),
+                    ),
                 )
                 image_id = cursor.fetchone()["id"]
+                Database._enqueue_jobs(cursor, [image_id])
             conn.commit()
-            log_success(f"Изображение сохранено в БД: {image.filename}, ID: {image_id}")
+            invalidate_images([image_id])
+            image.job_status = Database._initial_job_status()
+            log_success(
+                "Изображение сохранено в БД: %s, ID: %s", image.filename, image_id
+            )
             return True, image_id
         except Exception as e:
             conn.rollback()
-            log_error(f"Ошибка сохранения в БД: {e}")
+            log_error("Ошибка сохранения в БД: %s", e)
             return False, None
         finally:
             Database.put_connection(conn)
 
+    @staticmethod
+    def save_images(images: List[Image]) -> List[Optional[int]]:
+        """
+        Сохраняет метаданные нескольких изображений одним запросом.
+
+        Выполняет один многострочный INSERT ... RETURNING. Имена файлов
+        уникальны (UUID), поэтому ON CONFLICT не нужен; уникального индекса
+        по filename нет после включения контентно-адресуемого хранения.
+
+        Args:
+            images: Список объектов Image для сохранения.
+
+        Returns:
+            Список ID в порядке входного списка; None — запись не сохранена
+            (при ошибке запроса None для всех записей).
+        """
+        if not images:
+            return []
+
+        conn = Database.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                rows = execute_values(
+                    cursor,
+                    """
+                    INSERT INTO images (filename, original_name, size, file_type, job_status)
+                    VALUES %s
+                    RETURNING id, filename;
+                    """,
+                    [
+                        (
+                            image.filename,
+                            image.original_name,
+                            image.size,
+                            image.file_type,
+                            Database._initial_job_status(),
+                        )
+                        for image in images
+                    ],
+                    page_size=len(images),
+                    fetch=True,
+                )
+                ids_by_filename = {row["filename"]: row["id"] for row in rows}
+                Database._enqueue_jobs(cursor, list(ids_by_filename.values()))
+            conn.commit()
+            invalidate_images(ids_by_filename.values())
+            for image in images:
+                image.job_status = Database._initial_job_status()
+            log_success("Изображения сохранены в БД: %s", len(ids_by_filename))
+            return [ids_by_filename.get(image.filename) for image in images]
+        except Exception as e:
+            conn.rollback()
+            log_error("Ошибка пакетного сохранения в БД: %s", e)
+            return [None] * len(images)
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def _initial_job_status() -> str:
+        """Возвращает статус обработки для новой записи изображения."""
+        return "pending" if Config.UPLOAD_JOBS else "done"
+
+    @staticmethod
+    def _enqueue_jobs(cursor, image_ids: List[int]) -> None:
+        """
+        Ставит в очередь задачи Config.UPLOAD_JOBS для новых изображений.
+
+        Вызывается в той же транзакции, что и вставка изображений, поэтому
+        задачи появляются ровно тогда, когда запись становится видимой.
+
+        Args:
+            cursor: Открытый курсор БД внутри транзакции вставки.
+            image_ids: ID новых изображений.
+        """
+        if not Config.UPLOAD_JOBS or not image_ids:
+            return
+        cursor.execute(
+            """
+            INSERT INTO jobs (image_id, kind, max_attempts)
+            SELECT image_id, kind, %s
+            FROM unnest(%s::integer[]) AS image_id
+            CROSS JOIN unnest(%s::text[]) AS kind;
+            """,
+            (Config.JOB_MAX_ATTEMPTS, image_ids, list(Config.UPLOAD_JOBS)),
+        )
+
+    @staticmethod
+    def save_image_blob(
+        image: Image, sha256: str, temp_path: str
+    ) -> Tuple[bool, Optional[int]]:
+        """
+        Сохраняет изображение в режиме контентно-адресуемого хранения.
+
+        Увеличивает счётчик ссылок blob-а с данным SHA-256 (создавая его при
+        необходимости) и добавляет запись в images. Если такое содержимое уже
+        хранится, временный файл просто удаляется, иначе помещается в хранилище
+        под именем blob-а. Файловые операции выполняются под advisory-
+        блокировкой содержимого (_lock_blobs), поэтому удаление файла
+        освободившегося blob-а с тем же SHA-256 (_delete_blob_files) не может
+        удалить только что размещённый файл.
+
+        Args:
+            image: Объект Image; поле filename заменяется на имя файла blob-а.
+            sha256: SHA-256 содержимого.
+            temp_path: Путь к временному файлу с содержимым.
+
+        Returns:
+            Кортеж (True, image_id), если сохранение успешно.
+            Кортеж (False, None), если произошла ошибка (временный файл удаляется).
+        """
+        try:
+            conn = Database.get_connection()
+        except PoolTimeoutError:
+            os.remove(temp_path)
+            raise
+        placed = False
+        try:
+            with conn.cursor() as cursor:
+                Database._lock_blobs(cursor, [sha256])
+                cursor.execute(
+                    """
+                    INSERT INTO blobs (sha256, filename, size, refcount)
+                    VALUES (%s, %s, %s, 1)
+                    ON CONFLICT (sha256) DO UPDATE SET refcount = blobs.refcount + 1
+                    RETURNING filename, refcount;
+                    """,
+                    (sha256, image.filename, image.size),
+                )
+                blob = cursor.fetchone()
+                image.filename = blob["filename"]
+                if blob["refcount"] == 1:
+                    get_storage().place(temp_path, image.filename)
+                    placed = True
+                else:
+                    os.remove(temp_path)
+
+                cursor.execute(
+                    """
+                    INSERT INTO images
+                        (filename, original_name, size, file_type, blob_sha256, job_status)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id;
+                    """,
+                    (
+                        image.filename,
+                        image.original_name,
+                        image.size,
+                        image.file_type,
+                        sha256,
+                        Database._initial_job_status(),
+                    ),
+                )
+                image_id = cursor.fetchone()["id"]
+                Database._enqueue_jobs(cursor, [image_id])
+            conn.commit()
+            invalidate_images([image_id])
+            image.job_status = Database._initial_job_status()
+            image.id = image_id
+            image.blob_sha256 = sha256
+            log_success(
+                "Изображение сохранено в БД: %s, ID: %s", image.filename, image_id
+            )
+            return True, image_id
+        except Exception as e:
+            # Файл убираем до отката, пока строка blob-а ещё заблокирована
+            try:
+                if placed:
+                    get_storage().delete(image.filename)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            except Exception as cleanup_error:
+                log_error("Ошибка удаления файла %s: %s", image.filename, cleanup_error)
+            conn.rollback()
+            log_error("Ошибка сохранения в БД: %s", e)
+            return False, None
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def save_image_blobs(
+        images: List[Image], sha256s: List[str], temp_paths: List[str]
+    ) -> List[Optional[int]]:
+        """
+        Сохраняет несколько изображений в режиме контентно-адресуемого хранения.
+
+        Пакетный вариант save_image_blob в одной транзакции: счётчики ссылок
+        всех blob-ов обновляются одним многострочным INSERT ... ON CONFLICT
+        (строки блокируются в порядке SHA-256, поэтому параллельные пакеты
+        не взаимоблокируются), записи images — одним многострочным INSERT.
+        Одинаковое содержимое внутри пакета даёт один blob; файл размещается
+        только для новых blob-ов, остальные временные файлы удаляются.
+
+        Args:
+            images: Объекты Image; поле filename заменяется на имя файла blob-а.
+            sha256s: SHA-256 содержимого каждого изображения.
+            temp_paths: Пути к временным файлам с содержимым.
+
+        Returns:
+            Список ID в порядке входного списка; при ошибке — None для всех
+            записей (временные и размещённые файлы удаляются).
+
+        Raises:
+            PoolTimeoutError: Если не дождались соединения (временные файлы
+                удаляются).
+        """
+        if not images:
+            return []
+
+        def remove_temp_files():
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        try:
+            conn = Database.get_connection()
+        except PoolTimeoutError:
+            remove_temp_files()
+            raise
+
+        # Сколько ссылок добавляет пакет и какой файл несёт содержимое blob-а
+        references: Dict[str, int] = {}
+        sources: Dict[str, int] = {}
+        for index, sha256 in enumerate(sha256s):
+            references[sha256] = references.get(sha256, 0) + 1
+            sources.setdefault(sha256, index)
+        placed: List[str] = []
+        try:
+            with conn.cursor() as cursor:
+                Database._lock_blobs(cursor, list(references))
+                blobs = execute_values(
+                    cursor,
+                    """
+                    INSERT INTO blobs (sha256, filename, size, refcount)
+                    VALUES %s
+                    ON CONFLICT (sha256)
+                    DO UPDATE SET refcount = blobs.refcount + EXCLUDED.refcount
+                    RETURNING sha256, filename, refcount;
+                    """,
+                    [
+                        (
+                            sha256,
+                            images[sources[sha256]].filename,
+                            images[sources[sha256]].size,
+                            count,
+                        )
+                        for sha256, count in sorted(references.items())
+                    ],
+                    page_size=len(references),
+                    fetch=True,
+                )
+                filenames = {}
+                for blob in blobs:
+                    sha256 = blob["sha256"]
+                    filenames[sha256] = blob["filename"]
+                    # Счётчик равен числу ссылок пакета только у нового blob-а
+                    if blob["refcount"] == references[sha256]:
+                        get_storage().place(
+                            temp_paths[sources[sha256]], blob["filename"]
+                        )
+                        placed.append(blob["filename"])
+                remove_temp_files()
+
+                # ID выделяются заранее: порядок строк RETURNING не гарантирован,
+                # а имена файлов в пакете могут повторяться
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence('images', 'id')) AS id "
+                    "FROM generate_series(1, %s);",
+                    (len(images),),
+                )
+                image_ids = [row["id"] for row in cursor.fetchall()]
+                status = Database._initial_job_status()
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO images
+                        (id, filename, original_name, size, file_type, blob_sha256, job_status)
+                    VALUES %s;
+                    """,
+                    [
+                        (
+                            image_id,
+                            filenames[sha256],
+                            image.original_name,
+                            image.size,
+                            image.file_type,
+                            sha256,
+                            status,
+                        )
+                        for image_id, image, sha256 in zip(image_ids, images, sha256s)
+                    ],
+                    page_size=len(images),
+                )
+                Database._enqueue_jobs(cursor, image_ids)
+            conn.commit()
+            invalidate_images(image_ids)
+            for image_id, image, sha256 in zip(image_ids, images, sha256s):
+                image.id = image_id
+                image.filename = filenames[sha256]
+                image.blob_sha256 = sha256
+                image.job_status = status
+            log_success("Изображения сохранены в БД: %s", len(image_ids))
+            return image_ids
+        except Exception as e:
+            # Файлы убираем до отката, пока строки blob-ов ещё заблокированы
+            try:
+                for filename in placed:
+                    get_storage().delete(filename)
+                remove_temp_files()
+            except Exception as cleanup_error:
+                log_error("Ошибка удаления файлов пакета: %s", cleanup_error)
+            conn.rollback()
+            log_error("Ошибка пакетного сохранения в БД: %s", e)
+            return [None] * len(images)
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def _count_images(cursor, total_mode: str) -> Optional[int]:
+        """
+        Возвращает количество изображений выбранным способом.
+
+        Args:
+            cursor: Открытый курсор БД.
+            total_mode: 'exact' — значение счётчика, поддерживаемого триггерами;
+                'estimate' — оценка планировщика из pg_class;
+                'none' — не считать вовсе.
+
+        Returns:
+            Количество записей или None для режима 'none'.
+        """
+        if total_mode == "none":
+            return None
+        if total_mode == "estimate":
+            cursor.execute(
+                """
+                SELECT GREATEST(reltuples, 0)::bigint AS total
+                FROM pg_class WHERE oid = 'images'::regclass
+                """
+            )
+        else:
+            cursor.execute("SELECT total FROM images_stats")
+        row = cursor.fetchone()
+        return row["total"] if row else 0
+
     @staticmethod
     def get_images(
-        page: int = 1, per_page: int = Config.ITEM_PER_PAGE
-    ) -> Tuple[List[Image], int]:
+        page: int = 1, per_page: int = Config.ITEM_PER_PAGE, total_mode: str = "exact"
+    ) -> Tuple[List[Image], bool, Optional[int]]:
         """
         Получает постраничный список изображений из БД.
 
+        Страницы кэшируются в памяти процесса (cache.list_cache) до ближайшего
+        изменения каталога.
+
         Args:
             page: Номер страницы (начиная с 1).
             per_page: Количество элементов на странице.
+            total_mode: Способ подсчёта общего количества ('exact', 'estimate', 'none').
 
         Returns:
-            Кортеж, содержащий список объектов Image и общее количество записей.
+            Кортеж из списка объектов Image, признака наличия следующей страницы
+            и общего количества записей (None, если подсчёт отключён). Признак
+            определяется по лишней записи, а не по общему количеству: оценка
+            планировщика может быть сильно меньше реального числа строк.
         """
-        conn = Database.get_connection()
         try:
-            offset = (page - 1) * per_page
+            return list_cache.get_or_load(
+                ("page", page, per_page, total_mode),
+                lambda: Database._query_images(page, per_page, total_mode),
+            )
+        except PoolTimeoutError:
+            raise
+        except Exception as e:
+            log_error("Ошибка получения списка изображений: %s", e)
+            return [], False, 0
+
+    @staticmethod
+    def _query_images(
+        page: int, per_page: int, total_mode: str
+    ) -> Tuple[List[Image], bool, Optional[int]]:
+        """Выполняет запрос страницы для get_images; ошибки пробрасываются."""
+        with Database.connection() as conn:
             with conn.cursor() as cursor:
+                # Запрашиваем на одну запись больше, чтобы узнать о следующей странице
                 cursor.execute(
-                    "SELECT * FROM images ORDER BY upload_time DESC LIMIT %s OFFSET %s",
-                    (per_page, offset),
+                    """
+                    SELECT * FROM images
+                    ORDER BY upload_time DESC, id DESC
+                    LIMIT %s OFFSET %s
+                    """,
+                    (per_page + 1, (page - 1) * per_page),
                 )
                 rows = cursor.fetchall()
+                total = Database._count_images(cursor, total_mode)
+        images = [Image(**row) for row in rows[:per_page]]
+        return images, len(rows) > per_page, total
+
+    @staticmethod
+    def get_images_after(
+        after: Optional[Tuple[datetime, int]] = None,
+        per_page: int = Config.ITEM_PER_PAGE,
+        total_mode: str = "none",
+    ) -> Tuple[List[Image], bool, Optional[int]]:
+        """
+        Получает страницу изображений методом keyset-пагинации.
+
+        Вместо OFFSET выполняет поиск по индексу (upload_time, id), поэтому
+        время ответа не зависит от глубины страницы. Страницы кэшируются так же,
+        как в get_images.
 
-                cursor.execute("SELECT COUNT(*) as total FROM images")
-                total = cursor.fetchone()["total"]
+        Args:
+            after: Ключ (upload_time, id) последнего изображения предыдущей
+                страницы. None — первая страница.
+            per_page: Количество элементов на странице.
+            total_mode: Способ подсчёта общего количества ('exact', 'estimate', 'none').
 
-            images = [Image(**row) for row in rows]
-            return images, total
+        Returns:
+            Кортеж из списка объектов Image, признака наличия следующей страницы
+            и общего количества записей (None, если подсчёт отключён).
+        """
+        try:
+            return list_cache.get_or_load(
+                ("after", after, per_page, total_mode),
+                lambda: Database._query_images_after(after, per_page, total_mode),
+            )
+        except PoolTimeoutError:
+            raise
         except Exception as e:
-            conn.rollback()
-            log_error(f"Ошибка получения списка изображений: {e}")
-            return [], 0
-        finally:
-            Database.put_connection(conn)
+            log_error("Ошибка получения списка изображений: %s", e)
+            return [], False, 0
+
+    @staticmethod
+    def _query_images_after(
+        after: Optional[Tuple[datetime, int]], per_page: int, total_mode: str
+    ) -> Tuple[List[Image], bool, Optional[int]]:
+        """Выполняет запрос страницы для get_images_after; ошибки пробрасываются."""
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                # Запрашиваем на одну запись больше, чтобы узнать о следующей странице
+                if after is None:
+                    cursor.execute(
+                        """
+                        SELECT * FROM images
+                        ORDER BY upload_time DESC, id DESC
+                        LIMIT %s
+                        """,
+                        (per_page + 1,),
+                    )
+                else:
+                    cursor.execute(
+                        """
+                        SELECT * FROM images
+                        WHERE (upload_time, id) < (%s, %s)
+                        ORDER BY upload_time DESC, id DESC
+                        LIMIT %s
+                        """,
+                        (after[0], after[1], per_page + 1),
+                    )
+                rows = cursor.fetchall()
+                total = Database._count_images(cursor, total_mode)
+        images = [Image(**row) for row in rows[:per_page]]
+        return images, len(rows) > per_page, total
+
+    @staticmethod
+    def get_image(image_id: int) -> Optional[Image]:
+        """
+        Возвращает метаданные изображения по ID.
+
+        Найденные записи кэшируются в памяти процесса (cache.image_cache) и
+        сбрасываются при изменении или удалении записи в любом процессе.
+
+        Args:
+            image_id: ID изображения.
+
+        Returns:
+            Объект Image или None, если изображение не найдено или произошла ошибка.
+        """
+
+        def load() -> Image:
+            with Database.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT * FROM images WHERE id = %s", (image_id,))
+                    row = cursor.fetchone()
+            if not row:
+                # Отсутствие записи не кэшируется: она может появиться позже
+                raise LookupError(image_id)
+            return Image(**row)
+
+        try:
+            return image_cache.get_or_load(image_id, load)
+        except LookupError:
+            return None
+        except PoolTimeoutError:
+            raise
+        except Exception as e:
+            log_error("Ошибка получения изображения %s: %s", image_id, e)
+            return None
 
     @staticmethod
     def get_random() -> Optional[Image]:
@@ -189,18 +896,89 @@ class Database:
         Returns:
             Объект Image или None, если таблица пуста.
         """
+        images = Database.get_random_images(1)
+        return images[0] if images else None
+
+    @staticmethod
+    def get_random_images(count: int = 1) -> List[Image]:
+        """
+        Возвращает несколько случайных изображений без сортировки всей таблицы.
+
+        Выбирает случайные ID из диапазона [min(id), max(id)] и проверяет их
+        одним запросом по первичному ключу. Количество кандидатов подбирается
+        по плотности ID (счётчик images_stats / ширина диапазона), промахи
+        в «дырах» после удалений добираются повторными попытками. Если
+        попытки исчерпаны, недостающее добирается сканом по индексу от
+        случайной точки.
+
+        Args:
+            count: Требуемое количество изображений.
+
+        Returns:
+            Список объектов Image (может быть короче count, если записей меньше).
+        """
         conn = Database.get_connection()
         try:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM images ORDER BY random() LIMIT 1;")
-                row = cursor.fetchone()
-                if not row:
-                    return None
-                return Image(**row)
+                cursor.execute(
+                    """
+                    SELECT min(id) AS lo, max(id) AS hi,
+                           (SELECT total FROM images_stats) AS total
+                    FROM images
+                    """
+                )
+                bounds = cursor.fetchone()
+                if not bounds or bounds["lo"] is None:
+                    return []
+
+                lo, hi = bounds["lo"], bounds["hi"]
+                span = hi - lo + 1
+                total = bounds["total"] or span
+                wanted = min(count, total)
+                density = max(min(total / span, 1.0), 0.01)
+
+                found = {}
+                for _ in range(Config.RANDOM_PROBE_ATTEMPTS):
+                    missing = wanted - len(found)
+                    if missing <= 0:
+                        break
+                    sample_size = min(
+                        span,
+                        Config.RANDOM_MAX_CANDIDATES,
+                        math.ceil(missing / density * 1.5),
+                    )
+                    candidates = random.sample(range(lo, hi + 1), sample_size)
+                    cursor.execute(
+                        "SELECT * FROM images WHERE id = ANY(%s)", (candidates,)
+                    )
+                    for row in cursor.fetchall():
+                        found[row["id"]] = row
+
+                missing = wanted - len(found)
+                if missing > 0:
+                    start = random.randint(lo, hi)
+                    cursor.execute(
+                        """
+                        (SELECT * FROM images
+                         WHERE id >= %s AND NOT (id = ANY(%s))
+                         ORDER BY id LIMIT %s)
+                        UNION ALL
+                        (SELECT * FROM images
+                         WHERE id < %s AND NOT (id = ANY(%s))
+                         ORDER BY id LIMIT %s)
+                        """,
+                        (start, list(found), missing, start, list(found), missing),
+                    )
+                    for row in cursor.fetchall()[:missing]:
+                        found[row["id"]] = row
+
+            rows = list(found.values())
+            random.shuffle(rows)
+            return [Image(**row) for row in rows[:count]]
         except Exception as e:
             conn.rollback()
-            log_error(f"Ошибка получения случайного изображения: {e}")
-            return None
+            log_error("Ошибка получения случайного изображения: %s", e)
+            return []
         finally:
             Database.put_connection(conn)
 
@@ -209,31 +987,517 @@ class Database:
         """
         Удаляет запись об изображении из БД по ID.
 
+        В режиме контентно-адресуемого хранения уменьшает счётчик ссылок
+        blob-а. Когда он доходит до нуля, blob удаляется, а его файл — после
+        фиксации транзакции (_delete_blob_files); иначе файл остаётся.
+
         Args:
             image_id: ID изображения для удаления.
 
         Returns:
-            Кортеж (True, filename), если удаление успешно.
+            Кортеж (True, filename), если удаление успешно; filename равен None,
+            если файл удалять не нужно (он используется другими записями или
+            уже удалён вместе с blob-ом).
             Кортеж (False, None), если изображение не найдено или произошла ошибка.
         """
         conn = Database.get_connection()
         try:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT filename FROM images WHERE id = %s;", (image_id,)
+                    "DELETE FROM images WHERE id = %s RETURNING filename, blob_sha256;",
+                    (image_id,),
                 )
                 row = cursor.fetchone()
                 if not row:
+                    conn.rollback()
                     return False, None
 
                 filename = row["filename"]
-                cursor.execute("DELETE FROM images WHERE id = %s;", (image_id,))
+                freed = []
+                if row["blob_sha256"]:
+                    freed = Database._release_blobs(cursor, {row["blob_sha256"]: 1})
+                    filename = None
             conn.commit()
-            log_success(f"Изображение удалено из БД: {filename}")
+            Database._delete_blob_files(conn, freed)
+            invalidate_images([image_id])
+            log_success("Изображение удалено из БД: %s", row["filename"])
             return True, filename
         except Exception as e:
             conn.rollback()
-            log_error(f"Ошибка удаления из БД: {e}")
+            log_error("Ошибка удаления из БД: %s", e)
             return False, None
         finally:
             Database.put_connection(conn)
+
+    @staticmethod
+    def delete_images_db(
+        ids: Optional[List[int]] = None,
+        uploaded_before: Optional[datetime] = None,
+        file_type: Optional[str] = None,
+        limit: int = Config.MAX_BULK_DELETE,
+    ) -> Tuple[bool, List[int], List[str], bool]:
+        """
+        Удаляет несколько записей одним запросом DELETE ... RETURNING.
+
+        Записи выбираются по списку ID и/или по фильтру; условия
+        объединяются через AND. За один вызов удаляется не более limit записей;
+        если удалено ровно limit, в той же транзакции проверяется, остались ли
+        подходящие записи.
+
+        Args:
+            ids: Список ID изображений.
+            uploaded_before: Удалить загруженные раньше этого момента.
+            file_type: Удалить только файлы этого типа (например, 'gif').
+            limit: Максимальное количество удаляемых записей.
+
+        Returns:
+            Кортеж (True, удалённые_ID, имена_файлов_для_удаления,
+            остались_ли_подходящие_записи). В режиме контентно-адресуемого
+            хранения файлы освободившихся blob-ов удаляются сразу после
+            фиксации транзакции, и список имён пуст.
+            Кортеж (False, [], [], False), если произошла ошибка.
+        """
+        conditions = []
+        params: List[Any] = []
+        if ids is not None:
+            conditions.append("id = ANY(%s)")
+            params.append(ids)
+        if uploaded_before is not None:
+            conditions.append("upload_time < %s")
+            params.append(uploaded_before)
+        if file_type is not None:
+            conditions.append("file_type = %s")
+            params.append(file_type)
+        if not conditions:
+            return False, [], [], False
+
+        conn = Database.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    DELETE FROM images
+                    WHERE id IN (
+                        SELECT id FROM images
+                        WHERE {" AND ".join(conditions)}
+                        LIMIT %s
+                    )
+                    RETURNING id, filename, blob_sha256;
+                    """,
+                    (*params, limit),
+                )
+                rows = cursor.fetchall()
+
+                has_more = False
+                if len(rows) >= limit:
+                    cursor.execute(
+                        f"""
+                        SELECT EXISTS (
+                            SELECT 1 FROM images WHERE {" AND ".join(conditions)}
+                        ) AS has_more;
+                        """,
+                        params,
+                    )
+                    has_more = cursor.fetchone()["has_more"]
+
+                filenames = []
+                freed: List[Tuple[str, str]] = []
+                released: Dict[str, int] = {}
+                for row in rows:
+                    if row["blob_sha256"]:
+                        sha256 = row["blob_sha256"]
+                        released[sha256] = released.get(sha256, 0) + 1
+                    else:
+                        filenames.append(row["filename"])
+                if released:
+                    freed = Database._release_blobs(cursor, released)
+            conn.commit()
+            Database._delete_blob_files(conn, freed)
+            invalidate_images([row["id"] for row in rows])
+            log_success("Изображения удалены из БД: %s", len(rows))
+            return True, [row["id"] for row in rows], filenames, has_more
+        except Exception as e:
+            conn.rollback()
+            log_error("Ошибка массового удаления из БД: %s", e)
+            return False, [], [], False
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def _release_blobs(cursor, references: Dict[str, int]) -> List[Tuple[str, str]]:
+        """
+        Уменьшает счётчики ссылок blob-ов и удаляет те, на которые ссылок не осталось.
+
+        Файлы не трогаются: транзакция удаления записей держит блокировку
+        строки images_stats (триггеры каталога), и операции с диском или S3
+        задерживали бы все загрузки и удаления. Файлы удаляет
+        _delete_blob_files после фиксации.
+
+        Args:
+            cursor: Открытый курсор БД внутри транзакции удаления.
+            references: На сколько уменьшить счётчик ссылок каждого blob-а (по SHA-256).
+
+        Returns:
+            Пары (SHA-256, имя_файла) освободившихся blob-ов.
+        """
+        cursor.execute(
+            """
+            UPDATE blobs SET refcount = blobs.refcount - released.count
+            FROM unnest(%s::text[], %s::integer[]) AS released(sha256, count)
+            WHERE blobs.sha256 = released.sha256
+            RETURNING blobs.sha256, blobs.filename, blobs.refcount;
+            """,
+            (list(references), list(references.values())),
+        )
+        freed = [blob for blob in cursor.fetchall() if blob["refcount"] <= 0]
+        if freed:
+            cursor.execute(
+                "DELETE FROM blobs WHERE sha256 = ANY(%s);",
+                ([blob["sha256"] for blob in freed],),
+            )
+        return [(blob["sha256"], blob["filename"]) for blob in freed]
+
+    @staticmethod
+    def _lock_blobs(cursor, sha256s: List[str]) -> None:
+        """
+        Берёт advisory-блокировки содержимого до конца транзакции.
+
+        Блокировки сериализуют размещение файла нового blob-а и удаление файла
+        освободившегося blob-а с тем же SHA-256. Берутся в порядке SHA-256,
+        чтобы параллельные транзакции не взаимоблокировались.
+        """
+        cursor.execute(
+            """
+            SELECT pg_advisory_xact_lock(%s, hashtext(sha256))
+            FROM unnest(%s::text[]) AS sha256;
+            """,
+            (BLOB_LOCK_ID, sorted(set(sha256s))),
+        )
+
+    @staticmethod
+    def _delete_blob_files(conn, freed: List[Tuple[str, str]]) -> None:
+        """
+        Удаляет файлы blob-ов, освобождённых уже зафиксированной транзакцией.
+
+        Выполняется в отдельной короткой транзакции того же соединения, под
+        блокировками _lock_blobs. Если параллельная загрузка уже создала blob
+        с тем же файлом заново, файл остаётся. Ошибки только записываются в
+        лог: записи уже удалены, а оставшиеся файлы найдёт reconcile.py.
+
+        Args:
+            conn: Соединение после фиксации транзакции удаления.
+            freed: Пары (SHA-256, имя_файла) из _release_blobs.
+        """
+        if not freed:
+            return
+        try:
+            with conn.cursor() as cursor:
+                Database._lock_blobs(cursor, [sha256 for sha256, _ in freed])
+                cursor.execute(
+                    "SELECT filename FROM blobs WHERE filename = ANY(%s);",
+                    ([filename for _, filename in freed],),
+                )
+                recreated = {row["filename"] for row in cursor.fetchall()}
+                delete_files(
+                    [filename for _, filename in freed if filename not in recreated]
+                )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log_error("Ошибка удаления файлов освободившихся blob-ов: %s", e)
+
+    @staticmethod
+    def iter_stored_files(
+        shard_depth: int = Config.STORAGE_SHARD_DEPTH,
+        fetch_size: int = Config.RECONCILE_FETCH_SIZE,
+    ) -> Iterator[Tuple[str, str, Optional[int]]]:
+        """
+        Потоково отдаёт все имена файлов, на которые ссылаются images и blobs.
+
+        Строки читаются серверным (именованным) курсором порциями по
+        fetch_size, поэтому память не зависит от размера таблиц. Порядок
+        совпадает с обходом шардированной раскладки на диске: по ключу шарда
+        (первые 2 * shard_depth символа имени в нижнем регистре, пустой для
+        коротких имён), затем по имени; сравнение побайтовое (COLLATE "C").
+        Одно имя может встретиться несколько раз подряд (images и blobs
+        в режиме контентно-адресуемого хранения).
+
+        Args:
+            shard_depth: Глубина шардирования (Config.STORAGE_SHARD_DEPTH).
+            fetch_size: Строк в одной порции серверного курсора.
+
+        Yields:
+            Кортежи (ключ_шарда, имя_файла, id_изображения); у blob-ов id — None.
+        """
+        prefix = max(shard_depth, 0) * 2
+        shard_key = (
+            f"CASE WHEN length(filename) >= {prefix} "
+            f"THEN lower(left(filename, {prefix})) COLLATE \"C\" ELSE '' END"
+            if prefix
+            else "''"
+        )
+        with Database.connection() as conn:
+            try:
+                # Кортежи вместо RealDictRow: на миллионах строк заметно быстрее
+                with conn.cursor(
+                    name="iter_stored_files", cursor_factory=psycopg2.extensions.cursor
+                ) as cursor:
+                    cursor.itersize = fetch_size
+                    cursor.execute(
+                        f"""
+                        SELECT {shard_key} AS shard, filename, id FROM (
+                            SELECT filename, id FROM images
+                            UNION ALL
+                            SELECT filename, NULL FROM blobs
+                        ) AS stored
+                        ORDER BY shard, filename COLLATE "C";
+                        """
+                    )
+                    yield from cursor
+            finally:
+                conn.rollback()
+
+    @staticmethod
+    def find_stored_filenames(filenames: List[str]) -> List[str]:
+        """
+        Возвращает те из имён, на которые ссылается запись images или blobs.
+
+        Args:
+            filenames: Проверяемые имена файлов.
+        """
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT filename FROM images WHERE filename = ANY(%s)
+                    UNION
+                    SELECT filename FROM blobs WHERE filename = ANY(%s);
+                    """,
+                    (filenames, filenames),
+                )
+                rows = cursor.fetchall()
+            conn.commit()
+        return [row["filename"] for row in rows]
+
+    @staticmethod
+    def count_stored_files() -> int:
+        """
+        Возвращает число файлов оригиналов в хранилище по данным БД.
+
+        Каждая запись images без blob-а хранит свой файл, записи с blob-ом
+        делят файл blob-а (их число — сумма refcount). Общее число записей
+        берётся из счётчика images_stats, поэтому запрос не зависит от размера
+        images; таблица blobs агрегируется целиком, но в ней не больше строк,
+        чем уникальных файлов.
+        """
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT (SELECT total FROM images_stats)
+                           - COALESCE(SUM(refcount), 0) + COUNT(*) AS files
+                    FROM blobs;
+                    """
+                )
+                row = cursor.fetchone()
+            conn.commit()
+        return row["files"] or 0
+
+    @staticmethod
+    def get_optimization(filename: str) -> Optional[Tuple[int, List[str]]]:
+        """
+        Возвращает записанный результат оптимизации файла.
+
+        Args:
+            filename: Имя файла изображения.
+
+        Returns:
+            Кортеж (сэкономлено_байт, форматы_вариантов) или None, если
+            файл ещё не оптимизирован.
+        """
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT bytes_saved, variants FROM images
+                    WHERE filename = %s AND bytes_saved IS NOT NULL
+                    LIMIT 1;
+                    """,
+                    (filename,),
+                )
+                row = cursor.fetchone()
+            conn.commit()
+        return (row["bytes_saved"], row["variants"] or []) if row else None
+
+    @staticmethod
+    def record_optimization(
+        filename: str, bytes_saved: int, variants: List[str]
+    ) -> None:
+        """
+        Записывает результат оптимизации всем записям с этим файлом.
+
+        В режиме контентно-адресуемого хранения на один файл ссылаются
+        несколько записей.
+
+        Args:
+            filename: Имя файла изображения.
+            bytes_saved: Разница в байтах между оригиналом и самым
+                компактным вариантом.
+            variants: Форматы созданных вариантов в порядке отдачи.
+        """
+        with Database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE images SET bytes_saved = %s, variants = %s
+                    WHERE filename = %s
+                      AND (bytes_saved, variants) IS DISTINCT FROM (%s, %s)
+                    RETURNING id;
+                    """,
+                    (bytes_saved, variants, filename, bytes_saved, variants),
+                )
+                ids = [row["id"] for row in cursor.fetchall()]
+            conn.commit()
+        if ids:
+            invalidate_images(ids)
+
+    @staticmethod
+    def claim_job() -> Optional[Dict[str, Any]]:
+        """
+        Забирает одну готовую к выполнению задачу из очереди.
+
+        Использует SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько
+        воркеров не блокируют друг друга и не получают одну задачу дважды.
+        Задачи, зависшие в статусе 'running' дольше Config.JOB_LOCK_TIMEOUT
+        (например, после падения воркера), забираются повторно, пока не
+        исчерпано max_attempts. Зависшие задачи без оставшихся попыток
+        помечаются 'failed': иначе задача, которая убивает процесс воркера,
+        выполнялась бы бесконечно.
+
+        Returns:
+            Словарь с полями задачи и именем файла изображения или None.
+        """
+        conn = Database.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE jobs
+                    SET status = 'failed', locked_at = NULL, updated_at = now(),
+                        last_error = 'Воркер не завершил задачу за отведённое время'
+                    WHERE id IN (
+                        SELECT id FROM jobs
+                        WHERE status = 'running'
+                          AND locked_at < now() - %s * interval '1 second'
+                          AND attempts >= max_attempts
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING image_id;
+                    """,
+                    (Config.JOB_LOCK_TIMEOUT,),
+                )
+                failed_ids = [row["image_id"] for row in cursor.fetchall()]
+                if failed_ids:
+                    Database._refresh_job_status(cursor, failed_ids)
+                cursor.execute(
+                    """
+                    UPDATE jobs
+                    SET status = 'running', attempts = attempts + 1,
+                        locked_at = now(), updated_at = now()
+                    WHERE id = (
+                        SELECT id FROM jobs
+                        WHERE (status = 'pending' AND run_at <= now())
+                           OR (status = 'running'
+                               AND locked_at < now() - %s * interval '1 second'
+                               AND attempts < max_attempts)
+                        ORDER BY run_at
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, image_id, kind, attempts, max_attempts,
+                        (SELECT filename FROM images WHERE images.id = jobs.image_id)
+                        AS filename;
+                    """,
+                    (Config.JOB_LOCK_TIMEOUT,),
+                )
+                job = cursor.fetchone()
+            conn.commit()
+            if failed_ids:
+                invalidate_images(failed_ids)
+                log_error("Зависшие задачи исчерпали попытки: %s", len(failed_ids))
+            return dict(job) if job else None
+        except Exception as e:
+            conn.rollback()
+            log_error("Ошибка получения задачи из очереди: %s", e)
+            return None
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def finish_job(job: Dict[str, Any], error: Optional[str] = None) -> None:
+        """
+        Фиксирует результат выполнения задачи.
+
+        При ошибке задача возвращается в очередь с экспоненциальной задержкой,
+        пока не исчерпано max_attempts, после чего помечается 'failed'.
+        Статус обработки изображения пересчитывается по всем его задачам.
+
+        Args:
+            job: Задача, полученная из claim_job.
+            error: Текст ошибки или None при успешном выполнении.
+        """
+        if error is None:
+            status, delay = "done", 0
+        elif job["attempts"] >= job["max_attempts"]:
+            status, delay = "failed", 0
+        else:
+            status = "pending"
+            delay = min(
+                Config.JOB_RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1),
+                Config.JOB_RETRY_MAX_DELAY,
+            )
+
+        conn = Database.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE jobs
+                    SET status = %s, last_error = %s, locked_at = NULL,
+                        run_at = now() + %s * interval '1 second', updated_at = now()
+                    WHERE id = %s;
+                    """,
+                    (status, error, delay, job["id"]),
+                )
+                Database._refresh_job_status(cursor, [job["image_id"]])
+            conn.commit()
+            invalidate_images([job["image_id"]])
+        except Exception as e:
+            conn.rollback()
+            log_error("Ошибка сохранения результата задачи %s: %s", job["id"], e)
+        finally:
+            Database.put_connection(conn)
+
+    @staticmethod
+    def _refresh_job_status(cursor, image_ids: List[int]) -> None:
+        """
+        Пересчитывает статус обработки изображений по всем их задачам.
+
+        Args:
+            cursor: Открытый курсор БД внутри транзакции.
+            image_ids: ID изображений.
+        """
+        cursor.execute(
+            """
+            UPDATE images SET job_status = (
+                SELECT CASE
+                    WHEN bool_or(status IN ('pending', 'running')) THEN 'pending'
+                    WHEN bool_or(status = 'failed') THEN 'failed'
+                    ELSE 'done'
+                END
+                FROM jobs WHERE jobs.image_id = images.id
+            )
+            WHERE id = ANY(%s);
+            """,
+            (image_ids,),
+        )
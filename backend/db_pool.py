@@ -0,0 +1,239 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from utils import log_error
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений PostgreSQL с ограниченным ожиданием.
+
+    В отличие от psycopg2.pool.SimpleConnectionPool:
+    - может использоваться из нескольких потоков одновременно;
+    - при исчерпании пула ждёт освобождения соединения не дольше timeout
+      и выбрасывает PoolTimeoutError вместо бесконечных повторов;
+    - проверяет соединение при выдаче, если оно долго простаивало, и
+      заменяет разорванные соединения новыми;
+    - откатывает незавершённые транзакции при возврате соединения;
+    - собирает статистику: занятые и свободные соединения, ожидающие
+      потоки, гистограмму времени ожидания.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int,
+        max_size: int,
+        timeout: float,
+        healthcheck_idle: float,
+        wait_buckets: Sequence[float],
+        **connect_kwargs: Any,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+
+        self._wait_buckets: List[float] = sorted(wait_buckets)
+        self._wait_counts: List[int] = [0] * (len(self._wait_buckets) + 1)
+        self._wait_sum = 0.0
+        self._acquired_total = 0
+        self._timeouts_total = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        """Открывает новое соединение с БД."""
+        return psycopg2.connect(self.dsn, **self._connect_kwargs)
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        """Проверяет соединение; долго простаивавшие проверяются запросом SELECT 1."""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Выдаёт соединение из пула.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах (по умолчанию
+                значение, заданное при создании пула).
+
+        Returns:
+            Соединение с БД.
+
+        Raises:
+            PoolTimeoutError: Если свободное соединение не появилось за timeout.
+            psycopg2.OperationalError: Если не удалось открыть новое соединение.
+        """
+        started = time.monotonic()
+        deadline = started + (self.timeout if timeout is None else timeout)
+        conn = None
+        last_used = 0.0
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Пул соединений закрыт")
+                if self._idle:
+                    # LIFO: последнее возвращённое соединение «теплее» остальных
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts_total += 1
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений с БД (ожидание {time.monotonic() - started:.2f} с)"
+                    )
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._in_use += 1
+
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._close_quietly(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        self._record_wait(time.monotonic() - started)
+        return conn
+
+    def release(self, conn) -> None:
+        """
+        Возвращает соединение в пул.
+
+        Незавершённая транзакция откатывается; разорванное соединение
+        закрывается, а его место в пуле освобождается.
+
+        Args:
+            conn: Соединение, полученное через acquire.
+        """
+        healthy = not conn.closed
+        if (
+            healthy
+            and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+        if not healthy or self._closed:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """Контекстный менеджер: выдаёт соединение и всегда возвращает его в пул."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        """Закрывает все свободные соединения; занятые закроются при возврате."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает текущую статистику пула.
+
+        Returns:
+            Словарь с размерами пула, счётчиками и гистограммой времени
+            ожидания соединения (накопительные значения по границам в секундах).
+        """
+        with self._cond:
+            cumulative = []
+            total = 0
+            for bound, count in zip(self._wait_buckets, self._wait_counts):
+                total += count
+                cumulative.append([bound, total])
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "acquired_total": self._acquired_total,
+                "timeouts_total": self._timeouts_total,
+                "wait_seconds_sum": round(self._wait_sum, 6),
+                "wait_seconds_buckets": cumulative,
+            }
+
+    def _record_wait(self, waited: float) -> None:
+        """Учитывает время ожидания соединения в гистограмме."""
+        index = len(self._wait_buckets)
+        for i, bound in enumerate(self._wait_buckets):
+            if waited <= bound:
+                index = i
+                break
+        with self._cond:
+            self._acquired_total += 1
+            self._wait_sum += waited
+            self._wait_counts[index] += 1
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        """Закрывает соединение, игнорируя ошибки."""
+        try:
+            conn.close()
+        except Exception as e:
+            log_error("Ошибка закрытия соединения с БД: %s", e)
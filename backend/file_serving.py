@@ -0,0 +1,147 @@
+"""
+Отдача файлов из локального хранилища через Flask без Nginx перед ним.
+
+Поддерживаются условные запросы (ETag/If-None-Match, If-Modified-Since),
+диапазоны байт (Range/If-Range) и два способа передать тело:
+
+* X-Accel-Redirect — backend отвечает только заголовками, а файл отдаёт
+  Nginx из internal-локации '<Config.ACCEL_REDIRECT_PREFIX>/<каталог>/';
+* wsgi.file_wrapper — gunicorn передаёт файл в сокет через os.sendfile,
+  без копирования в Python (с нужного смещения и не больше Content-Length).
+  Серверы без wsgi.file_wrapper (dev-сервер Flask) получают тело кусками.
+"""
+
+import mimetypes
+import os
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, Optional
+
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import ClosingIterator
+
+from config import Config
+
+# Размер куска при чтении файла без wsgi.file_wrapper
+CHUNK_SIZE = 256 * 1024
+
+
+def _use_accel() -> bool:
+    """Проверяет, нужно ли отдать файл через X-Accel-Redirect."""
+    if Config.FILE_SERVE_MODE == "accel":
+        return True
+    if Config.FILE_SERVE_MODE == "auto":
+        # Nginx сообщает, что умеет X-Accel-Redirect (соглашение Rack::Sendfile)
+        sendfile_type = request.headers.get("X-Sendfile-Type", "")
+        return sendfile_type.lower() == "x-accel-redirect"
+    return False
+
+
+def _read_range(file: BinaryIO, length: int) -> Iterator[bytes]:
+    """Читает length байт файла с текущей позиции кусками по CHUNK_SIZE."""
+    while length > 0:
+        chunk = file.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            return
+        length -= len(chunk)
+        yield chunk
+
+
+def _if_range_matches(etag: str, modified: datetime) -> bool:
+    """
+    Проверяет If-Range: диапазон отдаётся, только если файл не изменился.
+
+    ETag сравнивается строго, дата — с точностью до секунды (RFC 9110).
+    """
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date == modified
+    return True
+
+
+def send_stored_file(
+    root: str,
+    relpath: str,
+    cache_control: str,
+    etag: Optional[str] = None,
+) -> Response:
+    """
+    Формирует ответ с файлом root/relpath.
+
+    Args:
+        root: Каталог хранилища (Config.UPLOAD_FOLDER или Config.THUMBS_FOLDER).
+        relpath: Путь файла относительно root.
+        cache_control: Значение заголовка Cache-Control.
+        etag: Сильный ETag. Для неизменяемых файлов удобно передать имя файла;
+            по умолчанию строится из времени изменения и размера.
+
+    Returns:
+        Ответ 200, 206 (диапазон), 304 (не изменился) или 416 (диапазон вне
+        файла); при X-Accel-Redirect — ответ без тела для Nginx.
+
+    Raises:
+        FileNotFoundError: Если файла нет.
+    """
+    path = os.path.join(root, relpath)
+    mimetype = mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+
+    if _use_accel():
+        # Nginx сам обработает Range и условные заголовки; из ответа backend
+        # он сохранит Content-Type и Cache-Control
+        response = Response(mimetype=mimetype)
+        response.headers["Cache-Control"] = cache_control
+        response.headers["X-Accel-Redirect"] = (
+            f"{Config.ACCEL_REDIRECT_PREFIX}/{os.path.basename(root)}/{relpath}"
+        )
+        return response
+
+    stat = os.stat(path)
+    size = stat.st_size
+    if etag is None:
+        etag = f"{stat.st_mtime_ns:x}-{size:x}"
+
+    response = Response(mimetype=mimetype)
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Accept-Ranges"] = "bytes"
+    # HTTP-даты точны до секунды
+    modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    response.set_etag(etag)
+    response.last_modified = modified
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        response.status_code = 304
+        return response
+
+    start, end = 0, size
+    file_range = request.range
+    if (
+        file_range is not None
+        and file_range.units == "bytes"
+        and len(file_range.ranges) == 1
+        and _if_range_matches(etag, modified)
+    ):
+        bounds = file_range.range_for_length(size)
+        if bounds is None:
+            response.status_code = 416
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        start, end = bounds
+        response.status_code = 206
+        response.headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    file = open(path, "rb")
+    # HEAD и прочие ответы без тела закрывают файл через Response.close
+    response.call_on_close(file.close)
+    file.seek(start)
+    # При direct_passthrough объект уходит WSGI-серверу как есть: gunicorn
+    # узнаёт свой wsgi.file_wrapper и передаёт файл через os.sendfile
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None:
+        response.response = file_wrapper(file, CHUNK_SIZE)
+    else:
+        response.response = ClosingIterator(_read_range(file, end - start), file.close)
+    response.direct_passthrough = True
+    response.content_length = end - start
+    return response
@@ -0,0 +1,84 @@
+"""
+Конфигурация gunicorn для production-запуска:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Приложение загружается в каждом воркере уже после fork (preload_app = False),
+поэтому у каждого процесса свой пул соединений с БД и свой пул рендеринга
+вариантов изображений. Это же позволяет делать плавную перезагрузку кода:
+по SIGHUP мастер запускает новые воркеры и дожидается завершения старых.
+По SIGTERM воркеры перестают принимать соединения и дорабатывают текущие
+запросы в течение graceful_timeout.
+
+Схему БД мастер обновляет один раз при запуске (on_starting): ALTER TABLE
+и CREATE TRIGGER берут эксклюзивную блокировку images даже без изменений,
+и при перезапуске воркера (max_requests) ожидание этой блокировки за долгим
+читателем остановило бы все запросы к images.
+"""
+
+import multiprocessing
+import sys
+
+from catalog import catalog
+from config import Config
+from database import Database
+from metrics import flush as flush_metrics, reset_shared as reset_metrics
+from utils import stop_logging
+
+bind = Config.WEB_BIND
+# Каждый воркер держит до DB_POOL_MAX_SIZE соединений пула и одно соединение
+# слушателя изменений каталога (CATALOG_LISTEN)
+connections_per_worker = Config.DB_POOL_MAX_SIZE + int(Config.CATALOG_LISTEN)
+workers = Config.WEB_CONCURRENCY or max(
+    1,
+    min(
+        multiprocessing.cpu_count() * 2 + 1,
+        Config.DB_CONNECTION_BUDGET // connections_per_worker,
+    ),
+)
+if workers * connections_per_worker > Config.DB_CONNECTION_BUDGET:
+    print(
+        f"Внимание: {workers} воркеров × {connections_per_worker} соединений "
+        f"превышают DB_CONNECTION_BUDGET={Config.DB_CONNECTION_BUDGET}",
+        file=sys.stderr,
+    )
+# Потоки внутри воркера: медленные загрузки и отдача файлов не блокируют процесс.
+# Пул соединений с БД должен быть не меньше числа потоков (DB_POOL_MAX_SIZE).
+worker_class = "gthread"
+threads = Config.WEB_THREADS
+preload_app = False
+
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+keepalive = 5
+
+# Периодический перезапуск воркеров ограничивает рост памяти; разброс не даёт
+# всем воркерам перезапуститься одновременно.
+max_requests = Config.WEB_MAX_REQUESTS
+max_requests_jitter = Config.WEB_MAX_REQUESTS // 10
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """
+    Очищает снимки метрик воркеров предыдущего запуска (METRICS_DIR)
+    и обновляет схему БД до запуска воркеров.
+    """
+    reset_metrics()
+    Database.init_pool(1, 2)
+    Database.init_db()
+    # Соединения мастера не должны достаться воркерам после fork
+    Database.close_pool()
+
+
+def worker_exit(server, worker):
+    """
+    Сохраняет последний снимок метрик, останавливает слушателя изменений
+    каталога, закрывает соединения с БД и дописывает очередь логов.
+    """
+    flush_metrics()
+    catalog.stop()
+    Database.close_pool()
+    stop_logging()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+from typing import Callable, Dict
+
+from config import Config
+from database import Database
+from optimizer import recompress, render_webp
+from storage import get_storage, optimized_filename, optimized_formats, thumb_relpath
+from thumbnails import render_thumbnail
+from utils import TEMP_FILE_PREFIX
+
+
+def generate_thumbnails(filename: str) -> None:
+    """
+    Заранее создаёт варианты Config.JOB_THUMB_WIDTHS для нового изображения.
+
+    Args:
+        filename: Имя файла изображения.
+
+    Raises:
+        FileNotFoundError: Если исходный файл не найден.
+    """
+    missing = []
+    for width in Config.JOB_THUMB_WIDTHS:
+        target_path = os.path.join(
+            Config.THUMBS_FOLDER, thumb_relpath(filename, width, "webp")
+        )
+        if not os.path.exists(target_path):
+            missing.append((width, target_path))
+    if not missing:
+        return
+
+    with get_storage().fetch(filename) as source_path:
+        for width, target_path in missing:
+            render_thumbnail(source_path, target_path, width, "webp")
+
+
+def optimize_image(filename: str) -> None:
+    """
+    Создаёт оптимизированные варианты исходного файла и записывает экономию.
+
+    Сначала файл пережимается в исходном формате (optimizer.recompress),
+    затем создаётся WebP. Вариант сохраняется в хранилище рядом с оригиналом,
+    только если он меньше всех предыдущих, поэтому первый существующий
+    из optimized_formats() и оригинала — самый маленький из тех, что
+    принимает клиент. Разница между оригиналом и самым маленьким вариантом
+    записывается в images.bytes_saved, форматы созданных вариантов — в
+    images.variants; после этого API отдаёт optimized_url вместо оригинала.
+
+    Args:
+        filename: Имя файла изображения.
+
+    Raises:
+        FileNotFoundError: Если исходный файл не найден.
+    """
+    # В режиме контентно-адресуемого хранения файл мог уже обработать
+    # задача другой записи с тем же содержимым
+    optimization = Database.get_optimization(filename)
+    if optimization is not None:
+        Database.record_optimization(filename, *optimization)
+        return
+
+    renderers = {"webp": render_webp}
+    storage = get_storage()
+    with storage.fetch(filename) as source_path:
+        original_size = os.path.getsize(source_path)
+        best_size = original_size
+        stored = set()
+        for fmt in reversed(optimized_formats(filename)):
+            render = renderers.get(fmt, recompress)
+            fd, temp_path = tempfile.mkstemp(
+                prefix=TEMP_FILE_PREFIX, dir=Config.UPLOAD_FOLDER
+            )
+            os.close(fd)
+            try:
+                if not render(source_path, temp_path):
+                    continue
+                size = os.path.getsize(temp_path)
+                if size >= best_size:
+                    continue
+                # mkstemp создаёт файл с правами 0600, а его должен читать Nginx
+                os.chmod(temp_path, 0o644)
+                storage.place(temp_path, optimized_filename(filename, fmt))
+                best_size = size
+                stored.add(fmt)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    variants = [fmt for fmt in optimized_formats(filename) if fmt in stored]
+    Database.record_optimization(filename, original_size - best_size, variants)
+
+
+# Обработчики задач по значению jobs.kind; принимают имя файла изображения
+JOB_HANDLERS: Dict[str, Callable[[str], None]] = {
+    "thumbnails": generate_thumbnails,
+    "optimize": optimize_image,
+}
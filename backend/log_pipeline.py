@@ -0,0 +1,195 @@
+"""
+Составные части неблокирующего логирования (см. utils.setup_logging).
+
+Потоки запросов только кладут запись в очередь (QueueHandler); форматирование
+и запись в файл выполняет отдельный поток QueueListener. Файл поворачивается
+по размеру или по времени; в него одновременно пишут несколько процессов
+(воркеры gunicorn и worker.py), поэтому поворот выполняется под файловой
+блокировкой, а остальные процессы переоткрывают уже повёрнутый файл.
+"""
+
+import contextvars
+import fcntl
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+import uuid
+from typing import Optional, Tuple
+
+from flask import Flask, g, request
+
+from config import Config
+
+# (ID запроса, время начала по perf_counter) текущего запроса
+_request_context: contextvars.ContextVar[Optional[Tuple[str, float]]] = (
+    contextvars.ContextVar("request_context", default=None)
+)
+
+
+def bind_request(request_id: Optional[str]) -> Tuple[str, contextvars.Token]:
+    """
+    Привязывает ID запроса к текущему контексту выполнения.
+
+    Args:
+        request_id: ID из заголовка запроса; если не передан или слишком
+            длинный, создаётся новый.
+
+    Returns:
+        Кортеж (ID запроса, токен для reset_request).
+    """
+    if not request_id or len(request_id) > 128:
+        request_id = uuid.uuid4().hex
+    token = _request_context.set((request_id, time.perf_counter()))
+    return request_id, token
+
+
+def reset_request(token: contextvars.Token) -> None:
+    """Отвязывает ID запроса, привязанный bind_request."""
+    _request_context.reset(token)
+
+
+def setup_request_ids(app: Flask) -> None:
+    """
+    Привязывает к каждому запросу Flask ID для логов.
+
+    ID берётся из заголовка Config.REQUEST_ID_HEADER (его выставляет Nginx
+    или вызывающий сервис) или создаётся, и возвращается в том же заголовке.
+
+    Args:
+        app: Экземпляр Flask-приложения.
+    """
+
+    @app.before_request
+    def bind_request_id():
+        g.request_id, g.request_token = bind_request(
+            request.headers.get(Config.REQUEST_ID_HEADER)
+        )
+
+    @app.after_request
+    def add_request_id(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers[Config.REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def reset_request_id(error=None):
+        token = g.pop("request_token", None)
+        if token is not None:
+            reset_request(token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Добавляет к записи ID текущего запроса и время с его начала (мс)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get()
+        if context is None:
+            record.request_id = "-"
+            record.elapsed_ms = None
+        else:
+            record.request_id = context[0]
+            record.elapsed_ms = round((time.perf_counter() - context[1]) * 1000, 2)
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который никогда не ждёт и не форматирует в вызывающем потоке.
+
+    Сообщение собирается из шаблона и аргументов уже в потоке записи, поэтому
+    аргументы логирования не должны изменяться после вызова. При переполнении
+    очереди запись отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как одну строку JSON (JSON Lines)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        if getattr(record, "request_id", "-") != "-":
+            data["request_id"] = record.request_id
+            data["elapsed_ms"] = record.elapsed_ms
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _SharedRolloverMixin:
+    """
+    Поворот файла, в который пишут несколько процессов.
+
+    Поворот выполняется под flock на <файл>.lock; процесс, чей открытый файл
+    уже повернул другой процесс (сменился inode), просто переоткрывает его.
+    """
+
+    def _reopen_if_rotated(self) -> bool:
+        """Переоткрывает файл, если его повернул другой процесс."""
+        if self.stream is None:
+            return False
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current == os.fstat(self.stream.fileno()).st_ino:
+            return False
+        self.stream.close()
+        self.stream = self._open()
+        return True
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        self._reopen_if_rotated()
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        with open(f"{self.baseFilename}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self._reopen_if_rotated():
+                    self._rotated_elsewhere()
+                    return
+                super().doRollover()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rotated_elsewhere(self) -> None:
+        """Вызывается, когда файл уже повернул другой процесс."""
+
+
+class SharedRotatingFileHandler(
+    _SharedRolloverMixin, logging.handlers.RotatingFileHandler
+):
+    """Поворот файла по размеру для нескольких процессов."""
+
+
+class SharedTimedRotatingFileHandler(
+    _SharedRolloverMixin, logging.handlers.TimedRotatingFileHandler
+):
+    """Поворот файла по времени для нескольких процессов."""
+
+    def _rotated_elsewhere(self) -> None:
+        self.rolloverAt = self.computeRollover(int(time.time()))
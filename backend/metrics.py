@@ -0,0 +1,627 @@
+"""
+Метрики приложения в текстовом формате Prometheus (GET /api/metrics).
+
+Счётчики и гистограммы хранятся в памяти процесса; запись значения — это
+поиск корзины bisect-ом и короткая блокировка, доли микросекунды.
+
+Под gunicorn запрос /api/metrics попадает в случайный воркер, поэтому при
+заданном Config.METRICS_DIR каждый процесс раз в METRICS_FLUSH_INTERVAL
+секунд (и при завершении) сохраняет снимок своих метрик в <pid>.json, а ответ
+складывается из снимков всех процессов. Счётчики и гистограммы завершившихся
+воркеров переносятся в archive.json и продолжают учитываться, их текущие
+значения (gauge) — отбрасываются.
+"""
+
+import bisect
+import fcntl
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import Flask, g, request
+
+from cache import cache_stats
+from config import Config
+from utils import log_error, logging_stats
+
+Labels = Tuple[str, ...]
+# Сэмпл: (имя, ((метка, значение), ...), значение)
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+# Семейство метрик: (имя, тип, описание, сэмплы)
+Family = Tuple[str, str, str, List[Sample]]
+
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+
+
+class Counter:
+    """Монотонно растущий счётчик с метками."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+        _registry.append(self)
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        """Увеличивает счётчик с указанными значениями меток."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> Family:
+        """Возвращает текущие значения в виде семейства метрик."""
+        with self._lock:
+            items = list(self._values.items())
+        samples = [
+            (self.name, tuple(zip(self.labelnames, labels)), value)
+            for labels, value in items
+        ]
+        return self.name, "counter", self.documentation, samples
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин и метками."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float],
+        labelnames: Sequence[str] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(buckets)
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        # Метки -> [число значений по корзинам (последняя — +Inf), сумма]
+        self._values: Dict[Labels, List[Any]] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        """Учитывает значение в гистограмме."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def collect(self) -> Family:
+        """Возвращает текущие значения в виде семейства метрик."""
+        with self._lock:
+            items = [
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._values.items()
+            ]
+        samples: List[Sample] = []
+        for labels, counts, total in items:
+            samples.extend(
+                histogram_samples(
+                    self.name,
+                    tuple(zip(self.labelnames, labels)),
+                    self.buckets,
+                    counts,
+                    total,
+                )
+            )
+        return self.name, "histogram", self.documentation, samples
+
+
+def histogram_samples(
+    name: str,
+    labels: Tuple[Tuple[str, str], ...],
+    buckets: Sequence[float],
+    counts: Sequence[int],
+    total: float,
+) -> List[Sample]:
+    """
+    Формирует сэмплы гистограммы Prometheus из числа значений по корзинам.
+
+    Args:
+        name: Имя гистограммы.
+        labels: Метки сэмплов.
+        buckets: Границы корзин по возрастанию.
+        counts: Число значений в каждой корзине (не накопительное), последним
+            элементом — значения больше всех границ.
+        total: Сумма всех значений.
+    """
+    samples: List[Sample] = []
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        samples.append(
+            (f"{name}_bucket", labels + (("le", _format_value(bound)),), cumulative)
+        )
+    cumulative += counts[-1]
+    samples.append((f"{name}_bucket", labels + (("le", "+Inf"),), cumulative))
+    samples.append((f"{name}_sum", labels, total))
+    samples.append((f"{name}_count", labels, cumulative))
+    return samples
+
+
+_registry: List[Any] = []
+_collectors: List[Callable[[], Iterable[Family]]] = []
+_shared_collectors: List[Callable[[], Iterable[Family]]] = []
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "Обработанные HTTP-запросы",
+    ("method", "route", "status"),
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    Config.METRICS_LATENCY_BUCKETS,
+    ("method", "route"),
+)
+upload_bytes_total = Counter(
+    "upload_bytes_total", "Объём сохранённых загрузок в байтах"
+)
+upload_size_bytes = Histogram(
+    "upload_size_bytes",
+    "Размер сохранённых загруженных файлов",
+    Config.METRICS_UPLOAD_SIZE_BUCKETS,
+)
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения методов Database (включая ожидание соединения)",
+    Config.METRICS_LATENCY_BUCKETS,
+    ("method",),
+)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    """Учитывает обработанный HTTP-запрос."""
+    http_requests_total.inc((method, route, str(status)))
+    http_request_duration_seconds.observe(seconds, (method, route))
+
+
+def observe_upload(size: int) -> None:
+    """Учитывает сохранённый загруженный файл."""
+    upload_bytes_total.inc(amount=size)
+    upload_size_bytes.observe(size)
+
+
+def instrument_methods(histogram: Histogram, exclude: Sequence[str] = ()):
+    """
+    Декоратор класса: измеряет время всех публичных статических методов.
+
+    Время каждого вызова учитывается в histogram с меткой, равной имени
+    метода. Асинхронные методы и методы из exclude не изменяются.
+
+    Args:
+        histogram: Гистограмма с одной меткой (имя метода).
+        exclude: Имена методов, которые не нужно измерять.
+    """
+
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            if (
+                name.startswith("_")
+                or name in exclude
+                or not isinstance(attr, staticmethod)
+            ):
+                continue
+            func = attr.__func__
+            if inspect.iscoroutinefunction(func):
+                continue
+            setattr(cls, name, staticmethod(_timed(func, histogram, (name,))))
+        return cls
+
+    return decorator
+
+
+def _timed(func: Callable, histogram: Histogram, labels: Labels) -> Callable:
+    """Оборачивает функцию замером времени выполнения."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, labels)
+
+    return wrapper
+
+
+def register_collector(collector: Callable[[], Iterable[Family]]) -> None:
+    """
+    Регистрирует функцию, возвращающую метрики процесса на момент запроса
+    (например, статистику пула соединений).
+    """
+    _collectors.append(collector)
+
+
+def register_shared_collector(collector: Callable[[], Iterable[Family]]) -> None:
+    """
+    Регистрирует функцию, возвращающую метрики, общие для всех процессов
+    (например, данные БД): они собираются один раз при запросе /api/metrics
+    и не суммируются по снимкам воркеров.
+    """
+    _shared_collectors.append(collector)
+
+
+def pool_families(prefix: str, stats: Dict[str, Any]) -> List[Family]:
+    """
+    Преобразует статистику пула соединений (ConnectionPool.stats или
+    AsyncDatabase.pool_stats) в метрики.
+
+    Args:
+        prefix: Префикс имён метрик.
+        stats: Статистика пула; пустой словарь, если пул не создан.
+    """
+    if not stats:
+        return []
+    families: List[Family] = [
+        (
+            f"{prefix}_{key}",
+            "gauge",
+            f"Соединения пула: {key}",
+            [(f"{prefix}_{key}", (), stats[key])],
+        )
+        for key in ("size", "max_size", "in_use", "idle", "waiters")
+        if key in stats
+    ]
+    if "wait_seconds_buckets" in stats:
+        name = f"{prefix}_wait_seconds"
+        bounds = [bound for bound, _ in stats["wait_seconds_buckets"]]
+        counts = []
+        previous = 0
+        for _, cumulative in stats["wait_seconds_buckets"]:
+            counts.append(cumulative - previous)
+            previous = cumulative
+        counts.append(stats["acquired_total"] - previous)
+        families.append(
+            (
+                name,
+                "histogram",
+                "Время ожидания соединения из пула",
+                histogram_samples(name, (), bounds, counts, stats["wait_seconds_sum"]),
+            )
+        )
+        families.append(
+            (
+                f"{prefix}_timeouts_total",
+                "counter",
+                "Запросы соединения, не дождавшиеся свободного соединения",
+                [(f"{prefix}_timeouts_total", (), stats["timeouts_total"])],
+            )
+        )
+    return families
+
+
+def _cache_families() -> List[Family]:
+    """Возвращает метрики кэшей чтения (cache.py)."""
+    stats = cache_stats()
+    families: List[Family] = []
+    for key, kind in (
+        ("hits", "counter"),
+        ("misses", "counter"),
+        ("evictions", "counter"),
+        ("entries", "gauge"),
+    ):
+        name = f"cache_{key}_total" if kind == "counter" else f"cache_{key}"
+        samples = [
+            (name, (("cache", cache),), values[key]) for cache, values in stats.items()
+        ]
+        families.append((name, kind, f"Кэш чтения: {key}", samples))
+    return families
+
+
+register_collector(_cache_families)
+
+
+def _logging_families() -> List[Family]:
+    """Возвращает метрики очереди логов (utils.setup_logging)."""
+    stats = logging_stats()
+    if not stats:
+        return []
+    return [
+        (
+            "log_queue_records",
+            "gauge",
+            "Записи лога, ожидающие записи",
+            [("log_queue_records", (), stats["queued"])],
+        ),
+        (
+            "log_dropped_records_total",
+            "counter",
+            "Записи лога, отброшенные при переполнении очереди",
+            [("log_dropped_records_total", (), stats["dropped"])],
+        ),
+    ]
+
+
+register_collector(_logging_families)
+
+
+def _disk_families() -> List[Family]:
+    """
+    Возвращает метрики файловой системы, на которой лежит директория загрузок.
+
+    statvfs описывает весь том, а не только директорию загрузок: обход
+    директории на миллионах файлов занимал бы воркер на минуты при каждом
+    опросе.
+    """
+    try:
+        st = os.statvfs(Config.UPLOAD_FOLDER)
+    except OSError as e:
+        log_error("Не удалось получить данные тома загрузок: %s", e)
+        return []
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    return [
+        (
+            "upload_volume_used_bytes",
+            "gauge",
+            "Занятое место на томе с директорией загрузок (весь том)",
+            [("upload_volume_used_bytes", (), total - st.f_bfree * st.f_frsize)],
+        ),
+        (
+            "upload_volume_free_bytes",
+            "gauge",
+            "Свободное место на томе с директорией загрузок (весь том)",
+            [("upload_volume_free_bytes", (), free)],
+        ),
+        (
+            "upload_volume_size_bytes",
+            "gauge",
+            "Размер тома с директорией загрузок",
+            [("upload_volume_size_bytes", (), total)],
+        ),
+    ]
+
+
+register_shared_collector(_disk_families)
+
+
+def upload_files_families(files: int) -> List[Family]:
+    """
+    Преобразует число файлов оригиналов (Database.count_stored_files)
+    в метрику.
+
+    Args:
+        files: Число файлов в директории загрузок по данным БД.
+    """
+    return [
+        (
+            "upload_folder_files",
+            "gauge",
+            "Файлы оригиналов в директории загрузок (по данным БД)",
+            [("upload_folder_files", (), files)],
+        )
+    ]
+
+
+def _collect_process() -> List[Family]:
+    """Собирает метрики текущего процесса."""
+    families = [metric.collect() for metric in _registry]
+    for collector in _collectors:
+        try:
+            families.extend(collector())
+        except Exception as e:
+            log_error("Ошибка сбора метрик: %s", e)
+    return families
+
+
+def _snapshot_path(pid: int) -> str:
+    """Возвращает путь к снимку метрик процесса."""
+    return os.path.join(Config.METRICS_DIR, f"{pid}.json")
+
+
+def _write_json(path: str, data: Any) -> None:
+    """Атомарно записывает JSON-файл."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _read_json(path: str) -> Optional[Any]:
+    """Читает JSON-файл; возвращает None, если его нет или он повреждён."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush() -> None:
+    """Сохраняет снимок метрик текущего процесса в Config.METRICS_DIR."""
+    if Config.METRICS_DIR:
+        try:
+            _write_json(_snapshot_path(os.getpid()), _collect_process())
+        except OSError as e:
+            log_error("Ошибка сохранения снимка метрик: %s", e)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Проверяет, существует ли процесс."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Merged:
+    """Сумма семейств метрик из нескольких снимков."""
+
+    def __init__(self):
+        # Имя -> (тип, описание, {(имя сэмпла, метки): значение})
+        self.families: Dict[str, Tuple[str, str, Dict[Tuple[str, Any], float]]] = {}
+
+    def add(self, families: Iterable[Any], gauges: bool = True) -> None:
+        """Прибавляет семейства; gauges=False пропускает текущие значения."""
+        for name, kind, documentation, samples in families:
+            if kind == "gauge" and not gauges:
+                continue
+            _, _, values = self.families.setdefault(name, (kind, documentation, {}))
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(tuple(pair) for pair in labels))
+                values[key] = values.get(key, 0) + value
+
+    def result(self, gauges: bool = True) -> List[Family]:
+        """Возвращает сумму в виде списка семейств."""
+        return [
+            (
+                name,
+                kind,
+                documentation,
+                [(s, labels, v) for (s, labels), v in values.items()],
+            )
+            for name, (kind, documentation, values) in self.families.items()
+            if gauges or kind != "gauge"
+        ]
+
+
+def _collect_shared() -> List[Family]:
+    """
+    Складывает снимки всех процессов из Config.METRICS_DIR.
+
+    Снимки завершившихся процессов под файловой блокировкой переносятся
+    в archive.json, чтобы каталог не рос при перезапусках воркеров.
+    """
+    flush()
+    merged = _Merged()
+    with open(os.path.join(Config.METRICS_DIR, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            archive_path = os.path.join(Config.METRICS_DIR, ARCHIVE_FILE)
+            archive = _Merged()
+            archive.add(_read_json(archive_path) or [])
+            archived = []
+            for entry in os.scandir(Config.METRICS_DIR):
+                stem, ext = os.path.splitext(entry.name)
+                if ext != ".json" or not stem.isdigit():
+                    continue
+                families = _read_json(entry.path)
+                if families is None:
+                    continue
+                if _pid_alive(int(stem)):
+                    merged.add(families)
+                else:
+                    archive.add(families, gauges=False)
+                    archived.append(entry.path)
+            if archived:
+                _write_json(archive_path, archive.result(gauges=False))
+                for path in archived:
+                    os.remove(path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    merged.add(archive.result(gauges=False))
+    return merged.result()
+
+
+def reset_shared() -> None:
+    """Очищает Config.METRICS_DIR (при запуске мастера gunicorn)."""
+    if not Config.METRICS_DIR:
+        return
+    os.makedirs(Config.METRICS_DIR, exist_ok=True)
+    for entry in os.scandir(Config.METRICS_DIR):
+        if entry.is_file():
+            os.remove(entry.path)
+
+
+def _format_value(value: float) -> str:
+    """Форматирует число для текстового формата Prometheus."""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """
+    Возвращает все метрики в текстовом формате Prometheus 0.0.4.
+
+    Returns:
+        Текст ответа /api/metrics.
+    """
+    if Config.METRICS_DIR:
+        families = _collect_shared()
+    else:
+        families = _collect_process()
+    for collector in _shared_collectors:
+        try:
+            families.extend(collector())
+        except Exception as e:
+            log_error("Ошибка сбора метрик: %s", e)
+
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            if labels:
+                label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _flush_loop() -> None:
+    """Периодически сохраняет снимок метрик процесса."""
+    while True:
+        time.sleep(Config.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+_flusher: Optional[threading.Thread] = None
+
+
+def setup_metrics(app: Flask) -> None:
+    """
+    Подключает сбор метрик HTTP-запросов к Flask-приложению.
+
+    Регистрирует хуки before_request/after_request, которые учитывают число
+    запросов и время обработки по шаблону маршрута (а не по конкретному URL,
+    чтобы число рядов не зависело от ID в путях), и при заданном
+    Config.METRICS_DIR запускает периодическое сохранение снимков.
+
+    Args:
+        app: Экземпляр Flask-приложения.
+    """
+    global _flusher
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.get("metrics_start")
+        if start is not None:
+            rule = request.url_rule
+            observe_request(
+                request.method,
+                rule.rule if rule is not None else "<unmatched>",
+                response.status_code,
+                time.perf_counter() - start,
+            )
+        return response
+
+    if Config.METRICS_DIR and _flusher is None:
+        os.makedirs(Config.METRICS_DIR, exist_ok=True)
+        _flusher = threading.Thread(
+            target=_flush_loop, name="metrics-flush", daemon=True
+        )
+        _flusher.start()
@@ -0,0 +1,90 @@
+import argparse
+import os
+import time
+from typing import Tuple
+
+from config import Config
+from storage import file_path
+from utils import TEMP_FILE_PREFIX, log_error, log_info, setup_logging
+
+
+def migrate_to_sharded(
+    batch_size: int = 1000, pause: float = 0.5, dry_run: bool = False
+) -> Tuple[int, int]:
+    """
+    Переносит файлы из плоской директории загрузок в шардированную раскладку.
+
+    Работает без остановки сервиса: каждый файл сначала получает жёсткую
+    ссылку по новому пути и только затем удаляется со старого, а отдача
+    файлов (Flask и Nginx) ищет их в обеих раскладках. Между пачками делается
+    пауза, чтобы не забирать весь дисковый ввод-вывод.
+
+    Args:
+        batch_size: Количество файлов в одной пачке.
+        pause: Пауза между пачками в секундах.
+        dry_run: Только подсчитать файлы, ничего не перемещая.
+
+    Returns:
+        Кортеж (перенесено_файлов, ошибок).
+    """
+    moved = 0
+    failed = 0
+    with os.scandir(Config.UPLOAD_FOLDER) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.name.startswith(TEMP_FILE_PREFIX):
+                continue
+
+            target = file_path(entry.name)
+            if os.path.abspath(target) == os.path.abspath(entry.path):
+                continue
+
+            if not dry_run:
+                try:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    try:
+                        os.link(entry.path, target)
+                    except FileExistsError:
+                        if not os.path.samefile(entry.path, target):
+                            log_error("Файл уже существует по новому пути: %s", target)
+                            failed += 1
+                            continue
+                    os.unlink(entry.path)
+                except OSError as e:
+                    log_error("Ошибка переноса файла %s: %s", entry.name, e)
+                    failed += 1
+                    continue
+
+            moved += 1
+            if moved % batch_size == 0:
+                log_info("Перенесено файлов: %s", moved)
+                if not dry_run:
+                    time.sleep(pause)
+
+    log_info("Миграция завершена: перенесено %s, ошибок %s", moved, failed)
+    return moved, failed
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    parser = argparse.ArgumentParser(
+        description="Онлайн-миграция файлов изображений в шардированную раскладку."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="Файлов в одной пачке."
+    )
+    parser.add_argument(
+        "--pause", type=float, default=0.5, help="Пауза между пачками, с."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Только подсчитать файлы."
+    )
+
+    args = parser.parse_args()
+
+    moved_count, failed_count = migrate_to_sharded(
+        args.batch_size, args.pause, args.dry_run
+    )
+    print(f"Перенесено файлов: {moved_count}, ошибок: {failed_count}")
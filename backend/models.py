@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
+
+from storage import image_url, optimized_url, thumb_url
 
 
 @dataclass
@@ -15,6 +17,12 @@ class Image:
         size: Размер файла в байтах.
         upload_time: Дата и время загрузки файла.
         file_type: Тип файла (расширение, например, 'jpg', 'png').
+        blob_sha256: SHA-256 содержимого в контентно-адресуемом режиме хранения.
+        job_status: Статус фоновой обработки ('pending', 'done', 'failed').
+        bytes_saved: Сколько байт экономит самый компактный оптимизированный
+            вариант файла (None, пока задача optimize не выполнена).
+        variants: Форматы созданных оптимизированных вариантов в порядке
+            отдачи (None, пока задача optimize не выполнена).
     """
 
     id: Optional[int] = None
@@ -23,6 +31,10 @@ class Image:
     size: int = 0
     upload_time: Optional[datetime] = None
     file_type: str = ""
+    blob_sha256: Optional[str] = None
+    job_status: str = "done"
+    bytes_saved: Optional[int] = None
+    variants: Optional[List[str]] = None
 
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -38,5 +50,30 @@ class Image:
             "size": self.size,
             "upload_time": self.upload_time.isoformat() if self.upload_time else None,
             "file_type": self.file_type,
-            "url": f"/images/{self.filename}",
+            "job_status": self.job_status,
+            "bytes_saved": self.bytes_saved,
+            # URL меняется, когда появляются варианты: ответы по обоим
+            # адресам неизменны и кэшируются навсегда
+            "url": (
+                optimized_url(self.filename)
+                if self.variants
+                else image_url(self.filename)
+            ),
+            "thumbnail_url": thumb_url(self.filename),
         }
+
+
+@dataclass
+class StoredFile:
+    """
+    Дата-класс с результатом сохранения загруженного файла на диск.
+
+    Attributes:
+        filename: Уникальное имя, под которым файл сохранён в директории загрузок.
+        size: Размер файла в байтах.
+        sha256: SHA-256 содержимого в шестнадцатеричном виде.
+    """
+
+    filename: str
+    size: int
+    sha256: str
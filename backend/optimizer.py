@@ -0,0 +1,130 @@
+import shutil
+import subprocess
+from functools import lru_cache
+from typing import Optional
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from config import Config
+from utils import log_error
+
+# Тег EXIF с ориентацией снимка
+ORIENTATION_TAG = 0x0112
+# Преобразования jpegtran, которые без потерь применяют ориентацию EXIF:
+# -copy icc отбрасывает EXIF, поэтому поворот переносится в сами данные
+JPEGTRAN_TRANSFORMS = {
+    2: ["-flip", "horizontal"],
+    3: ["-rotate", "180"],
+    4: ["-flip", "vertical"],
+    5: ["-transpose"],
+    6: ["-rotate", "90"],
+    7: ["-transverse"],
+    8: ["-rotate", "270"],
+}
+
+
+@lru_cache(maxsize=1)
+def _jpegtran_path() -> Optional[str]:
+    """Находит jpegtran (Config.JPEGTRAN_PATH); об отсутствии сообщает один раз."""
+    path = shutil.which(Config.JPEGTRAN_PATH)
+    if path is None:
+        log_error("jpegtran не найден (%s): JPEG не пережимаются", Config.JPEGTRAN_PATH)
+    return path
+
+
+def _jpegtran(source_path: str, target_path: str, orientation: int) -> bool:
+    """
+    Пережимает JPEG через jpegtran без декодирования пикселей.
+
+    Returns:
+        False, если jpegtran недоступен или поворот нельзя выполнить без
+        потерь (размер не кратен блоку, -perfect).
+    """
+    jpegtran = _jpegtran_path()
+    if jpegtran is None:
+        return False
+    command = [jpegtran, "-copy", "icc", "-optimize", "-progressive"]
+    if orientation in JPEGTRAN_TRANSFORMS:
+        command += ["-perfect", *JPEGTRAN_TRANSFORMS[orientation]]
+    command += ["-outfile", target_path, source_path]
+    result = subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+        timeout=Config.JPEGTRAN_TIMEOUT,
+        check=False,
+    )
+    if result.returncode != 0:
+        log_error("jpegtran завершился ошибкой: %s", result.stderr.strip())
+        return False
+    return True
+
+
+def recompress(source_path: str, target_path: str) -> bool:
+    """
+    Пережимает JPEG или PNG в том же формате без потерь и удаляет метаданные.
+
+    JPEG перекодирует jpegtran на уровне DCT-коэффициентов: прогрессивная
+    развёртка и оптимизированные таблицы Хаффмана, пиксели не меняются,
+    ориентация EXIF применяется поворотом без потерь. PNG сохраняется с
+    максимальным сжатием; RGBA без прозрачных пикселей становится RGB.
+    Из метаданных остаётся только ICC-профиль.
+
+    Args:
+        source_path: Путь к исходному файлу.
+        target_path: Путь, по которому сохранить результат.
+
+    Returns:
+        False, если формат не поддерживается (GIF, анимация) или JPEG нельзя
+        пережать без потерь, и файл не создан.
+    """
+    with PILImage.open(source_path) as img:
+        if img.format not in ("JPEG", "PNG") or getattr(img, "is_animated", False):
+            return False
+        if img.format == "JPEG":
+            orientation = img.getexif().get(ORIENTATION_TAG, 1)
+            return _jpegtran(source_path, target_path, orientation)
+
+        params = {"optimize": True}
+        if img.info.get("icc_profile"):
+            params["icc_profile"] = img.info["icc_profile"]
+        if img.mode == "RGBA" and img.getextrema()[3] == (255, 255):
+            img = img.convert("RGB")
+        img.save(target_path, "PNG", **params)
+    return True
+
+
+def render_webp(source_path: str, target_path: str) -> bool:
+    """
+    Создаёт WebP-вариант изображения в полном размере.
+
+    Изображения без потерь (PNG, GIF) кодируются в WebP без потерь, JPEG —
+    с качеством Config.OPTIMIZE_WEBP_QUALITY. Поворот по EXIF применяется
+    к пикселям, метаданные, кроме ICC-профиля, не переносятся.
+
+    Args:
+        source_path: Путь к исходному файлу.
+        target_path: Путь, по которому сохранить вариант.
+
+    Returns:
+        False, если изображение анимированное и файл не создан.
+    """
+    with PILImage.open(source_path) as img:
+        if getattr(img, "is_animated", False):
+            return False
+
+        lossless = img.format != "JPEG"
+        icc_profile = img.info.get("icc_profile")
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+
+        params = {"icc_profile": icc_profile} if icc_profile else {}
+        if lossless:
+            img.save(target_path, "WEBP", lossless=True, **params)
+        else:
+            img.save(
+                target_path, "WEBP", quality=Config.OPTIMIZE_WEBP_QUALITY, **params
+            )
+    return True
@@ -0,0 +1,169 @@
+"""
+Профилирование отдельных запросов и заголовок Server-Timing.
+
+Запрос профилируется cProfile, если в нём передан заголовок
+Config.PROFILE_HEADER со значением Config.PROFILE_TOKEN, либо случайно
+с вероятностью Config.PROFILE_SAMPLE_PERCENT процентов. Профиль сохраняется
+в Config.PROFILE_DIR (формат pstats, смотреть через `python -m pstats` или
+snakeviz), имя файла возвращается в заголовке X-Profile-File.
+
+Обработчики отмечают этапы через stage(); у профилируемых запросов (или у
+всех при Config.SERVER_TIMING) время этапов возвращается в Server-Timing.
+Вне профилирования stage() стоит два вызова perf_counter.
+
+Начиная с Python 3.12 cProfile работает через sys.monitoring: в процессе может
+быть включён только один профайлер, и он видит вызовы всех потоков. Поэтому
+в каждом процессе профилируется не больше одного запроса одновременно,
+остальные выполняются без профайлера (но с Server-Timing).
+"""
+
+import cProfile
+import hmac
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from flask import Flask, g, request
+
+from config import Config
+from utils import log_error, log_info
+
+# Занят, пока в процессе профилируется запрос
+_profiler_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Отмечает этап обработки запроса для заголовка Server-Timing.
+
+    Время повторяющихся этапов с одним именем суммируется.
+
+    Args:
+        name: Имя этапа (токен без пробелов, например 'save').
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings: Optional[Dict[str, float]] = g.get("server_timing")
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _profile_requested() -> bool:
+    """Проверяет, нужно ли профилировать текущий запрос."""
+    if Config.PROFILE_TOKEN:
+        token = request.headers.get(Config.PROFILE_HEADER)
+        if token and hmac.compare_digest(token, Config.PROFILE_TOKEN):
+            return True
+    return (
+        Config.PROFILE_SAMPLE_PERCENT > 0
+        and random.random() * 100 < Config.PROFILE_SAMPLE_PERCENT
+    )
+
+
+def _profile_filename(elapsed: float) -> str:
+    """Возвращает имя файла профиля: время, метод, маршрут и длительность."""
+    rule = request.url_rule
+    route = re.sub(r"[^A-Za-z0-9]+", "_", rule.rule if rule else "unmatched")
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return (
+        f"{timestamp}-{request.method}{route.rstrip('_')}-{elapsed * 1000:.0f}ms.prof"
+    )
+
+
+def _prune_profiles() -> None:
+    """Удаляет самые старые профили сверх Config.PROFILE_MAX_FILES."""
+    names = sorted(
+        name for name in os.listdir(Config.PROFILE_DIR) if name.endswith(".prof")
+    )
+    for name in names[: max(0, len(names) - Config.PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(Config.PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _save_profile(profiler: cProfile.Profile, elapsed: float) -> Optional[str]:
+    """
+    Сохраняет профиль запроса в Config.PROFILE_DIR.
+
+    Returns:
+        Имя файла профиля или None при ошибке записи.
+    """
+    filename = _profile_filename(elapsed)
+    try:
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(Config.PROFILE_DIR, filename))
+        _prune_profiles()
+    except OSError as e:
+        log_error("Ошибка сохранения профиля запроса: %s", e)
+        return None
+    log_info(
+        "Профиль запроса %s %s сохранён: %s", request.method, request.path, filename
+    )
+    return filename
+
+
+def setup_profiling(app: Flask) -> None:
+    """
+    Подключает профилирование запросов к Flask-приложению.
+
+    Args:
+        app: Экземпляр Flask-приложения.
+    """
+
+    @app.before_request
+    def start_profile():
+        profile = _profile_requested()
+        if profile or Config.SERVER_TIMING:
+            g.server_timing = {}
+            g.profile_start = time.perf_counter()
+        if profile and _profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Включён сторонний профайлер (например, отладчик)
+                _profiler_lock.release()
+                log_error("Профилирование запроса недоступно: %s", e)
+                return
+            g.profiler = profiler
+
+    @app.after_request
+    def finish_profile(response):
+        start = g.get("profile_start")
+        if start is None:
+            return response
+        profiler: Optional[cProfile.Profile] = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+        elapsed = time.perf_counter() - start
+
+        metrics = [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in g.server_timing.items()
+        ]
+        metrics.append(f"total;dur={elapsed * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(metrics)
+
+        if profiler is not None:
+            filename = _save_profile(profiler, elapsed)
+            if filename:
+                response.headers["X-Profile-File"] = filename
+        return response
+
+    @app.teardown_request
+    def stop_profile(error=None):
+        # Если after_request не выполнился, профайлер нужно выключить
+        profiler: Optional[cProfile.Profile] = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
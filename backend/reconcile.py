@@ -0,0 +1,522 @@
+"""
+Сверка файлов в Config.UPLOAD_FOLDER с записями БД и сборка мусора.
+
+Расхождения возникают, когда запись удалена, а файл пережил ошибку удаления
+(routes.delete_image), или когда процесс упал между записью файла и
+сохранением строки в БД. Сверка находит обе разницы множеств:
+
+* сироты — файлы на диске, на которые не ссылаются ни images, ни blobs
+  (оптимизированные варианты '<имя>.opt.<формат>' принадлежат файлу <имя>);
+* потерянные файлы — записи БД, для которых нет файла ни в шардированной,
+  ни в старой плоской раскладке.
+
+Имена из БД читаются серверным курсором уже отсортированными в порядке
+обхода каталогов шардов (Database.iter_stored_files), диск обходится
+os.scandir в том же порядке, и оба потока сливаются как отсортированные
+последовательности. В памяти одновременно находятся только порция курсора,
+листинги нескольких каталогов шардов и одна пачка кандидатов, поэтому
+объём памяти не зависит от числа файлов.
+
+По умолчанию только составляется отчёт (dry run): --action delete удаляет
+сирот, --action quarantine переносит их в Config.QUARANTINE_FOLDER.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from config import Config
+from database import Database
+from storage import delete_thumbnails, find_relpath, optimized_source
+from utils import format_file_size, log_error, log_info, setup_logging
+
+ACTIONS = ("report", "delete", "quarantine")
+PROGRESS_INTERVAL = 10  # Секунд между сообщениями о ходе сверки
+
+
+class _Reconciler:
+    """
+    Одна сверка Config.UPLOAD_FOLDER с БД.
+
+    Файлы-кандидаты в сироты копятся пачкой по batch_size; перед действием
+    пачка ещё раз проверяется по БД (запись могла появиться после начала
+    сверки), а каждый файл — по времени изменения, и только затем файлы
+    удаляются или переносятся в карантин в пуле потоков.
+    """
+
+    def __init__(
+        self,
+        action: str,
+        grace_seconds: int,
+        workers: int,
+        batch_size: int,
+        delete_missing_rows: bool,
+        report: Optional[TextIO],
+    ):
+        self.action = action
+        self.cutoff = time.time() - grace_seconds
+        self.batch_size = batch_size
+        self.delete_missing_rows = delete_missing_rows
+        self.report = report
+        self.root = Config.UPLOAD_FOLDER
+        self.depth = Config.STORAGE_SHARD_DEPTH
+        self.quarantine = os.path.join(
+            Config.QUARANTINE_FOLDER, datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        )
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # Листингов каталогов шардов, читаемых заранее, пока идёт слияние
+        self.prefetch = workers * 2
+        self.candidates: List[Tuple[str, str]] = []
+        self.missing: List[Tuple[str, List[int]]] = []
+        self.stats = dict.fromkeys(
+            (
+                "disk_files",
+                "db_files",
+                "matched",
+                "orphans",
+                "orphan_bytes",
+                "recent",
+                "removed",
+                "missing",
+                "deleted_rows",
+                "unexpected",
+                "failed",
+            ),
+            0,
+        )
+        self.last_progress = time.monotonic()
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        """Добавляет строку в отчёт JSONL, если он ведётся."""
+        if self.report is not None:
+            self.report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _unexpected(self, relpath: str) -> None:
+        """Учитывает элемент, которого не может быть в раскладке; он не трогается."""
+        self.stats["unexpected"] += 1
+        self._write({"kind": "unexpected", "path": relpath})
+
+    def _progress(self) -> None:
+        """Пишет в лог ход сверки не чаще раза в PROGRESS_INTERVAL секунд."""
+        now = time.monotonic()
+        if now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        log_info(
+            "Сверка: файлов на диске %s, имён в БД %s, сирот %s, потеряно %s",
+            self.stats["disk_files"],
+            self.stats["db_files"],
+            self.stats["orphans"],
+            self.stats["missing"],
+        )
+
+    def _list(self, relpath: str) -> Tuple[List[str], List[str]]:
+        """
+        Читает каталог; выполняется в пуле потоков.
+
+        Returns:
+            Кортеж (отсортированные_имена_файлов, прочие_элементы).
+        """
+        files = []
+        others = []
+        with os.scandir(os.path.join(self.root, relpath)) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    files.append(entry.name)
+                else:
+                    others.append(entry.name)
+        files.sort()
+        return files, others
+
+    def _scan_root(self) -> List[str]:
+        """
+        Отправляет в кандидаты файлы плоской раскладки в корне.
+
+        Корень может содержать миллионы файлов (до migrate_storage.py),
+        поэтому он читается потоково, без сортировки.
+
+        Returns:
+            Отсортированные имена каталогов в корне.
+        """
+        dirs = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    self.stats["disk_files"] += 1
+                    self._add_candidate(entry.name, entry.name)
+                else:
+                    self._unexpected(entry.name)
+                self._progress()
+        dirs.sort()
+        return dirs
+
+    def _shard_dirs(
+        self, relpath: str, names: List[str], level: int
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Обходит каталоги шардов в порядке их ключей.
+
+        Args:
+            relpath: Путь текущего каталога относительно корня.
+            names: Отсортированные имена подкаталогов.
+            level: Уровень шардирования подкаталогов (с 1).
+
+        Yields:
+            Кортежи (ключ_шарда, путь) каталогов нижнего уровня.
+        """
+        for name in names:
+            path = os.path.join(relpath, name) if relpath else name
+            if level > self.depth or len(name) != 2 or name != name.lower():
+                self._unexpected(path)
+                continue
+            if level == self.depth:
+                yield path.replace(os.sep, ""), path
+                continue
+            try:
+                files, dirs = self._list(path)
+            except OSError as e:
+                log_error("Не удалось прочитать каталог %s: %s", path, e)
+                self.stats["failed"] += 1
+                continue
+            for filename in files:
+                self._unexpected(os.path.join(path, filename))
+            yield from self._shard_dirs(path, sorted(dirs), level + 1)
+
+    def _disk_files(
+        self, shards: Iterator[Tuple[str, str]]
+    ) -> Iterator[Tuple[str, str, str]]:
+        """
+        Отдаёт файлы каталогов шардов, читая несколько листингов заранее.
+
+        Yields:
+            Кортежи (ключ_шарда, имя_файла, каталог_шарда) по возрастанию.
+        """
+        pending: Deque[Tuple[str, str, Future]] = deque()
+        for key, relpath in shards:
+            pending.append((key, relpath, self.pool.submit(self._list, relpath)))
+            if len(pending) > self.prefetch:
+                yield from self._shard_files(*pending.popleft())
+        while pending:
+            yield from self._shard_files(*pending.popleft())
+
+    def _shard_files(
+        self, key: str, relpath: str, listing: Future
+    ) -> Iterator[Tuple[str, str, str]]:
+        """Отдаёт файлы одного каталога шарда, отсеивая лежащие не на своём месте."""
+        try:
+            files, others = listing.result()
+        except OSError as e:
+            log_error("Не удалось прочитать каталог %s: %s", relpath, e)
+            self.stats["failed"] += 1
+            return
+        for name in others:
+            self._unexpected(os.path.join(relpath, name))
+        # Ключ шарда имени — его первые символы в нижнем регистре (storage_relpath)
+        prefix = len(key)
+        for name in files:
+            if len(name) < prefix or name[:prefix].lower() != key:
+                self._unexpected(os.path.join(relpath, name))
+                continue
+            self.stats["disk_files"] += 1
+            yield key, name, relpath
+
+    def _stored_files(self) -> Iterator[Tuple[str, str, List[int]]]:
+        """
+        Отдаёт уникальные имена файлов из БД в порядке обхода шардов.
+
+        Yields:
+            Кортежи (ключ_шарда, имя_файла, id_изображений).
+        """
+        current: Optional[Tuple[str, str]] = None
+        ids: List[int] = []
+        for key, name, image_id in Database.iter_stored_files(self.depth):
+            if (key, name) != current:
+                if current is not None:
+                    yield current[0], current[1], ids
+                self.stats["db_files"] += 1
+                current, ids = (key, name), []
+            if image_id is not None:
+                ids.append(image_id)
+        if current is not None:
+            yield current[0], current[1], ids
+
+    def _add_candidate(self, name: str, relpath: str) -> None:
+        """Добавляет файл в пачку кандидатов в сироты."""
+        self.candidates.append((name, relpath))
+        if len(self.candidates) >= self.batch_size:
+            self._flush_candidates()
+
+    def _collect(self, candidate: Tuple[str, str]) -> Tuple[str, int, str]:
+        """
+        Удаляет или переносит в карантин один файл-сироту (в пуле потоков).
+
+        Returns:
+            Кортеж (относительный_путь, размер, итог), где итог — 'orphan'
+            (только отчёт), 'removed', 'recent', 'gone' или 'failed'.
+        """
+        name, relpath = candidate
+        path = os.path.join(self.root, relpath)
+        try:
+            stat = os.lstat(path)
+        except FileNotFoundError:
+            return relpath, 0, "gone"
+        except OSError as e:
+            log_error("Не удалось проверить файл %s: %s", relpath, e)
+            return relpath, 0, "failed"
+        if stat.st_mtime >= self.cutoff:
+            return relpath, stat.st_size, "recent"
+        if self.action == "report":
+            return relpath, stat.st_size, "orphan"
+
+        try:
+            if self.action == "delete":
+                os.remove(path)
+            else:
+                target = os.path.join(self.quarantine, relpath)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            delete_thumbnails(name)
+        except OSError as e:
+            log_error("Ошибка обработки файла-сироты %s: %s", relpath, e)
+            return relpath, stat.st_size, "failed"
+        return relpath, stat.st_size, "removed"
+
+    def _flush_candidates(self) -> None:
+        """Перепроверяет пачку кандидатов по БД и обрабатывает оставшихся сирот."""
+        batch, self.candidates = self.candidates, []
+        if not batch:
+            return
+        sources = {name: optimized_source(name) or name for name, _ in batch}
+        stored = set(Database.find_stored_filenames(list(sources.values())))
+        orphans = [
+            candidate for candidate in batch if sources[candidate[0]] not in stored
+        ]
+        for relpath, size, outcome in self.pool.map(self._collect, orphans):
+            if outcome == "gone":
+                continue
+            if outcome == "recent":
+                self.stats["recent"] += 1
+                continue
+            self.stats["orphans"] += 1
+            self.stats["orphan_bytes"] += size
+            if outcome == "removed":
+                self.stats["removed"] += 1
+            elif outcome == "failed":
+                self.stats["failed"] += 1
+            self._write(
+                {"kind": "orphan", "path": relpath, "size": size, "status": outcome}
+            )
+
+    def _add_missing(self, name: str, ids: List[int]) -> None:
+        """Учитывает запись БД без файла в шардированной раскладке."""
+        # Файл ещё может лежать в плоской раскладке (миграция не завершена)
+        if os.path.isfile(os.path.join(self.root, name)):
+            self.stats["matched"] += 1
+            return
+        self.stats["missing"] += 1
+        self._write({"kind": "missing", "filename": name, "ids": ids})
+        if self.delete_missing_rows and ids:
+            self.missing.append((name, ids))
+            if len(self.missing) >= self.batch_size:
+                self._flush_missing()
+
+    def _flush_missing(self) -> None:
+        """Удаляет записи, файлы которых так и не нашлись при повторной проверке."""
+        batch, self.missing = self.missing, []
+        if not batch:
+            return
+        found = self.pool.map(find_relpath, [name for name, _ in batch])
+        ids = [
+            image_id
+            for (_, image_ids), relpath in zip(batch, found)
+            if relpath is None
+            for image_id in image_ids
+        ]
+        if not ids:
+            return
+        success, deleted_ids, _, _ = Database.delete_images_db(ids=ids, limit=len(ids))
+        if success:
+            self.stats["deleted_rows"] += len(deleted_ids)
+        else:
+            self.stats["failed"] += len(ids)
+
+    def run(self) -> Dict[str, int]:
+        """Выполняет сверку и возвращает статистику."""
+        try:
+            root_dirs = self._scan_root()
+            if self.depth > 0:
+                shards = self._shard_dirs("", root_dirs, 1)
+            else:
+                for name in root_dirs:
+                    self._unexpected(name)
+                shards = iter(())
+
+            stored = self._stored_files()
+            row = next(stored, None)
+            matched = None
+            for key, name, shard in self._disk_files(shards):
+                while row is not None and (row[0], row[1]) < (key, name):
+                    self._add_missing(row[1], row[2])
+                    row = next(stored, None)
+                if row is not None and (row[0], row[1]) == (key, name):
+                    self.stats["matched"] += 1
+                    matched = name
+                    row = next(stored, None)
+                elif matched is not None and optimized_source(name) == matched:
+                    # Варианты '<имя>.opt.*' идут в листинге сразу за <имя>
+                    self.stats["matched"] += 1
+                else:
+                    self._add_candidate(name, os.path.join(shard, name))
+                self._progress()
+            while row is not None:
+                self._add_missing(row[1], row[2])
+                row = next(stored, None)
+                self._progress()
+
+            self._flush_candidates()
+            self._flush_missing()
+        finally:
+            self.pool.shutdown()
+        return self.stats
+
+
+def reconcile(
+    action: str = "report",
+    grace_seconds: int = Config.RECONCILE_GRACE_SECONDS,
+    workers: int = Config.RECONCILE_WORKERS,
+    batch_size: int = Config.RECONCILE_BATCH,
+    delete_missing_rows: bool = False,
+    report_path: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Сверяет файлы в Config.UPLOAD_FOLDER с записями images и blobs.
+
+    Файлы, на которые нет ссылок в БД и которые старше grace_seconds,
+    считаются сиротами (в том числе брошенные временные файлы загрузок).
+    Файлы не на своём месте в раскладке и посторонние каталоги только
+    попадают в отчёт. Работает только с локальным хранилищем.
+
+    Args:
+        action: 'report' — только отчёт, 'delete' — удалить сирот,
+            'quarantine' — перенести их в Config.QUARANTINE_FOLDER.
+        grace_seconds: Минимальный возраст файла-сироты в секундах.
+        workers: Потоков для чтения каталогов и обработки файлов.
+        batch_size: Кандидатов в одной пачке проверки по БД.
+        delete_missing_rows: Удалить записи, для которых нет файла.
+        report_path: Файл, в который записать отчёт JSONL (по строке на
+            сироту, потерянный файл или посторонний элемент).
+
+    Returns:
+        Словарь со статистикой сверки.
+
+    Raises:
+        ValueError: Если хранилище не локальное, действие неизвестно или
+            карантин находится внутри Config.UPLOAD_FOLDER.
+    """
+    if Config.STORAGE_BACKEND != "local":
+        raise ValueError("Сверка поддерживает только STORAGE_BACKEND=local.")
+    if action not in ACTIONS:
+        raise ValueError(f"Неизвестное действие: {action}")
+    upload_root = os.path.abspath(Config.UPLOAD_FOLDER)
+    quarantine_root = os.path.abspath(Config.QUARANTINE_FOLDER)
+    if os.path.commonpath([upload_root, quarantine_root]) == upload_root:
+        raise ValueError("QUARANTINE_FOLDER не может быть внутри UPLOAD_FOLDER.")
+
+    start = time.monotonic()
+    report = open(report_path, "w", encoding="utf-8") if report_path else None
+    try:
+        stats = _Reconciler(
+            action, grace_seconds, workers, batch_size, delete_missing_rows, report
+        ).run()
+    finally:
+        if report is not None:
+            report.close()
+
+    log_info(
+        "Сверка завершена за %.1f с: файлов на диске %s, имён в БД %s, "
+        "сирот %s (%s, обработано %s), моложе %s с — %s, потеряно файлов %s, "
+        "удалено записей %s, посторонних элементов %s, ошибок %s",
+        time.monotonic() - start,
+        stats["disk_files"],
+        stats["db_files"],
+        stats["orphans"],
+        format_file_size(stats["orphan_bytes"]),
+        stats["removed"],
+        grace_seconds,
+        stats["recent"],
+        stats["missing"],
+        stats["deleted_rows"],
+        stats["unexpected"],
+        stats["failed"],
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    parser = argparse.ArgumentParser(
+        description="Сверка файлов изображений с БД и удаление файлов-сирот."
+    )
+    parser.add_argument(
+        "--action",
+        choices=ACTIONS,
+        default="report",
+        help="Что сделать с сиротами (по умолчанию только отчёт).",
+    )
+    parser.add_argument(
+        "--grace",
+        type=int,
+        default=Config.RECONCILE_GRACE_SECONDS,
+        help="Не трогать файлы моложе стольких секунд.",
+    )
+    parser.add_argument(
+        "--delete-missing-rows",
+        action="store_true",
+        help="Удалить записи изображений, для которых нет файла.",
+    )
+    parser.add_argument("--report", help="Записать подробный отчёт в файл JSONL.")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=Config.RECONCILE_WORKERS,
+        help="Потоков файловой системы.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=Config.RECONCILE_BATCH,
+        help="Кандидатов в одной пачке.",
+    )
+
+    args = parser.parse_args()
+
+    Database.init_pool(min_conn=1, max_conn=4)
+    try:
+        result = reconcile(
+            args.action,
+            args.grace,
+            args.workers,
+            args.batch_size,
+            args.delete_missing_rows,
+            args.report,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        Database.close_pool()
+
+    print(
+        f"Сирот: {result['orphans']} ({format_file_size(result['orphan_bytes'])}), "
+        f"обработано: {result['removed']}, потеряно файлов: {result['missing']}, "
+        f"ошибок: {result['failed']}"
+    )
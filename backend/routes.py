@@ -1,20 +1,155 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+)
+from werkzeug.http import is_resource_modified
 from werkzeug.utils import secure_filename
 
+from cache import cache_stats
+from catalog import catalog, catalog_etag
 from config import Config
 from database import Database
+from db_pool import PoolTimeoutError
+from file_serving import send_stored_file
+from metrics import observe_upload, render as render_metrics
 from models import Image
+from profiling import stage
+from storage import (
+    find_relpath,
+    get_storage,
+    image_url,
+    OPTIMIZED_URL_SUFFIX,
+    optimized_filename,
+    optimized_formats,
+)
+from thumbnails import thumbnail_cache
 from utils import (
+    FileTooLargeError,
+    content_addressed_filename,
+    decode_cursor,
     delete_file,
+    delete_files,
+    encode_cursor,
     format_file_size,
     get_file_extension,
     is_allowed_extension,
     log_error,
     log_success,
-    save_file,
+    save_file_stream,
+    write_temp_file,
 )
 
 
+def validate_upload(file) -> Optional[str]:
+    """
+    Проверяет загружаемый файл на соответствие требованиям (имя, тип).
+
+    Args:
+        file: Объект FileStorage из request.files.
+
+    Returns:
+        Текст ошибки или None, если файл подходит.
+    """
+    if not file or not file.filename:
+        return "Файл не найден"
+    if not is_allowed_extension(file.filename):
+        return "Неподдерживаемое расширение файла"
+    if file.content_type not in Config.ALLOWED_MIME_TYPES:
+        return "Неподдерживаемый тип файла"
+    return None
+
+
+def upload_result(image: Image) -> Dict[str, Any]:
+    """Формирует описание сохранённого изображения для ответа на загрузку."""
+    return {
+        "id": image.id,
+        "filename": image.filename,
+        "original_name": image.original_name,
+        "size": image.size,
+        "size_human": format_file_size(image.size),
+        "url": image_url(image.filename),
+        "job_status": image.job_status,
+    }
+
+
+def accepted_variants(filename: str, formats: Optional[List[str]] = None) -> List[str]:
+    """
+    Возвращает имена файлов, которыми можно ответить на запрос optimized_url.
+
+    Оптимизированные варианты (jobs.optimize_image) идут первыми, оригинал —
+    последним; из существующих первый всегда самый маленький. WebP
+    предлагается, только если клиент явно указал image/webp в Accept, как
+    это делают браузеры: '*/*' не означает, что клиент умеет WebP.
+
+    Args:
+        filename: Имя файла изображения или его путь в хранилище.
+        formats: Форматы созданных вариантов (images.variants); по умолчанию
+            все возможные, наличие файлов проверяет вызывающий.
+    """
+    name = os.path.basename(filename)
+    if formats is None:
+        formats = optimized_formats(name)
+    accepts_webp = any(
+        mimetype == "image/webp" and quality > 0
+        for mimetype, quality in request.accept_mimetypes
+    )
+    variants = [
+        optimized_filename(name, fmt)
+        for fmt in formats
+        if fmt != "webp" or accepts_webp
+    ]
+    return variants + [name]
+
+
+def conditional_on_catalog(view):
+    """
+    Делает ответ представления условным по поколению каталога изображений.
+
+    Успешный ответ получает ETag поколения каталога и Cache-Control: no-cache.
+    Если клиент прислал актуальный If-None-Match, возвращается 304 без вызова
+    представления, то есть без запросов к БД. Last-Modified не отдаётся:
+    у HTTP-даты секундная точность, и изменение каталога в ту же секунду
+    осталось бы незамеченным для клиента с одним If-Modified-Since.
+
+    Args:
+        view: Функция-представление Flask.
+
+    Returns:
+        Обёрнутое представление.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        state = catalog.state()
+        if state is None:
+            return view(*args, **kwargs)
+
+        etag = catalog_etag(state[0])
+        if is_resource_modified(request.environ, etag=etag):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        else:
+            response = make_response("", 304)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    return wrapper
+
+
 def register_routes(app: Flask):
     """
     Регистрирует все маршруты (endpoints) для Flask-приложения.
@@ -28,102 +163,306 @@ def register_routes(app: Flask):
         """Отдаёт главную HTML-страницу."""
         return render_template("index.html")
 
+    @app.errorhandler(PoolTimeoutError)
+    def db_pool_timeout(error: PoolTimeoutError):
+        """Отвечает 503, если за отведённое время не нашлось свободного соединения с БД."""
+        log_error("Пул соединений исчерпан: %s", error)
+        response = jsonify({"error": "Сервис перегружен, повторите запрос позже"})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+
     @app.get("/api/health")
     def health():
-        """Проверяет работоспособность сервиса."""
-        return jsonify({"ok": True}), 200
+        """Проверяет работоспособность сервиса и возвращает статистику пула БД и кэша."""
+        return (
+            jsonify(
+                {"ok": True, "db_pool": Database.pool_stats(), "cache": cache_stats()}
+            ),
+            200,
+        )
+
+    @app.get("/api/metrics")
+    def metrics():
+        """Отдаёт метрики приложения в текстовом формате Prometheus."""
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    upload_executor = ThreadPoolExecutor(
+        max_workers=Config.BATCH_UPLOAD_WORKERS, thread_name_prefix="upload"
+    )
 
     @app.post("/api/upload")
     def upload_file():
         """
         Обрабатывает загрузку файла изображения.
 
-        Проверяет файл на соответствие требованиям (размер, тип),
-        сохраняет его на диск с уникальным именем и записывает метаданные в БД.
+        Проверяет файл на соответствие требованиям (размер, тип), потоково
+        сохраняет его на диск с уникальным именем (без чтения в память целиком)
+        и записывает метаданные в БД. В режиме контентно-адресуемого хранения
+        повторная загрузка того же содержимого не создаёт новый файл.
 
         Returns:
             JSON с информацией о сохраненном файле или ошибке.
         """
-        if "file" not in request.files:
+        # Разбор multipart: тело запроса читается здесь
+        with stage("parse"):
+            files = request.files
+        if "file" not in files:
             return jsonify({"error": "Файл не выбран"}), 400
 
-        file = request.files["file"]
+        file = files["file"]
 
-        if not file or not file.filename:
-            return jsonify({"error": "Файл не найден"}), 400
-
-        if not is_allowed_extension(file.filename):
-            return jsonify({"error": "Неподдерживаемое расширение файла"}), 400
-
-        if file.content_type not in Config.ALLOWED_MIME_TYPES:
-            return jsonify({"error": "Неподдерживаемый тип файла"}), 400
+        with stage("validate"):
+            error = validate_upload(file)
+        if error:
+            return jsonify({"error": error}), 400
 
         try:
-            file_data = file.read()
-            file_size = len(file_data)
-
-            if file_size > Config.MAX_CONTENT_LENGTH:
-                max_size = format_file_size(Config.MAX_CONTENT_LENGTH)
-                return (
-                    jsonify(
-                        {
-                            "error": f"Файл слишком большой. Максимальный размер файла {max_size}"
-                        }
-                    ),
-                    400,
+            with stage("validate"):
+                original_name = secure_filename(file.filename)
+                file_type = get_file_extension(file.filename).replace(".", "")
+
+            if Config.CONTENT_ADDRESSED_STORAGE:
+                with stage("save"):
+                    temp_path, file_size, sha256 = write_temp_file(file.stream)
+                image = Image(
+                    filename=content_addressed_filename(sha256, original_name),
+                    original_name=original_name,
+                    size=file_size,
+                    file_type=file_type,
+                )
+                with stage("db"):
+                    success, image_id = Database.save_image_blob(
+                        image, sha256, temp_path
+                    )
+                if not success:
+                    return jsonify({"error": "Ошибка сохранения метаданных в БД"}), 500
+                new_filename = image.filename
+            else:
+                with stage("save"):
+                    success, result = save_file_stream(file.filename, file.stream)
+                if not success:
+                    return (
+                        jsonify({"error": f"Ошибка сохранения файла: {result}"}),
+                        500,
+                    )
+
+                new_filename = result.filename
+                file_size = result.size
+                image = Image(
+                    filename=new_filename,
+                    original_name=original_name,
+                    size=file_size,
+                    file_type=file_type,
                 )
 
-            success, result = save_file(file.filename, file_data)
-            if not success:
-                return jsonify({"error": f"Ошибка сохранения файла: {result}"}), 500
-
-            new_filename = result
-            file_type = get_file_extension(file.filename).replace(".", "")
-            image = Image(
-                filename=new_filename,
-                original_name=secure_filename(file.filename),
-                size=file_size,
-                file_type=file_type,
-            )
-
-            success, image_id = Database.save_image(image)
-            if not success:
-                delete_file(new_filename)
-                return jsonify({"error": "Ошибка сохранения метаданных в БД"}), 500
-
-            log_success(f"Изображение сохранено: {new_filename}")
+                try:
+                    with stage("db"):
+                        success, image_id = Database.save_image(image)
+                except PoolTimeoutError:
+                    delete_file(new_filename)
+                    raise
+                if not success:
+                    delete_file(new_filename)
+                    return jsonify({"error": "Ошибка сохранения метаданных в БД"}), 500
+                image.id = image_id
+
+            catalog.mark_stale()
+            observe_upload(file_size)
+            with stage("log"):
+                log_success("Изображение сохранено: %s", new_filename)
 
             return (
                 jsonify(
                     {
                         "success": True,
                         "message": "Файл успешно сохранён",
-                        "image": {
-                            "id": image_id,
-                            "filename": new_filename,
-                            "original_name": secure_filename(file.filename),
-                            "size": file_size,
-                            "size_human": format_file_size(file_size),
-                            "url": f"/images/{new_filename}",
-                        },
+                        "image": upload_result(image),
                     }
                 ),
                 201,
             )
 
+        except PoolTimeoutError:
+            raise
+        except FileTooLargeError:
+            max_size = format_file_size(Config.MAX_CONTENT_LENGTH)
+            return (
+                jsonify(
+                    {
+                        "error": f"Файл слишком большой. Максимальный размер файла {max_size}"
+                    }
+                ),
+                400,
+            )
         except Exception as e:
-            log_error(f"Ошибка загрузки файла: {e}", exc_info=True)
+            log_error("Ошибка загрузки файла: %s", e, exc_info=True)
             return (
                 jsonify({"error": "Внутренняя ошибка сервера при загрузке файла"}),
                 500,
             )
 
+    @app.post("/api/upload/batch")
+    def upload_batch():
+        """
+        Обрабатывает пакетную загрузку нескольких файлов в одном запросе.
+
+        Принимает несколько частей `file` в multipart-запросе. Файлы
+        записываются на диск параллельно, а метаданные всех успешно
+        записанных файлов вставляются одним многострочным INSERT. Ошибка
+        отдельного файла не отменяет сохранение остальных.
+
+        Returns:
+            JSON с результатом по каждому файлу: 201, если сохранены все
+            файлы, иначе 207.
+        """
+        request.max_content_length = Config.MAX_BATCH_CONTENT_LENGTH
+        with stage("parse"):
+            files = request.files.getlist("file")
+        if not files:
+            return jsonify({"error": "Файлы не выбраны"}), 400
+        if len(files) > Config.MAX_BATCH_FILES:
+            return (
+                jsonify(
+                    {
+                        "error": f"Слишком много файлов. Максимум {Config.MAX_BATCH_FILES}"
+                    }
+                ),
+                400,
+            )
+
+        results: List[Dict[str, Any]] = [
+            {"success": False, "original_name": secure_filename(f.filename or "")}
+            for f in files
+        ]
+        accepted = []
+        with stage("validate"):
+            for index, file in enumerate(files):
+                error = validate_upload(file)
+                if error:
+                    results[index]["error"] = error
+                else:
+                    accepted.append(index)
+
+        def write(index: int):
+            file = files[index]
+            try:
+                if Config.CONTENT_ADDRESSED_STORAGE:
+                    return True, write_temp_file(file.stream)
+                return save_file_stream(file.filename, file.stream)
+            except FileTooLargeError:
+                max_size = format_file_size(Config.MAX_CONTENT_LENGTH)
+                return (
+                    False,
+                    f"Файл слишком большой. Максимальный размер файла {max_size}",
+                )
+            except Exception as e:
+                log_error("Ошибка записи файла %s: %s", file.filename, e, exc_info=True)
+                return False, "Ошибка сохранения файла"
+
+        pending: List[Tuple[int, Image]] = []
+        blob_pending: List[Tuple[int, Image, str, str]] = []
+        for index, (success, value) in zip(
+            accepted, upload_executor.map(write, accepted)
+        ):
+            if not success:
+                results[index]["error"] = value
+                continue
+
+            original_name = results[index]["original_name"]
+            file_type = get_file_extension(files[index].filename).replace(".", "")
+            if Config.CONTENT_ADDRESSED_STORAGE:
+                temp_path, file_size, sha256 = value
+                image = Image(
+                    filename=content_addressed_filename(sha256, original_name),
+                    original_name=original_name,
+                    size=file_size,
+                    file_type=file_type,
+                )
+                blob_pending.append((index, image, sha256, temp_path))
+            else:
+                pending.append(
+                    (
+                        index,
+                        Image(
+                            filename=value.filename,
+                            original_name=original_name,
+                            size=value.size,
+                            file_type=file_type,
+                        ),
+                    )
+                )
+
+        if pending:
+            try:
+                with stage("db"):
+                    image_ids = Database.save_images([image for _, image in pending])
+            except PoolTimeoutError:
+                delete_files([image.filename for _, image in pending])
+                raise
+            for (index, image), image_id in zip(pending, image_ids):
+                if image_id is None:
+                    delete_file(image.filename)
+                    results[index]["error"] = "Ошибка сохранения метаданных в БД"
+                else:
+                    image.id = image_id
+                    observe_upload(image.size)
+                    results[index] = {"success": True, **upload_result(image)}
+
+        if blob_pending:
+            # При нехватке соединений save_image_blobs сам удаляет временные файлы
+            with stage("db"):
+                image_ids = Database.save_image_blobs(
+                    [image for _, image, _, _ in blob_pending],
+                    [sha256 for _, _, sha256, _ in blob_pending],
+                    [temp_path for _, _, _, temp_path in blob_pending],
+                )
+            for (index, image, _, _), image_id in zip(blob_pending, image_ids):
+                if image_id is None:
+                    results[index]["error"] = "Ошибка сохранения метаданных в БД"
+                else:
+                    observe_upload(image.size)
+                    results[index] = {"success": True, **upload_result(image)}
+
+        saved = sum(1 for result in results if result["success"])
+        if saved:
+            catalog.mark_stale()
+        log_success("Пакетная загрузка: сохранено %s из %s", saved, len(files))
+        return (
+            jsonify(
+                {
+                    "success": saved == len(files),
+                    "saved": saved,
+                    "failed": len(files) - saved,
+                    "results": results,
+                }
+            ),
+            201 if saved == len(files) else 207,
+        )
+
+    @app.get("/api/images/<int:image_id>")
+    def get_image(image_id: int):
+        """
+        Возвращает метаданные одного изображения.
+
+        Args:
+            image_id: ID изображения.
+
+        Returns:
+            JSON с данными изображения или 404, если его нет.
+        """
+        image = Database.get_image(image_id)
+        if not image:
+            return jsonify({"error": "Изображение не найдено"}), 404
+        return jsonify({"success": True, "image": image.to_dict()}), 200
+
     @app.delete("/api/images/<int:image_id>")
     def delete_image(image_id: int):
         """
         Удаляет изображение по его ID.
 
-        Удаляет метаданные из БД и соответствующий файл с диска.
+        Удаляет метаданные из БД и соответствующий файл с диска. В режиме
+        контентно-адресуемого хранения файл удаляется только вместе с
+        последней ссылающейся на него записью.
 
         Args:
             image_id: ID изображения для удаления.
@@ -132,11 +471,12 @@ def register_routes(app: Flask):
             JSON с подтверждением успеха или сообщением об ошибке.
         """
         success, filename = Database.delete_image_db(image_id)
+        catalog.mark_stale()
 
-        if not success or not filename:
+        if not success:
             return jsonify({"error": "Изображение не найдено"}), 404
 
-        if not delete_file(filename):
+        if filename and not delete_file(filename):
             # В этом случае запись в БД уже удалена. Это пограничный случай,
             # который требует внимания администратора (файл-сирота на диске).
             return (
@@ -150,27 +490,141 @@ def register_routes(app: Flask):
 
         return jsonify({"success": True, "message": "Изображение удалено"}), 200
 
+    @app.post("/api/images/delete")
+    def delete_images_bulk():
+        """
+        Удаляет несколько изображений одним запросом.
+
+        Принимает JSON вида {"ids": [1, 2, 3]} и/или
+        {"filter": {"uploaded_before": "2024-01-01T00:00:00", "file_type": "gif"}}.
+        Записи удаляются одним SQL-запросом (не более Config.MAX_BULK_DELETE
+        за вызов), файлы — параллельно в пуле потоков.
+
+        Returns:
+            JSON с ID удалённых записей, списком файлов-сирот — файлов, которые
+            не удалось удалить с диска или которых там уже не было, — и признаком
+            has_more: под фильтр попали ещё записи сверх лимита.
+        """
+        payload = request.get_json(silent=True) or {}
+        if not isinstance(payload, dict):
+            return jsonify({"error": "Неверные параметры удаления"}), 400
+        ids = payload.get("ids")
+        filters = payload.get("filter") or {}
+
+        try:
+            if not isinstance(filters, dict):
+                raise ValueError("filter")
+            if ids is not None:
+                if not isinstance(ids, list) or len(ids) > Config.MAX_BULK_DELETE:
+                    raise ValueError("ids")
+                ids = [int(image_id) for image_id in ids]
+            uploaded_before = filters.get("uploaded_before")
+            if uploaded_before is not None:
+                uploaded_before = datetime.fromisoformat(uploaded_before)
+            file_type = filters.get("file_type")
+            if file_type is not None:
+                file_type = str(file_type).lower().lstrip(".")
+        except (ValueError, TypeError, AttributeError):
+            return jsonify({"error": "Неверные параметры удаления"}), 400
+
+        if ids is None and uploaded_before is None and file_type is None:
+            return jsonify({"error": "Не указаны ids или filter"}), 400
+        if ids == []:
+            return jsonify(
+                {
+                    "success": True,
+                    "deleted": 0,
+                    "ids": [],
+                    "orphans": [],
+                    "has_more": False,
+                }
+            )
+
+        success, deleted_ids, filenames, has_more = Database.delete_images_db(
+            ids=ids, uploaded_before=uploaded_before, file_type=file_type
+        )
+        catalog.mark_stale()
+        if not success:
+            return jsonify({"error": "Ошибка удаления из БД"}), 500
+
+        orphans = delete_files(filenames)
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "deleted": len(deleted_ids),
+                    "ids": deleted_ids,
+                    "orphans": orphans,
+                    "has_more": has_more,
+                }
+            ),
+            200,
+        )
+
     @app.get("/api/images")
+    @conditional_on_catalog
     def list_images():
         """
         Возвращает постраничный список загруженных изображений.
 
-        Принимает query-параметры `page` и `per_page`.
+        Принимает query-параметры `page` и `per_page`. Если передан параметр
+        `cursor` (пустое значение — первая страница), используется
+        keyset-пагинация: ответ содержит `next_cursor` для следующего запроса,
+        а глубина страницы не влияет на время ответа.
+
+        Параметр `total` управляет подсчётом общего количества: `exact`
+        (по умолчанию, поддерживаемый счётчик), `estimate` (оценка
+        планировщика) или `none` (без подсчёта).
+
+        Ответ условный: пока каталог не менялся, запрос с If-None-Match
+        получает 304 без обращения к БД.
 
         Returns:
             JSON с массивом изображений и информацией о пагинации.
         """
         try:
-            page = int(request.args.get("page", "1"))
             per_page = int(request.args.get("per_page", str(Config.ITEM_PER_PAGE)))
-
-            # Валидация параметров пагинации
-            page = max(1, page)
             per_page = min(
                 max(per_page, Config.MIN_ITEMS_PER_PAGE), Config.MAX_DISPLAY_ITEMS
             )
 
-            images, total = Database.get_images(page, per_page)
+            total_mode = request.args.get("total", "exact")
+            if total_mode not in Config.TOTAL_MODES:
+                return jsonify({"error": "Неверное значение параметра total"}), 400
+
+            if "cursor" in request.args:
+                cursor = request.args.get("cursor", "")
+                after = decode_cursor(cursor) if cursor else None
+                images, has_more, total = Database.get_images_after(
+                    after, per_page, total_mode
+                )
+                next_cursor = None
+                if has_more and images:
+                    last = images[-1]
+                    next_cursor = encode_cursor(last.upload_time, last.id)
+                return (
+                    jsonify(
+                        {
+                            "success": True,
+                            "images": [img.to_dict() for img in images],
+                            "next_cursor": next_cursor,
+                            "total": total,
+                            "per_page": per_page,
+                        }
+                    ),
+                    200,
+                )
+
+            page = int(request.args.get("page", "1"))
+
+            # Валидация параметров пагинации
+            page = max(1, page)
+
+            images, has_more, total = Database.get_images(page, per_page, total_mode)
+            next_cursor = None
+            if images and has_more:
+                last = images[-1]
+                next_cursor = encode_cursor(last.upload_time, last.id)
             return (
                 jsonify(
                     {
@@ -179,6 +633,7 @@ def register_routes(app: Flask):
                         "total": total,
                         "page": page,
                         "per_page": per_page,
+                        "next_cursor": next_cursor,
                     }
                 ),
                 200,
@@ -191,23 +646,131 @@ def register_routes(app: Flask):
         """
         Возвращает одно случайное изображение из базы данных.
 
+        С query-параметром `count` возвращает до `count` различных случайных
+        изображений за один запрос.
+
+        Ответ запрещено кэшировать (Cache-Control: no-store): каждый запрос
+        должен давать новую выборку.
+
         Returns:
-            JSON с данными одного изображения или null, если их нет.
+            JSON с данными одного изображения или null, если их нет,
+            либо массив изображений при указании `count`.
         """
+        no_store = {"Cache-Control": "no-store"}
+        if "count" in request.args:
+            try:
+                count = int(request.args.get("count", "1"))
+            except ValueError:
+                return jsonify({"error": "Неверный параметр count"}), 400
+            count = min(max(count, 1), Config.MAX_RANDOM_COUNT)
+            images = Database.get_random_images(count)
+            return (
+                jsonify({"success": True, "images": [img.to_dict() for img in images]}),
+                200,
+                no_store,
+            )
+
         img = Database.get_random()
         if not img:
-            return jsonify({"success": True, "image": None}), 200
-        return jsonify({"success": True, "image": img.to_dict()}), 200
+            return jsonify({"success": True, "image": None}), 200, no_store
+        return jsonify({"success": True, "image": img.to_dict()}), 200, no_store
 
     @app.get("/images/<path:filename>")
     def serve_image(filename: str):
         """
         Отдаёт статический файл изображения из папки загрузок.
 
-        Этот маршрут используется в основном для локальной разработки без Nginx
-        или как fallback. В продакшене файлы должен отдавать Nginx.
+        Маршрут нужен, когда перед backend нет Nginx или у Nginx нет доступа
+        к файлам. Файл отдаётся через X-Accel-Redirect или os.sendfile
+        с поддержкой Range и ETag по имени файла и кэшируется навсегда, как
+        /images/ в Nginx (см. file_serving.py).
+
+        Принимает как шардированный путь ('ab/cd/<имя>'), так и просто имя
+        файла; файл ищется в шардированной, а затем в старой плоской раскладке.
+        По '<имя>.opt' (optimized_url) отдаётся самый маленький
+        оптимизированный вариант, который принимает клиент (см.
+        accepted_variants), поэтому такой ответ зависит от Accept; по
+        остальным адресам — ровно запрошенный файл. Если хранилище выдаёт
+        внешние ссылки (S3), клиент перенаправляется на подписанную ссылку;
+        перенаправление кэшируется браузером на половину срока её жизни.
 
         Args:
-            filename: Имя файла изображения.
+            filename: Имя файла изображения или его путь в хранилище.
         """
-        return send_from_directory(Config.UPLOAD_FOLDER, filename)
+        negotiated = filename.endswith(OPTIMIZED_URL_SUFFIX)
+        if negotiated:
+            filename = filename[: -len(OPTIMIZED_URL_SUFFIX)]
+        name = os.path.basename(filename)
+        storage = get_storage()
+        url = storage.read_url(name)
+        if url is not None:
+            if negotiated:
+                # Варианты во внешнем хранилище берутся из БД, а не проверяются
+                # запросами HEAD
+                optimization = Database.get_optimization(name)
+                formats = optimization[1] if optimization else []
+                url = storage.read_url(accepted_variants(name, formats)[0])
+            response = redirect(url)
+            response.headers["Cache-Control"] = (
+                f"private, max-age={Config.S3_PRESIGN_TTL // 2}"
+            )
+            if negotiated:
+                response.vary.add("Accept")
+            return response
+
+        candidates = accepted_variants(name) if negotiated else [name]
+        for candidate in candidates:
+            relpath = find_relpath(candidate)
+            if relpath:
+                break
+        else:
+            abort(404)
+        try:
+            response = send_stored_file(
+                Config.UPLOAD_FOLDER,
+                relpath,
+                Config.IMAGE_CACHE_CONTROL,
+                etag=os.path.basename(relpath),
+            )
+        except FileNotFoundError:
+            abort(404)
+        if negotiated:
+            response.vary.add("Accept")
+        return response
+
+    @app.get("/thumbs/<int:width>/<path:variant>")
+    def serve_thumbnail(width: int, variant: str):
+        """
+        Отдаёт уменьшенный вариант изображения, создавая его при первом запросе.
+
+        URL имеет вид '/thumbs/<ширина>/<путь_в_хранилище>.<формат>', например
+        '/thumbs/200/ab/cd/<имя>.png.webp'. Готовый вариант сохраняется в
+        Config.THUMBS_FOLDER, откуда его дальше отдаёт Nginx без участия Flask.
+
+        Args:
+            width: Ширина варианта (одна из Config.THUMB_WIDTHS).
+            variant: Путь исходного файла с добавленным расширением формата.
+        """
+        filename, _, fmt = os.path.basename(variant).rpartition(".")
+        if width not in Config.THUMB_WIDTHS or fmt not in Config.THUMB_FORMATS:
+            abort(404)
+
+        if not filename:
+            abort(404)
+
+        try:
+            relpath = thumbnail_cache.get(filename, width, fmt)
+        except FileNotFoundError:
+            abort(404)
+        except Exception as e:
+            log_error("Ошибка создания варианта %s: %s", variant, e, exc_info=True)
+            return jsonify({"error": "Не удалось создать вариант изображения"}), 500
+
+        try:
+            return send_stored_file(
+                Config.THUMBS_FOLDER,
+                relpath,
+                f"public, max-age={Config.THUMB_CACHE_MAX_AGE}",
+            )
+        except FileNotFoundError:
+            abort(404)
@@ -0,0 +1,160 @@
+"""
+Хранилище исходных файлов в S3-совместимом объектном хранилище (AWS S3, MinIO).
+
+Ключ объекта совпадает с путём файла в локальной шардированной раскладке
+('ab/cd/<имя>'). Загрузка идёт из временного файла, который сервер уже
+записал потоково (по нему считаются размер и SHA-256): большие файлы
+отправляются частями (multipart) в несколько потоков. Чтение отдаётся
+браузеру подписанной ссылкой (presigned GET), а не через backend.
+
+Клиент boto3 потокобезопасен и держит пул keep-alive соединений размером
+Config.S3_MAX_POOL_CONNECTIONS, общий для всех потоков процесса.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import BotoCoreError, ClientError
+
+from config import Config
+from storage import storage_relpath
+
+# Коды ошибки S3 для отсутствующего объекта
+_NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+
+
+def _client(endpoint_url: Optional[str]):
+    """Создаёт клиент S3 с пулом соединений и ретраями."""
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=endpoint_url,
+        region_name=Config.S3_REGION,
+        aws_access_key_id=Config.S3_ACCESS_KEY,
+        aws_secret_access_key=Config.S3_SECRET_KEY,
+        config=BotoConfig(
+            max_pool_connections=Config.S3_MAX_POOL_CONNECTIONS,
+            retries={"max_attempts": 3, "mode": "standard"},
+            connect_timeout=5,
+            read_timeout=30,
+            signature_version="s3v4",
+            # MinIO и большинство совместимых хранилищ не поддерживают
+            # виртуальные хосты для бакетов
+            s3={"addressing_style": "path" if endpoint_url else "auto"},
+        ),
+    )
+
+
+class S3Storage:
+    """Хранилище исходных файлов в бакете Config.S3_BUCKET (см. LocalStorage)."""
+
+    def __init__(self):
+        self.bucket = Config.S3_BUCKET
+        self.client = _client(Config.S3_ENDPOINT_URL)
+        # Подписанные ссылки должны указывать на адрес, доступный браузеру;
+        # подпись считается локально, соединений этот клиент не открывает
+        if Config.S3_PUBLIC_ENDPOINT_URL:
+            self.presign_client = _client(Config.S3_PUBLIC_ENDPOINT_URL)
+        else:
+            self.presign_client = self.client
+        self.transfer_config = TransferConfig(
+            multipart_threshold=Config.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=Config.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=Config.S3_MULTIPART_CONCURRENCY,
+        )
+
+    def place(self, temp_path: str, filename: str) -> None:
+        """
+        Загружает временный файл в бакет и удаляет его.
+
+        При ошибке загрузки временный файл остаётся на месте.
+        """
+        self.client.upload_file(
+            temp_path,
+            self.bucket,
+            storage_relpath(filename),
+            Config=self.transfer_config,
+        )
+        os.remove(temp_path)
+
+    def exists(self, filename: str) -> bool:
+        """Проверяет наличие объекта запросом HEAD."""
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=storage_relpath(filename))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in _NOT_FOUND_CODES:
+                return False
+            raise
+        return True
+
+    @contextmanager
+    def fetch(self, filename: str) -> Iterator[str]:
+        """
+        Скачивает объект во временный файл на время блока with.
+
+        Raises:
+            FileNotFoundError: Если объекта нет в бакете.
+        """
+        fd, path = tempfile.mkstemp(prefix="s3-", suffix=os.path.splitext(filename)[1])
+        os.close(fd)
+        try:
+            try:
+                self.client.download_file(
+                    self.bucket,
+                    storage_relpath(filename),
+                    path,
+                    Config=self.transfer_config,
+                )
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in _NOT_FOUND_CODES:
+                    raise FileNotFoundError(f"Файл не найден: {filename}") from e
+                raise
+            yield path
+        finally:
+            os.remove(path)
+
+    def delete(self, filename: str) -> bool:
+        """
+        Удаляет объект из бакета.
+
+        S3 не сообщает, существовал ли объект, поэтому удаление
+        отсутствующего файла тоже считается успешным.
+        """
+        self.client.delete_object(Bucket=self.bucket, Key=storage_relpath(filename))
+        return True
+
+    def delete_many(self, filenames: List[str]) -> List[str]:
+        """
+        Удаляет объекты пачками по Config.S3_DELETE_BATCH ключей (DeleteObjects).
+
+        Returns:
+            Имена файлов, которые не удалось удалить.
+        """
+        keys = {storage_relpath(name): name for name in filenames}
+        failed = []
+        batch = Config.S3_DELETE_BATCH
+        key_list = list(keys)
+        for start in range(0, len(key_list), batch):
+            chunk = key_list[start : start + batch]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True},
+                )
+            except (BotoCoreError, ClientError):
+                failed.extend(keys[key] for key in chunk)
+                continue
+            failed.extend(keys[error["Key"]] for error in response.get("Errors", []))
+        return failed
+
+    def read_url(self, filename: str) -> Optional[str]:
+        """Возвращает подписанную ссылку на чтение на Config.S3_PRESIGN_TTL секунд."""
+        return self.presign_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": storage_relpath(filename)},
+            ExpiresIn=Config.S3_PRESIGN_TTL,
+        )
@@ -0,0 +1,327 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from config import Config
+
+
+# Разделитель в именах оптимизированных вариантов (optimized_filename)
+OPTIMIZED_INFIX = ".opt."
+# Суффикс URL, по которому отдаётся лучший из вариантов (optimized_url)
+OPTIMIZED_URL_SUFFIX = ".opt"
+# Расширения, которые пережимаются без потерь в том же формате
+RECOMPRESSED_FORMATS = ("jpg", "jpeg", "png")
+
+
+def storage_relpath(filename: str) -> str:
+    """
+    Возвращает путь файла относительно директории загрузок с учётом шардинга.
+
+    Файлы раскладываются по подкаталогам из первых символов имени (UUID или
+    SHA-256), например 'ab/cd/abcd...png' при глубине 2. Так ни один каталог
+    не разрастается до миллионов записей.
+
+    Args:
+        filename: Имя файла (без каталогов).
+
+    Returns:
+        Относительный путь к файлу.
+    """
+    name = os.path.basename(filename)
+    depth = Config.STORAGE_SHARD_DEPTH
+    if depth <= 0 or len(name) < depth * 2:
+        return name
+    parts = [name[i * 2 : i * 2 + 2].lower() for i in range(depth)]
+    return "/".join(parts + [name])
+
+
+def file_path(filename: str) -> str:
+    """
+    Возвращает абсолютный путь, по которому файл должен храниться.
+
+    Args:
+        filename: Имя файла.
+
+    Returns:
+        Путь внутри Config.UPLOAD_FOLDER.
+    """
+    return os.path.join(Config.UPLOAD_FOLDER, storage_relpath(filename))
+
+
+def find_relpath(filename: str) -> Optional[str]:
+    """
+    Находит существующий файл в шардированной или старой плоской раскладке.
+
+    Плоская раскладка проверяется вторым шагом, чтобы файлы оставались
+    доступны, пока идёт миграция (см. migrate_storage.py).
+
+    Args:
+        filename: Имя файла.
+
+    Returns:
+        Относительный путь к найденному файлу или None.
+    """
+    name = os.path.basename(filename)
+    for relpath in (storage_relpath(name), name):
+        if os.path.isfile(os.path.join(Config.UPLOAD_FOLDER, relpath)):
+            return relpath
+    return None
+
+
+def find_file_path(filename: str) -> Optional[str]:
+    """
+    Возвращает абсолютный путь к существующему файлу или None.
+
+    Args:
+        filename: Имя файла.
+    """
+    relpath = find_relpath(filename)
+    return os.path.join(Config.UPLOAD_FOLDER, relpath) if relpath else None
+
+
+def place_file(temp_path: str, filename: str) -> str:
+    """
+    Атомарно перемещает временный файл на его место в хранилище.
+
+    Args:
+        temp_path: Путь к временному файлу в Config.UPLOAD_FOLDER.
+        filename: Итоговое имя файла.
+
+    Returns:
+        Итоговый абсолютный путь к файлу.
+    """
+    target = file_path(filename)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(temp_path, target)
+    return target
+
+
+def image_url(filename: str) -> str:
+    """Возвращает публичный URL изображения."""
+    return f"/images/{storage_relpath(filename)}"
+
+
+def optimized_url(filename: str) -> str:
+    """
+    Возвращает URL, по которому отдаётся самый маленький вариант изображения,
+    принимаемый клиентом (по Accept).
+
+    Отдельный от image_url адрес нужен, чтобы оба ответа можно было
+    кэшировать навсегда: по image_url всегда отдаётся оригинал, а этот URL
+    публикуется только после того, как все варианты созданы.
+    """
+    return f"{image_url(filename)}{OPTIMIZED_URL_SUFFIX}"
+
+
+def thumb_relpath(filename: str, width: int, fmt: str) -> str:
+    """
+    Возвращает путь варианта изображения относительно Config.THUMBS_FOLDER.
+
+    Путь совпадает с URL после '/thumbs/', поэтому Nginx отдаёт готовые
+    варианты напрямую с диска.
+
+    Args:
+        filename: Имя исходного файла.
+        width: Ширина варианта в пикселях.
+        fmt: Формат варианта ('webp', 'jpg', 'png').
+
+    Returns:
+        Относительный путь вида '200/ab/cd/<имя>.webp'.
+    """
+    return f"{width}/{storage_relpath(filename)}.{fmt}"
+
+
+def thumb_url(filename: str, width: int = 200, fmt: str = "webp") -> str:
+    """Возвращает публичный URL варианта изображения."""
+    return f"/thumbs/{thumb_relpath(filename, width, fmt)}"
+
+
+def optimized_filename(filename: str, fmt: str) -> str:
+    """
+    Возвращает имя оптимизированного варианта исходного файла.
+
+    Варианты хранятся в том же хранилище, что и оригинал, и попадают в его
+    каталог шарда: '<имя>.opt.webp' или '<имя>.opt.<исходное расширение>'.
+
+    Args:
+        filename: Имя исходного файла.
+        fmt: Формат варианта (расширение без точки).
+    """
+    return f"{os.path.basename(filename)}{OPTIMIZED_INFIX}{fmt}"
+
+
+def optimized_formats(filename: str) -> List[str]:
+    """
+    Возвращает форматы оптимизированных вариантов файла в порядке отдачи.
+
+    WebP есть у всех статичных изображений; вариант в исходном формате —
+    только у JPEG и PNG, которые можно пережать без потерь.
+
+    Args:
+        filename: Имя исходного файла.
+    """
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    return ["webp", ext] if ext in RECOMPRESSED_FORMATS else ["webp"]
+
+
+def optimized_filenames(filename: str) -> List[str]:
+    """Возвращает имена всех возможных оптимизированных вариантов файла."""
+    return [optimized_filename(filename, fmt) for fmt in optimized_formats(filename)]
+
+
+def optimized_source(filename: str) -> Optional[str]:
+    """Возвращает имя исходного файла для имени варианта или None."""
+    source, infix, _ = os.path.basename(filename).rpartition(OPTIMIZED_INFIX)
+    return source if infix and source else None
+
+
+def delete_thumbnails(filename: str) -> None:
+    """
+    Удаляет все уменьшенные варианты файла из Config.THUMBS_FOLDER.
+
+    Args:
+        filename: Имя исходного файла.
+    """
+    for width in Config.THUMB_WIDTHS:
+        for fmt in Config.THUMB_FORMATS:
+            try:
+                os.remove(
+                    os.path.join(
+                        Config.THUMBS_FOLDER, thumb_relpath(filename, width, fmt)
+                    )
+                )
+            except FileNotFoundError:
+                continue
+
+
+class LocalStorage:
+    """
+    Хранилище исходных файлов в Config.UPLOAD_FOLDER (по умолчанию).
+
+    Все хранилища предоставляют одинаковый набор методов: place, exists,
+    fetch, delete, delete_many и read_url; вызывающий код получает текущее
+    хранилище через get_storage(). Уменьшенные варианты всегда хранятся
+    локально в Config.THUMBS_FOLDER.
+    """
+
+    def place(self, temp_path: str, filename: str) -> None:
+        """
+        Помещает временный файл в хранилище под итоговым именем.
+
+        Временный файл после успешного размещения больше не существует.
+
+        Args:
+            temp_path: Путь к временному файлу в Config.UPLOAD_FOLDER.
+            filename: Итоговое имя файла.
+        """
+        place_file(temp_path, filename)
+
+    def exists(self, filename: str) -> bool:
+        """Проверяет, есть ли файл в хранилище."""
+        return find_relpath(filename) is not None
+
+    @contextmanager
+    def fetch(self, filename: str) -> Iterator[str]:
+        """
+        Предоставляет локальный путь к содержимому файла на время блока with.
+
+        Args:
+            filename: Имя файла.
+
+        Raises:
+            FileNotFoundError: Если файла нет в хранилище.
+        """
+        path = find_file_path(filename)
+        if not path:
+            raise FileNotFoundError(f"Файл не найден: {filename}")
+        yield path
+
+    def delete(self, filename: str) -> bool:
+        """
+        Удаляет файл из хранилища.
+
+        Returns:
+            True, если файл удалён, False — если его не было.
+        """
+        path = find_file_path(filename)
+        if not path:
+            return False
+        os.remove(path)
+        return True
+
+    def _delete_quietly(self, filename: str) -> bool:
+        """Удаляет файл, считая ошибку удаления неудачей."""
+        try:
+            return self.delete(filename)
+        except OSError:
+            return False
+
+    def delete_many(self, filenames: List[str]) -> List[str]:
+        """
+        Параллельно удаляет несколько файлов.
+
+        Returns:
+            Имена файлов, которые не удалось удалить или которых не было.
+        """
+        if not filenames:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(Config.FILE_DELETE_WORKERS, len(filenames))
+        ) as executor:
+            results = list(executor.map(self._delete_quietly, filenames))
+        return [name for name, deleted in zip(filenames, results) if not deleted]
+
+    def read_url(self, filename: str) -> Optional[str]:
+        """
+        Возвращает внешний URL для чтения файла.
+
+        Локальные файлы отдаются самим сервером (Nginx или Flask), поэтому
+        внешнего URL нет.
+        """
+        return None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    Возвращает хранилище исходных файлов, выбранное Config.STORAGE_BACKEND.
+
+    Хранилище создаётся лениво, один раз на процесс: драйвер S3 держит пул
+    HTTP-соединений, который нельзя разделять между процессами, поэтому
+    после fork дочерний процесс создаёт своё.
+
+    Returns:
+        LocalStorage или s3_storage.S3Storage.
+
+    Raises:
+        ValueError: Если Config.STORAGE_BACKEND имеет неизвестное значение.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if Config.STORAGE_BACKEND == "local":
+                    _storage = LocalStorage()
+                elif Config.STORAGE_BACKEND == "s3":
+                    from s3_storage import S3Storage
+
+                    _storage = S3Storage()
+                else:
+                    raise ValueError(
+                        f"Неизвестное хранилище STORAGE_BACKEND={Config.STORAGE_BACKEND}"
+                    )
+    return _storage
+
+
+def _forget_storage() -> None:
+    """Сбрасывает хранилище, унаследованное дочерним процессом при fork."""
+    global _storage
+    _storage = None
+
+
+os.register_at_fork(after_in_child=_forget_storage)
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from config import Config
+from storage import get_storage, thumb_relpath
+from utils import log_error, log_info
+
+
+def render_thumbnail(source_path: str, target_path: str, width: int, fmt: str) -> int:
+    """
+    Создаёт уменьшенный вариант изображения. Выполняется в пуле процессов.
+
+    Изображение поворачивается по EXIF, уменьшается с сохранением пропорций
+    (без увеличения) и атомарно записывается по целевому пути.
+
+    Args:
+        source_path: Путь к исходному файлу.
+        target_path: Путь, по которому сохранить вариант.
+        width: Максимальная ширина в пикселях.
+        fmt: Формат варианта ('webp', 'jpg', 'png').
+
+    Returns:
+        Размер созданного файла в байтах.
+    """
+    with PILImage.open(source_path) as img:
+        # Для JPEG декодируем сразу в уменьшенном масштабе — это в разы быстрее
+        img.draft("RGB", (width, width * 8))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((width, width * 8), PILImage.Resampling.LANCZOS)
+
+        pil_format = Config.THUMB_FORMATS[fmt]
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        img.save(temp_path, pil_format, quality=Config.THUMB_QUALITY, optimize=True)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+class ThumbnailCache:
+    """
+    Дисковый кэш вариантов изображений с ограничением по размеру.
+
+    Варианты создаются в пуле процессов; параллельные запросы одного и того
+    же варианта в рамках процесса ждут один общий рендер. Размер кэша
+    ограничивает не процесс, который рендерит, а один периодический
+    проход sweep() (его запускает worker.py): варианты пишут все воркеры
+    gunicorn и задачи jobs.generate_thumbnails, и только обход каталога
+    видит их все. Вытеснение идёт по времени создания (FIFO): готовые
+    варианты отдаёт Nginx, и обращения к ним backend не видит.
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Лениво создаёт пул процессов для рендеринга."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=Config.THUMB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def get(self, filename: str, width: int, fmt: str) -> str:
+        """
+        Возвращает относительный путь варианта, создавая его при необходимости.
+
+        Исходный файл берётся из хранилища (get_storage().fetch) только
+        запросом, который рендерит вариант; для S3 это одно скачивание
+        на вариант.
+
+        Args:
+            filename: Имя исходного файла.
+            width: Ширина варианта.
+            fmt: Формат варианта.
+
+        Returns:
+            Путь варианта относительно папки кэша.
+
+        Raises:
+            FileNotFoundError: Если исходного файла нет в хранилище.
+        """
+        relpath = thumb_relpath(filename, width, fmt)
+        target_path = os.path.join(self.folder, relpath)
+
+        if os.path.exists(target_path):
+            return relpath
+
+        with self._lock:
+            future = self._inflight.get(relpath)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[relpath] = future
+
+        if not owner:
+            future.result(timeout=Config.THUMB_RENDER_TIMEOUT)
+            return relpath
+
+        try:
+            with get_storage().fetch(filename) as source_path:
+                size = (
+                    self._get_executor()
+                    .submit(render_thumbnail, source_path, target_path, width, fmt)
+                    .result(timeout=Config.THUMB_RENDER_TIMEOUT)
+                )
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(size)
+        finally:
+            with self._lock:
+                self._inflight.pop(relpath, None)
+
+        return relpath
+
+    def _scan(self):
+        """Обходит кэш и возвращает список (mtime, size, path) всех файлов."""
+        files = []
+        stack = [self.folder]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat()
+                            files.append((st.st_mtime, st.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+        return files
+
+    def sweep(self) -> int:
+        """
+        Удаляет самые старые варианты, если кэш больше лимита.
+
+        Кэш уменьшается до 90% Config.THUMBS_CACHE_MAX_BYTES, чтобы
+        следующий проход не начинался сразу же.
+
+        Returns:
+            Размер кэша после прохода в байтах.
+        """
+        files = self._scan()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return total
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                log_error("Ошибка удаления варианта %s: %s", path, e)
+                continue
+            total -= size
+            removed += 1
+        log_info("Кэш вариантов очищен: удалено %s файлов", removed)
+        return total
+
+
+thumbnail_cache = ThumbnailCache(Config.THUMBS_FOLDER, Config.THUMBS_CACHE_MAX_BYTES)
@@ -1,49 +1,149 @@
+import atexit
+import base64
+import binascii
+import hashlib
+import io
 import logging
+import logging.handlers
 import os
+import queue
+import tempfile
 import uuid
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
 
 from werkzeug.utils import secure_filename
 
 from config import Config
+from log_pipeline import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RequestContextFilter,
+    SharedRotatingFileHandler,
+    SharedTimedRotatingFileHandler,
+)
+from models import StoredFile
+from storage import delete_thumbnails, get_storage, optimized_filenames
+
+TEMP_FILE_PREFIX = ".upload-"
+
+
+class FileTooLargeError(ValueError):
+    """Загружаемый файл превышает допустимый размер."""
+
+
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_listener() -> None:
+    """Создаёт очередь записей и запускает поток записи в обработчики."""
+    global _listener
+    if _listener is None:
+        return
+    log_queue: queue.Queue = queue.Queue(Config.LOG_QUEUE_SIZE)
+    handlers = _listener.handlers
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
 
 
 def setup_logging():
-    """Настраивает базовую конфигурацию логирования для проекта."""
-    log_format = "[%(asctime)s] %(levelname)s: %(message)s"
-    date_format = "%Y-%m-%d %H:%M:%S"
-    log_file = os.path.join(Config.LOGS_DIR, "app.log")
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        datefmt=date_format,
-        handlers=[
-            logging.FileHandler(log_file, encoding="utf-8"),
-            logging.StreamHandler(),
-        ],
+    """
+    Настраивает неблокирующее логирование для проекта.
+
+    Корневой логгер только кладёт записи в очередь; отдельный поток
+    форматирует их и пишет в Config.LOGS_DIR/app.log (с поворотом по размеру
+    или по времени, см. LOG_ROTATE_WHEN) и в stderr. LOG_FORMAT=json включает
+    формат JSON Lines с ID запроса и временем с его начала. После fork поток
+    записи перезапускается в дочернем процессе автоматически.
+    """
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        return
+
+    if Config.LOG_FORMAT == "json":
+        formatter: logging.Formatter = JsonFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z")
+    else:
+        formatter = logging.Formatter(
+            "[%(asctime)s] %(levelname)s [%(request_id)s]: %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+
+    log_file = os.path.join(Config.LOGS_DIR, Config.LOG_FILE)
+    if Config.LOG_ROTATE_WHEN:
+        file_handler: logging.Handler = SharedTimedRotatingFileHandler(
+            log_file,
+            when=Config.LOG_ROTATE_WHEN,
+            backupCount=Config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    else:
+        file_handler = SharedRotatingFileHandler(
+            log_file,
+            maxBytes=Config.LOG_MAX_BYTES,
+            backupCount=Config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(Config.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(RequestContextFilter())
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue, file_handler, stream_handler, respect_handler_level=True
     )
+    _listener.start()
 
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(Config.LOG_LEVEL)
 
-def log_info(message: str):
-    """Логирует информационное сообщение."""
-    logging.info(message)
+    os.register_at_fork(after_in_child=_start_listener)
+    atexit.register(stop_logging)
 
 
-def log_error(message: str, exc_info: bool = False):
+def stop_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    """Возвращает число записей в очереди логов и отброшенных при её переполнении."""
+    if _queue_handler is None:
+        return {}
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+def log_info(message: str, *args):
+    """Логирует информационное сообщение (аргументы подставляются в шаблон через %)."""
+    logging.info(message, *args)
+
+
+def log_error(message: str, *args, exc_info: bool = False):
     """Логирует сообщение об ошибке, опционально с информацией об исключении."""
-    logging.error(message, exc_info=exc_info)
+    logging.error(message, *args, exc_info=exc_info)
 
 
-def log_success(message: str):
+def log_success(message: str, *args):
     """Логирует сообщение об успешном выполнении операции."""
-    logging.info(f"Успех: {message}")
+    logging.info("Успех: " + message, *args)
 
 
 def ensure_directories():
     """Проверяет наличие и при необходимости создает рабочие директории."""
     print(f"CWD: {os.getcwd()}")
     os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(Config.THUMBS_FOLDER, exist_ok=True)
     os.makedirs(Config.BACKUP_DIR, exist_ok=True)
     os.makedirs(Config.LOGS_DIR, exist_ok=True)
 
@@ -119,37 +219,170 @@ def generate_unique_filename(original_filename: str) -> str:
     return f"{unique_id}{ext}"
 
 
-def save_file(filename: str, file_content: bytes) -> Tuple[bool, str]:
+def encode_cursor(upload_time: datetime, image_id: int) -> str:
     """
-    Сохраняет содержимое файла на диск с уникальным именем.
+    Кодирует ключ keyset-пагинации в непрозрачную строку-курсор.
+
+    Args:
+        upload_time: Время загрузки последнего изображения на странице.
+        image_id: ID последнего изображения на странице.
+
+    Returns:
+        Курсор в формате URL-safe base64.
+    """
+    raw = f"{upload_time.isoformat()}|{image_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Декодирует курсор, полученный от encode_cursor.
+
+    Args:
+        cursor: Строка-курсор из параметра запроса.
+
+    Returns:
+        Кортеж (upload_time, image_id).
+
+    Raises:
+        ValueError: Если курсор повреждён или имеет неверный формат.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        time_part, id_part = raw.rsplit("|", 1)
+        return datetime.fromisoformat(time_part), int(id_part)
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(f"Неверный курсор: {e}") from e
+
+
+def content_addressed_filename(sha256: str, original_filename: str) -> str:
+    """
+    Формирует имя файла по хешу содержимого, сохраняя расширение.
+
+    Args:
+        sha256: SHA-256 содержимого в шестнадцатеричном виде.
+        original_filename: Оригинальное имя файла.
+
+    Returns:
+        Имя файла вида '<sha256><ext>'.
+    """
+    return f"{sha256}{get_file_extension(original_filename)}"
+
+
+def write_temp_file(
+    stream: BinaryIO, max_size: int = Config.MAX_CONTENT_LENGTH
+) -> Tuple[str, int, str]:
+    """
+    Потоково записывает данные во временный файл в директории загрузок.
+
+    Данные читаются блоками по Config.UPLOAD_CHUNK_SIZE, по пути считаются
+    размер и SHA-256. Временный файл создаётся в той же директории, что и
+    итоговый, чтобы его можно было атомарно переименовать.
+
+    Args:
+        stream: Поток с содержимым файла.
+        max_size: Максимально допустимый размер в байтах.
+
+    Returns:
+        Кортеж (путь_к_временному_файлу, размер, sha256).
+
+    Raises:
+        FileTooLargeError: Если размер превысил max_size (файл удаляется).
+        OSError: Если не удалось записать файл (файл удаляется).
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_FILE_PREFIX, dir=Config.UPLOAD_FOLDER)
+    size = 0
+    hasher = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = stream.read(Config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(
+                        f"Файл превышает {format_file_size(max_size)}"
+                    )
+                hasher.update(chunk)
+                f.write(chunk)
+        # mkstemp создаёт файл с правами 0600, а его должен читать Nginx
+        os.chmod(temp_path, 0o644)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, size, hasher.hexdigest()
+
+
+def save_file_stream(
+    filename: str, stream: BinaryIO
+) -> Tuple[bool, Union[StoredFile, str]]:
+    """
+    Потоково сохраняет файл в хранилище с уникальным именем.
+
+    Файл не загружается в память целиком: данные пишутся во временный файл,
+    после чего он помещается в хранилище (локально — атомарным
+    переименованием в итоговое имя).
 
     Args:
         filename: Оригинальное имя файла.
-        file_content: Содержимое файла в виде байтов.
+        stream: Поток с содержимым файла.
 
     Returns:
-        Кортеж (True, new_filename), если сохранение успешно.
+        Кортеж (True, StoredFile), если сохранение успешно.
         Кортеж (False, error_message), если произошла ошибка.
+
+    Raises:
+        FileTooLargeError: Если файл превышает Config.MAX_CONTENT_LENGTH.
     """
     try:
         original_name = secure_filename(filename)
         new_filename = generate_unique_filename(original_name)
-        file_path = os.path.join(Config.UPLOAD_FOLDER, new_filename)
-
-        with open(file_path, "wb") as f:
-            f.write(file_content)
 
-        log_success(f'Файл сохранён: {new_filename} (оригинал: "{original_name}")')
-        return True, new_filename
+        temp_path, size, sha256 = write_temp_file(stream)
+        try:
+            get_storage().place(temp_path, new_filename)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        log_success('Файл сохранён: %s (оригинал: "%s")', new_filename, original_name)
+        return True, StoredFile(filename=new_filename, size=size, sha256=sha256)
+    except FileTooLargeError:
+        raise
     except Exception as e:
         error_msg = f"Ошибка сохранения файла: {e}"
         log_error(error_msg)
         return False, error_msg
 
 
+def save_file(filename: str, file_content: bytes) -> Tuple[bool, str]:
+    """
+    Сохраняет содержимое файла на диск с уникальным именем.
+
+    Args:
+        filename: Оригинальное имя файла.
+        file_content: Содержимое файла в виде байтов.
+
+    Returns:
+        Кортеж (True, new_filename), если сохранение успешно.
+        Кортеж (False, error_message), если произошла ошибка.
+    """
+    try:
+        success, result = save_file_stream(filename, io.BytesIO(file_content))
+    except FileTooLargeError as e:
+        return False, str(e)
+    if not success:
+        return False, result
+    return True, result.filename
+
+
 def delete_file(filename: str) -> bool:
     """
-    Удаляет файл из директории загрузок.
+    Удаляет файл из хранилища вместе с его уменьшенными и оптимизированными
+    вариантами.
 
     Args:
         filename: Имя файла для удаления.
@@ -159,14 +392,55 @@ def delete_file(filename: str) -> bool:
     """
     try:
         safe_name = secure_filename(filename)
-        file_path = os.path.join(Config.UPLOAD_FOLDER, safe_name)
+        delete_thumbnails(safe_name)
+        storage = get_storage()
+        for variant in optimized_filenames(safe_name):
+            storage.delete(variant)
 
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            log_success(f"Файл удалён: {safe_name}")
+        if storage.delete(safe_name):
+            log_success("Файл удалён: %s", safe_name)
             return True
-        log_error(f"Файл для удаления не найден: {safe_name}")
+        log_error("Файл для удаления не найден: %s", safe_name)
         return False
     except Exception as e:
-        log_error(f"Ошибка удаления файла: {safe_name}: {e}")
+        log_error("Ошибка удаления файла: %s: %s", filename, e)
         return False
+
+
+def delete_files(filenames: List[str]) -> List[str]:
+    """
+    Удаляет несколько файлов из хранилища вместе с уменьшенными
+    и оптимизированными вариантами.
+
+    Локальные файлы удаляются параллельно в пуле потоков, объекты S3 —
+    пачками запросов DeleteObjects.
+
+    Args:
+        filenames: Имена файлов для удаления.
+
+    Returns:
+        Имена файлов, которые не удалось удалить или которых не было в хранилище.
+    """
+    if not filenames:
+        return []
+    safe_names = [secure_filename(filename) for filename in filenames]
+    with ThreadPoolExecutor(
+        max_workers=min(Config.FILE_DELETE_WORKERS, len(safe_names))
+    ) as executor:
+        list(executor.map(delete_thumbnails, safe_names))
+
+    # Вариантов может не быть: их отсутствие не считается ошибкой
+    variants = [variant for name in safe_names for variant in optimized_filenames(name)]
+    try:
+        storage = get_storage()
+        storage.delete_many(variants)
+        failed = set(storage.delete_many(safe_names))
+    except Exception as e:
+        log_error("Ошибка удаления файлов: %s", e)
+        return list(filenames)
+    log_success("Удалено файлов: %s", len(safe_names) - len(failed))
+    return [
+        filename
+        for filename, safe_name in zip(filenames, safe_names)
+        if safe_name in failed
+    ]
@@ -0,0 +1,154 @@
+import argparse
+import multiprocessing
+import signal
+import time
+from typing import Dict
+
+from config import Config
+from database import Database
+from jobs import JOB_HANDLERS
+from thumbnails import thumbnail_cache
+from utils import (
+    ensure_directories,
+    log_error,
+    log_info,
+    setup_logging,
+    stop_logging,
+)
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    """Обработчик SIGTERM/SIGINT: дать текущей задаче завершиться и выйти."""
+    global _stopping
+    _stopping = True
+
+
+def run_worker(worker_id: int) -> None:
+    """
+    Основной цикл процесса-воркера.
+
+    Забирает задачи из очереди, выполняет обработчик из JOB_HANDLERS и
+    фиксирует результат. Пустую очередь опрашивает раз в
+    Config.JOB_POLL_INTERVAL секунд.
+
+    Args:
+        worker_id: Порядковый номер воркера (для логов).
+    """
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    setup_logging()
+    Database.init_pool(1, 2)
+    log_info("Воркер %s запущен", worker_id)
+
+    while not _stopping:
+        job = Database.claim_job()
+        if not job:
+            time.sleep(Config.JOB_POLL_INTERVAL)
+            continue
+
+        handler = JOB_HANDLERS.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"Неизвестный тип задачи: {job['kind']}")
+            handler(job["filename"])
+        except Exception as e:
+            log_error(
+                "Задача %s (%s) завершилась ошибкой: %s",
+                job["id"],
+                job["kind"],
+                e,
+                exc_info=True,
+            )
+            Database.finish_job(job, error=str(e))
+            continue
+        Database.finish_job(job)
+
+    log_info("Воркер %s остановлен", worker_id)
+    # Дочерний процесс завершается через os._exit, минуя atexit
+    stop_logging()
+
+
+def run_sweeper() -> None:
+    """
+    Раз в Config.THUMBS_SWEEP_INTERVAL секунд ограничивает размер кэша
+    вариантов (ThumbnailCache.sweep).
+
+    Кэш общий для всех воркеров gunicorn и задач, поэтому его обходит
+    один отдельный процесс, а не запросы.
+    """
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    setup_logging()
+    while not _stopping:
+        try:
+            thumbnail_cache.sweep()
+        except Exception as e:
+            log_error("Ошибка очистки кэша вариантов: %s", e, exc_info=True)
+        deadline = time.monotonic() + Config.THUMBS_SWEEP_INTERVAL
+        while not _stopping and time.monotonic() < deadline:
+            time.sleep(1)
+    stop_logging()
+
+
+def main(processes: int) -> None:
+    """
+    Запускает processes воркеров и процесс очистки кэша вариантов
+    и перезапускает неожиданно завершившиеся.
+
+    Args:
+        processes: Количество процессов-воркеров.
+    """
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    workers: Dict[str, multiprocessing.Process] = {}
+    targets = {
+        str(worker_id): (run_worker, (worker_id,)) for worker_id in range(processes)
+    }
+    targets["sweeper"] = (run_sweeper, ())
+    while not _stopping:
+        for name, (target, args) in targets.items():
+            proc = workers.get(name)
+            if proc is None or not proc.is_alive():
+                if proc is not None:
+                    log_error(
+                        "Воркер %s завершился с кодом %s, перезапуск",
+                        name,
+                        proc.exitcode,
+                    )
+                proc = multiprocessing.Process(target=target, args=args)
+                proc.start()
+                workers[name] = proc
+        time.sleep(1)
+
+    for proc in workers.values():
+        proc.terminate()
+    for proc in workers.values():
+        proc.join()
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    parser = argparse.ArgumentParser(
+        description="Воркеры фоновой обработки загруженных изображений."
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=Config.JOB_WORKERS,
+        help="Количество процессов-воркеров.",
+    )
+    args = parser.parse_args()
+
+    print("Инициализация рабочих директорий...")
+    ensure_directories()
+    print("Инициализация схемы БД...")
+    Database.init_pool(1, 2)
+    Database.init_db()
+    Database.close_pool()
+
+    print(f"Запуск воркеров: {args.processes}")
+    main(args.processes)
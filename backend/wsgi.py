@@ -0,0 +1,10 @@
+"""
+Точка входа WSGI для production-сервера (см. gunicorn.conf.py).
+
+Приложение создаётся при импорте модуля, то есть в каждом воркере отдельно.
+Схему БД к этому моменту уже обновил мастер gunicorn (on_starting).
+"""
+
+from app import create_app
+
+app = create_app(init_schema=False)
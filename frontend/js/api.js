@@ -27,6 +27,25 @@ const API = {
     return data.image;
   },
 
+  /**
+   * Загружает несколько файлов одним запросом.
+   * @param {File[]} files - Файлы изображений для загрузки.
+   * @returns {Promise<object>} Ответ API с результатом по каждому файлу.
+   * @throws {Error} Если запрос не удался целиком.
+   */
+  async uploadBatch(files) {
+    const fd = new FormData();
+    files.forEach(file => fd.append('file', file));
+
+    const res = await fetch('/api/upload/batch', { method: 'POST', body: fd });
+    const data = await res.json().catch(() => ({}));
+
+    if (!res.ok) {
+      throw new Error(data.error || 'Не удалось загрузить файлы');
+    }
+    return data;
+  },
+
   /**
    * Получает постраничный список изображений.
    * @param {number} [page=1] - Номер запрашиваемой страницы.
@@ -29,6 +29,7 @@ function openImageInNewTab(url) {
  * @property {string} image.url - URL изображения.
  * @property {string} image.filename - Уникальное имя файла на сервере.
  * @property {string} image.original_name - Оригинальное имя файла.
+ * @property {string} [image.thumbnail_url] - URL уменьшенного варианта для превью.
  * @returns {HTMLElement} Готовый DOM-элемент.
  */
 function createImageItem(image) {
@@ -38,10 +39,14 @@ function createImageItem(image) {
 
   const shortUrl = (image.url || '').length > 60 ? (image.url.substring(0, 60) + '...') : image.url;
   const icon = getFileIcon(image.filename || image.original_name);
+  // Превью берём из уменьшенного варианта, а не из оригинала (до 5 MB)
+  const preview = image.thumbnail_url
+    ? `<img class='image-thumb' src="${image.thumbnail_url}" alt="" loading="lazy">`
+    : icon;
 
   item.innerHTML = `
     <div class='image-name'>
-      <div class='image-icon'>${icon}</div>
+      <div class='image-icon'>${preview}</div>
       <span title="${image.original_name || image.filename}">${image.original_name || image.filename}</span>
     </div>
     <div class="image-url-wrapper">